@@ -0,0 +1,914 @@
+# -*- Mode: Python; tab-width: 2; indent-tabs-mode:nil; -*-
+# vim: set ts=2 et sw=2 tw=80:
+#
+# Copyright (c) 2013 The MathJax Consortium
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Measure which files of the split fonts the documents of a corpus load.
+#
+#   python analyzeCorpus.py STIX-Web corpus/ --histogram usage.json
+#
+# The TeX (.tex, .ltx), MathML (.mml, .xml) and HTML (.htm, .html, .xhtml)
+# documents of the corpus directory, possibly gzipped, are read in chunks of
+# --chunkSize bytes by --jobs processes, so that the memory used does not
+# depend on the size of the corpus or of its documents. The characters of
+# their math are extracted:
+#
+# - TeX between $...$, $$...$$, \(...\), \[...\] and the math environments
+#   (only $$...$$, \(...\), \[...\] and the environments in HTML, as MathJax
+#   does, unless --dollars is set), using the macros of
+#   MML-entities/MJ-TeX-Unicode.txt.
+# - MathML in <math> elements, using the entities of
+#   MML-entities/htmlmathml-f.txt.
+# - The math/tex and math/mml scripts of HTML documents.
+#
+# Each character is looked up as MathJax does it with the generated
+# FontFamily/HTML-CSS/fontdata.js (built by "make FontFamily/HTML-CSS/
+# fontdata.js"): it is remapped by the offsets of its mathvariant (the
+# letters of TeX are italic, the large operators of operator-dictionary/
+# ops-unicode.txt use -largeOp in display math and -smallOp otherwise), then
+# fontSplittingIndex gives its subset and the variant the weight of the font.
+# The delimiters that TeX sizes (\left, \big...) or that MathML stretches
+# (stretchy="true", accents of munder and mover) load all the fonts of their
+# DELIMITERS entry, and fontdata-extra.js for the EXTRAH and EXTRAV ones.
+#
+# The report gives the share of the documents that load each file, the
+# average number of files per page, the characters found in the NonUnicode
+# fonts, in the fonts loaded by fewer than --rare percent of the documents,
+# or in no font of the family. --histogram writes the number of documents
+# using each code point in the format read by planSplitting.py.
+
+from __future__ import print_function
+
+import sys, os, re, json, gzip, codecs
+import argparse
+import multiprocessing
+from itertools import islice
+from fontSplitting import fontSplittingIndex, familyConfig
+
+# Kind of the documents, indexed by the extension of their file name
+EXTENSIONS = {".tex": "tex", ".ltx": "tex", ".mml": "mml", ".xml": "mml",
+              ".htm": "html", ".html": "html", ".xhtml": "html"}
+
+# Label of fontdata-extra.js in the report
+EXTRAFILE = "fontdata-extra.js"
+
+# Characters kept at the end of the buffer of a documentScanner. The patterns
+# below are bounded so that a match starting before them is complete.
+MAXTOKEN = 1024
+
+TEXDISPLAYENVIRONMENTS = ["equation", "align", "gather", "multline",
+                          "eqnarray", "flalign", "alignat", "displaymath"]
+TEXENVIRONMENTS = "|".join(TEXDISPLAYENVIRONMENTS + ["math"])
+TEXOPEN = r'\\\\|\\\$|\$\$|\\\(|\\\[|\\begin\{(?:%s)\*?\}' % TEXENVIRONMENTS
+MATHOPEN = r'<(?:[A-Za-z]+:)?math\b[^>]{0,1000}>'
+SKIPOPEN = r'<(?P<skip>script|style|pre|code|textarea|noscript)\b[^>]{0,1000}>'
+
+ENTITY = r'&(?:#[xX][0-9A-Fa-f]{1,8}|#[0-9]{1,8}|[A-Za-z][A-Za-z0-9]{0,31});'
+CHARACTER = u'[\ud800-\udbff][\udc00-\udfff]|.'
+TEXTOKEN = re.compile(u'\\\\[A-Za-z]{1,64}\\*?|\\\\.|%%[^\\n]{0,1000}|%s' %
+                      CHARACTER, re.S)
+HTMLTEXTOKEN = re.compile(u'\\\\[A-Za-z]{1,64}\\*?|\\\\.|%%[^\\n]{0,1000}|%s|'
+                          u'<[^>]{0,1000}>|%s' % (ENTITY, CHARACTER), re.S)
+MATHMLTOKEN = re.compile(u'<!--.{0,1000}?-->|'
+                         u'<(/?)([A-Za-z][-A-Za-z0-9:.]{0,63})([^>]{0,1000})>|'
+                         u'%s|%s' % (ENTITY, CHARACTER), re.S)
+TEXTPATTERN = re.compile(u'%s|%s' % (ENTITY, CHARACTER), re.S)
+
+# Characters of TeX escaped by a backslash
+TEXESCAPES = {"{": 0x7B, "}": 0x7D, "|": 0x2225, "#": 0x23, "$": 0x24,
+              "%": 0x25, "&": 0x26, "_": 0x5F}
+
+# Macros that make the next delimiter stretchy
+TEXSTRETCHY = ["left", "right", "middle",
+               "big", "Big", "bigg", "Bigg",
+               "bigl", "Bigl", "biggl", "Biggl",
+               "bigr", "Bigr", "biggr", "Biggr",
+               "bigm", "Bigm", "biggm", "Biggm"]
+
+# Macros drawing a stretchy character
+TEXSTRETCHYCHARACTERS = {
+    "sqrt": 0x221A, "overbrace": 0x23DE, "underbrace": 0x23DF,
+    "widehat": 0x2C6, "widetilde": 0x2DC, "overline": 0xAF,
+    "underline": 0x5F, "overrightarrow": 0x2192, "overleftarrow": 0x2190,
+    "overleftrightarrow": 0x2194, "underrightarrow": 0x2192,
+    "underleftarrow": 0x2190, "xrightarrow": 0x2192, "xleftarrow": 0x2190
+}
+
+# Macros setting the mathvariant of their argument, or of the rest of the
+# group for TEXSWITCHES
+TEXVARIANTS = {
+    "mathbb": "double-struck", "mathfrak": "fraktur", "mathscr": "script",
+    "mathcal": "-tex-caligraphic", "mathsf": "sans-serif",
+    "mathtt": "monospace", "mathrm": "normal", "mathit": "-tex-mathit",
+    "mathbf": "bold", "boldsymbol": "bold-italic", "bm": "bold-italic",
+    "text": "normal", "textrm": "normal", "mbox": "normal", "hbox": "normal",
+    "operatorname": "normal", "textbf": "bold", "textit": "italic",
+    "texttt": "monospace", "textsf": "sans-serif",
+    "rm": "normal", "bf": "bold", "it": "-tex-mathit",
+    "cal": "-tex-caligraphic", "sf": "sans-serif", "tt": "monospace"
+}
+TEXSWITCHES = ["rm", "bf", "it", "cal", "sf", "tt"]
+
+# Macros whose argument is not math
+TEXSKIPARGUMENT = ["begin", "end", "label", "ref", "eqref", "tag", "color",
+                   "hspace", "vspace", "href", "cssId", "class", "style"]
+
+# Macros of the functions written in upright letters
+TEXFUNCTIONS = ["arccos", "arcsin", "arctan", "arg", "cos", "cosh", "cot",
+                "coth", "csc", "deg", "det", "dim", "exp", "gcd", "hom", "inf",
+                "ker", "lg", "lim", "liminf", "limsup", "ln", "log", "max",
+                "min", "Pr", "sec", "sin", "sinh", "sup", "tan", "tanh"]
+
+MATHMLTOKENS = ["mi", "mo", "mn", "mtext", "ms"]
+
+def isItalicLetter(aCodePoint):
+    # Characters of TeX that are italic by default: Latin letters and lower
+    # case Greek letters
+    return ((0x41 <= aCodePoint and aCodePoint <= 0x5A) or
+            (0x61 <= aCodePoint and aCodePoint <= 0x7A) or
+            (0x3B1 <= aCodePoint and aCodePoint <= 0x3C9) or
+            aCodePoint in [0x3D1, 0x3D5, 0x3D6, 0x3F0, 0x3F1, 0x3F5])
+
+def isSpace(aCodePoint):
+    return aCodePoint in [0x09, 0x0A, 0x0D, 0x20, 0xA0]
+
+def getCodePoint(aCharacter):
+    # Code point of a character, possibly a surrogate pair (narrow builds of
+    # Python 2)
+    if len(aCharacter) == 2:
+        return (0x10000 + ((ord(aCharacter[0]) - 0xD800) << 10) +
+                ord(aCharacter[1]) - 0xDC00)
+    return ord(aCharacter)
+
+def getAttribute(aAttributes, aName, aDefault = None):
+    match = re.search(r'\b%s\s*=\s*(?:"([^"]*)"|\'([^\']*)\')' % aName,
+                      aAttributes)
+    if match is None:
+        return aDefault
+    if match.group(1) is not None:
+        return match.group(1)
+    return match.group(2)
+
+def readFile(aFileName):
+    f = codecs.open(aFileName, "r", "utf-8")
+    data = f.read()
+    f.close()
+    return data
+
+def getBlock(aData, aStart):
+    # Return the text between the brace ending aStart and the matching one.
+    start = aData.find(aStart)
+    if start < 0:
+        return ""
+    start += len(aStart)
+    depth = 1
+    i = start
+    while i < len(aData) and depth > 0:
+        if aData[i] == "{":
+            depth += 1
+        elif aData[i] == "}":
+            depth -= 1
+        i += 1
+    return aData[start:i - 1]
+
+class characterTables:
+    # The TeX macros, MathML entities and large operators used to extract the
+    # characters of the documents
+    def __init__(self, aEntities, aOperators):
+        # \alpha U003B1
+        self.mTeXMacros = {}
+        for line in open("%s/MJ-TeX-Unicode.txt" % aEntities):
+            fields = line.split()
+            if len(fields) == 2 and fields[0].startswith("\\"):
+                self.mTeXMacros[fields[0][1:]] = int(fields[1][1:], 16)
+
+        # <!ENTITY alpha "&#x003B1;" >, with the errors fixed as makeEntities
+        # does
+        self.mEntities = {"amp": [0x26], "lt": [0x3C], "gt": [0x3E],
+                          "quot": [0x22], "apos": [0x27]}
+        for line in open("%s/htmlmathml-f.txt" % aEntities):
+            line = line.replace("&#38;#38;", "&#x00026;")
+            line = line.replace("&#38;#60;", "&#x0003C;")
+            match = re.match(r'<!ENTITY\s+(\S+)\s+"\s*((?:&#x[0-9A-Fa-f]+;)+)"',
+                             line)
+            if match is not None:
+                self.mEntities[match.group(1)] = \
+                    [int(c, 16) for c in re.findall(r'&#x([0-9A-Fa-f]+);',
+                                                    match.group(2))]
+
+        # The operators of the prefix form of the operator dictionary that
+        # are large operators
+        self.mLargeOperators = set()
+        form = None
+        for line in open("%s/ops-unicode.txt" % aOperators):
+            match = re.match(r'\s*(prefix|postfix|infix): \{', line)
+            if match is not None:
+                form = match.group(1)
+                continue
+            match = re.match(r"\s*'\\u([0-9A-Fa-f]{4})': (OP|INTEGRAL2?),",
+                             line)
+            if form == "prefix" and match is not None:
+                self.mLargeOperators.add(int(match.group(1), 16))
+
+    def decodeEntity(self, aEntity):
+        # Return the code points of &name;, &#xNNNN; or &#NNNN;
+        name = aEntity[1:-1]
+        if name[0] == "#":
+            try:
+                if name[1] in "xX":
+                    return [int(name[2:], 16)]
+                return [int(name[1:])]
+            except ValueError:
+                return []
+        return self.mEntities.get(name, [])
+
+    def getCodePoints(self, aText):
+        rv = []
+        for match in TEXTPATTERN.finditer(aText):
+            token = match.group(0)
+            if len(token) > 2 and token[0] == "&":
+                rv += self.decodeEntity(token)
+            else:
+                rv.append(getCodePoint(token))
+        return rv
+
+class documentScanner:
+    # Extract the characters of the math of a document, given in chunks of
+    # text, as a set of (code point, mathvariant, stretchy).
+    def __init__(self, aKind, aTables, aDollars):
+        self.mKind = aKind
+        self.mTables = aTables
+        if aKind == "tex":
+            self.mTextPattern = re.compile(r'\\%|%[^\n]{0,1000}|' + TEXOPEN +
+                                           r'|\$')
+        elif aKind == "html":
+            self.mTextPattern = re.compile(r'<!--|%s|%s|%s%s' %
+                                           (MATHOPEN, SKIPOPEN, TEXOPEN,
+                                            r'|\$' if aDollars else ""), re.I)
+        else:
+            self.mTextPattern = re.compile(r'<!--|%s' % MATHOPEN, re.I)
+        self.mTeXPattern = HTMLTEXTOKEN if aKind == "html" else TEXTOKEN
+
+        self.mBuffer = u""
+        self.mMode = None # None (text), "tex", "mml" or "skip"
+        self.mEnd = None # end delimiter of the math, or None for </math>
+        self.mDisplay = False
+        self.mSkipPattern = None # end of the skipped text
+        self.mSkipNext = None # mode after the skipped text
+        self.mCharacters = set()
+
+    def feed(self, aText, aFinal = False):
+        # Scan the text added to the buffer. Unless aFinal, the last MAXTOKEN
+        # characters are kept for the next call, so that the delimiters and
+        # tokens cut by the chunk boundaries are not missed.
+        self.mBuffer += aText
+        limit = len(self.mBuffer)
+        if not aFinal:
+            limit -= MAXTOKEN
+        position = 0
+        while position < limit:
+            if self.mMode is None:
+                position = self.scanText(position, limit)
+            elif self.mMode == "skip":
+                position = self.scanSkip(position, limit)
+            elif self.mMode == "tex":
+                position = self.scanTeX(position, limit)
+            else:
+                position = self.scanMathML(position, limit)
+        self.mBuffer = self.mBuffer[position:]
+
+    def addCharacter(self, aCodePoint, aVariant, aStretchy):
+        if aVariant is None and aCodePoint in self.mTables.mLargeOperators:
+            aVariant = "-largeOp" if self.mDisplay else "-smallOp"
+        self.mCharacters.add((aCodePoint, aVariant or "normal", aStretchy))
+
+    def startSkip(self, aEnd, aNext):
+        self.mMode = "skip"
+        self.mSkipPattern = re.compile(re.escape(aEnd), re.I)
+        self.mSkipNext = aNext
+
+    def scanSkip(self, aPosition, aLimit):
+        match = self.mSkipPattern.search(self.mBuffer, aPosition)
+        if match is None or match.start() >= aLimit:
+            return aLimit
+        self.mMode = self.mSkipNext
+        return match.end()
+
+    def scanText(self, aPosition, aLimit):
+        match = self.mTextPattern.search(self.mBuffer, aPosition)
+        if match is None or match.start() >= aLimit:
+            return aLimit
+        token = match.group(0)
+        if token == "<!--":
+            self.startSkip("-->", None)
+        elif token[0] == "<":
+            skip = match.groupdict().get("skip")
+            if skip is None:
+                self.startMathML(getAttribute(token, "display") == "block",
+                                 None)
+            elif skip.lower() != "script":
+                self.startSkip("</%s>" % skip, None)
+            else:
+                scriptType = getAttribute(token, "type", "")
+                if scriptType.startswith("math/tex"):
+                    self.startTeX("</script>", "mode=display" in scriptType)
+                elif scriptType.startswith("math/mml"):
+                    self.startMathML(False, "</script>")
+                else:
+                    self.startSkip("</script>", None)
+        elif token == "$$":
+            self.startTeX("$$", True)
+        elif token == "$":
+            self.startTeX("$", False)
+        elif token == "\\(":
+            self.startTeX("\\)", False)
+        elif token == "\\[":
+            self.startTeX("\\]", True)
+        elif token.startswith("\\begin"):
+            environment = token[7:-1]
+            self.startTeX("\\end{%s}" % environment,
+                          environment.rstrip("*") != "math")
+        # Otherwise a comment, \\ or \$
+        return match.end()
+
+    def startTeX(self, aEnd, aDisplay):
+        self.mMode = "tex"
+        self.mEnd = aEnd
+        self.mDisplay = aDisplay
+        self.mDepth = 0
+        self.mVariants = [] # (depth, variant) of the groups
+        self.mPendingVariant = None
+        self.mPendingSkip = False
+        self.mSkipDepth = None
+        self.mStretchy = False
+
+    def scanTeX(self, aPosition, aLimit):
+        while aPosition < aLimit:
+            if self.mBuffer.startswith(self.mEnd, aPosition):
+                self.mMode = None
+                return aPosition + len(self.mEnd)
+            match = self.mTeXPattern.match(self.mBuffer, aPosition)
+            aPosition = match.end()
+            self.handleTeXToken(match.group(0))
+        return aPosition
+
+    def handleTeXToken(self, aToken):
+        if aToken[0] == "\\" and len(aToken) > 1:
+            if aToken[1].isalpha():
+                self.handleTeXMacro(aToken[1:].rstrip("*"))
+            elif aToken[1] in TEXESCAPES:
+                self.addTeXCharacter(TEXESCAPES[aToken[1]])
+        elif aToken == "{":
+            self.mDepth += 1
+            if self.mPendingVariant is not None:
+                self.mVariants.append((self.mDepth, self.mPendingVariant))
+                self.mPendingVariant = None
+            if self.mPendingSkip:
+                self.mSkipDepth = self.mDepth
+                self.mPendingSkip = False
+        elif aToken == "}":
+            while (len(self.mVariants) > 0 and
+                   self.mVariants[-1][0] >= self.mDepth):
+                self.mVariants.pop()
+            if self.mSkipDepth == self.mDepth:
+                self.mSkipDepth = None
+            self.mDepth = max(0, self.mDepth - 1)
+        elif len(aToken) > 2 and aToken[0] == "&":
+            for codePoint in self.mTables.decodeEntity(aToken):
+                self.addTeXCharacter(codePoint)
+        elif aToken[0] == "%" or (len(aToken) > 2 and aToken[0] == "<"):
+            # Comment or HTML tag
+            pass
+        else:
+            self.addTeXCharacter(getCodePoint(aToken))
+
+    def handleTeXMacro(self, aName):
+        if self.mSkipDepth is not None:
+            return
+        if aName in TEXSTRETCHY:
+            self.mStretchy = True
+        elif aName in TEXSKIPARGUMENT:
+            self.mPendingSkip = True
+        elif aName in TEXSWITCHES:
+            self.mVariants.append((self.mDepth, TEXVARIANTS[aName]))
+        elif aName in TEXVARIANTS:
+            self.mPendingVariant = TEXVARIANTS[aName]
+        elif aName in TEXSTRETCHYCHARACTERS:
+            self.addCharacter(TEXSTRETCHYCHARACTERS[aName], "normal", True)
+        elif aName in TEXFUNCTIONS:
+            for c in aName:
+                self.addCharacter(ord(c), "normal", False)
+        elif aName in self.mTables.mTeXMacros:
+            self.addTeXCharacter(self.mTables.mTeXMacros[aName])
+
+    def addTeXCharacter(self, aCodePoint):
+        if self.mSkipDepth is not None:
+            return
+        if self.mPendingSkip:
+            # Argument without braces
+            self.mPendingSkip = False
+            return
+        if isSpace(aCodePoint) or aCodePoint in [0x26, 0x5E, 0x5F, 0x7E]:
+            # Alignment, superscript, subscript and nonbreaking space
+            return
+        if aCodePoint == 0x27:
+            aCodePoint = 0x2032
+        stretchy = self.mStretchy
+        self.mStretchy = False
+        if stretchy and aCodePoint == 0x2E:
+            # \left. or \right.
+            return
+        variant = self.mPendingVariant
+        self.mPendingVariant = None
+        if variant is None and len(self.mVariants) > 0:
+            variant = self.mVariants[-1][1]
+        if variant is None and isItalicLetter(aCodePoint):
+            variant = "italic"
+        self.addCharacter(aCodePoint, variant, stretchy)
+
+    def startMathML(self, aDisplay, aEnd):
+        self.mMode = "mml"
+        self.mEnd = aEnd
+        self.mDisplay = aDisplay
+        self.mElements = []
+        self.mToken = None # (name, attributes, parent) of the token element
+        self.mTokenText = []
+
+    def scanMathML(self, aPosition, aLimit):
+        while aPosition < aLimit and self.mMode == "mml":
+            if (self.mEnd is not None and
+                self.mBuffer.startswith(self.mEnd, aPosition)):
+                self.mMode = None
+                return aPosition + len(self.mEnd)
+            match = MATHMLTOKEN.match(self.mBuffer, aPosition)
+            aPosition = match.end()
+            self.handleMathMLToken(match)
+        return aPosition
+
+    def handleMathMLToken(self, aMatch):
+        token = aMatch.group(0)
+        if aMatch.group(2) is not None:
+            name = aMatch.group(2).split(":")[-1].lower()
+            if aMatch.group(1) == "/":
+                self.endMathMLElement(name)
+            else:
+                attributes = aMatch.group(3)
+                self.startMathMLElement(name, attributes,
+                                        attributes.endswith("/"))
+        elif token.startswith("<!--"):
+            pass
+        elif self.mToken is not None and len(self.mTokenText) < 1000:
+            if len(token) > 2 and token[0] == "&":
+                self.mTokenText += self.mTables.decodeEntity(token)
+            else:
+                self.mTokenText.append(getCodePoint(token))
+
+    def startMathMLElement(self, aName, aAttributes, aEmpty):
+        parent = None
+        if len(self.mElements) > 0:
+            parent = self.mElements[-1]
+        if aName in MATHMLTOKENS:
+            self.mToken = (aName, aAttributes, parent)
+            self.mTokenText = []
+        elif aName in ["msqrt", "mroot"]:
+            self.addCharacter(0x221A, "normal", True)
+        elif aName == "mfenced":
+            for attribute, default in [("open", "("), ("close", ")")]:
+                value = getAttribute(aAttributes, attribute, default)
+                for codePoint in self.mTables.getCodePoints(value):
+                    self.addCharacter(codePoint, "normal", True)
+        elif aName in ["annotation", "annotation-xml"] and not aEmpty:
+            self.startSkip("</%s>" % aName, "mml")
+            return
+        if aEmpty:
+            if aName in MATHMLTOKENS:
+                self.mToken = None
+        elif len(self.mElements) < 1000:
+            self.mElements.append(aName)
+
+    def endMathMLElement(self, aName):
+        if self.mToken is not None and self.mToken[0] == aName:
+            self.addMathMLToken()
+        if aName in self.mElements:
+            while self.mElements.pop() != aName:
+                pass
+        if aName == "math" and self.mEnd is None:
+            self.mMode = None
+
+    def addMathMLToken(self):
+        name, attributes, parent = self.mToken
+        self.mToken = None
+        codePoints = [c for c in self.mTokenText if not isSpace(c)]
+        variant = getAttribute(attributes, "mathvariant")
+        stretchy = False
+        if name == "mi":
+            if variant is None and len(codePoints) != 1:
+                variant = "normal"
+            elif variant is None:
+                variant = "italic"
+        elif name == "mo":
+            value = getAttribute(attributes, "stretchy")
+            stretchy = (value == "true" or
+                        (value is None and
+                         parent in ["munder", "mover", "munderover"]))
+            if getAttribute(attributes, "largeop") == "false":
+                variant = variant or "normal"
+        for codePoint in codePoints:
+            self.addCharacter(codePoint, variant, stretchy)
+
+class splitLayout:
+    # The files of the split fonts of a font family, as described by its
+    # generated fontdata.js and fontdata-extra.js.
+    def __init__(self, aFamily, aMode):
+        config = familyConfig(aFamily)
+        self.mIndex = fontSplittingIndex(config.FONTSPLITTING_EXTRA)
+
+        fileName = "%s/%s/fontdata.js" % (aFamily, aMode)
+        if not os.path.exists(fileName):
+            raise BaseException("%s does not exist. Run make %s first." %
+                                (fileName, fileName))
+        data = readFile(fileName)
+
+        # Variables of the font names, e.g. ARROWS = "STIXMathJax_Arrows"
+        self.mFonts = dict(re.findall(r'\b([A-Z][A-Z0-9]*) = "([^"]*_[^"]*)"',
+                                      data))
+
+        # mathvariant -> {"fonts", "offsets", "remap", "style"}
+        self.mVariants = {}
+        variants = getBlock(data, "VARIANT: {")
+        for match in re.finditer(r'"([-A-Za-z]+)":\s*\{', variants):
+            body = getBlock(variants[match.end() - 1:], "{")
+            fonts = re.search(r'fonts:\s*\[([^\]]*)\]', body)
+            offsets = re.findall(r'offset([A-Z]):\s*(0x[0-9A-Fa-f]+)', body)
+            remap = re.search(r'remap:\s*\{([^}]*)\}', body)
+            style = ""
+            if re.search(r'bold:\s*true', body):
+                style += "BOLD"
+            if re.search(r'italic:\s*true', body):
+                style += "ITALIC"
+            self.mVariants[match.group(1)] = {
+                "fonts": [f.strip() for f in fonts.group(1).split(",")]
+                          if fonts is not None else None,
+                "offsets": dict([(k, int(v, 16)) for k, v in offsets]),
+                "remap": dict([(int(k, 16), int(v, 16)) for k, v in
+                               re.findall(r'(0x[0-9A-Fa-f]+):\s*'
+                                          r'(0x[0-9A-Fa-f]+)',
+                                          remap.group(1))])
+                         if remap is not None else {},
+                "style": style
+            }
+        if "normal" not in self.mVariants:
+            raise BaseException("No normal variant in %s" % fileName)
+
+        self.mDelimiters = self.parseDelimiters(getBlock(data,
+                                                         "DELIMITERS: {"))
+        self.mDelimitersExtra = {}
+        fileName = "%s/%s/fontdata-extra.js" % (aFamily, aMode)
+        if os.path.exists(fileName):
+            self.mDelimitersExtra = \
+                self.parseDelimiters(getBlock(readFile(fileName),
+                                              "var delim = {"))
+        self.mCache = {}
+
+    def parseDelimiters(self, aText):
+        # Return the entries of a DELIMITERS table: code point -> "extra",
+        # ("alias", code point) or the set of the font variables used.
+        delimiters = {}
+        starts = list(re.finditer(r'(?m)^\s*0x([0-9A-Fa-f]+):', aText))
+        for i in range(0, len(starts)):
+            end = len(aText)
+            if i + 1 < len(starts):
+                end = starts[i + 1].start()
+            body = aText[starts[i].end():end]
+            codePoint = int(starts[i].group(1), 16)
+            alias = re.search(r'alias:\s*0x([0-9A-Fa-f]+)', body)
+            if re.match(r'\s*EXTRA[HV]', body):
+                delimiters[codePoint] = "extra"
+            elif alias is not None:
+                delimiters[codePoint] = ("alias", int(alias.group(1), 16))
+            else:
+                fonts = set()
+                for item in re.findall(r'\[([^\[\]]*)\]', body):
+                    for name in item.split(","):
+                        if name.strip() in self.mFonts:
+                            fonts.add(name.strip())
+                delimiters[codePoint] = fonts
+        return delimiters
+
+    def getDelimiterFonts(self, aCodePoint):
+        # Return the font variables and files of a stretched delimiter, or
+        # None if it is not in DELIMITERS.
+        delimiters = self.mDelimiters
+        files = set()
+        for i in range(0, 10):
+            entry = delimiters.get(aCodePoint)
+            if entry is None:
+                # fontdata-extra.js may still be loaded.
+                return files if len(files) > 0 else None
+            if entry == "extra":
+                files.add(EXTRAFILE)
+                delimiters = self.mDelimitersExtra
+            elif type(entry) == tuple:
+                aCodePoint = entry[1]
+            else:
+                return files | set([self.mFonts[f] for f in entry])
+        return None
+
+    def remap(self, aCodePoint, aVariant):
+        offsets = aVariant["offsets"]
+        c = aCodePoint
+        if "A" in offsets and 0x41 <= c and c <= 0x5A:
+            c = offsets["A"] + c - 0x41
+        elif "A" in offsets and 0x61 <= c and c <= 0x7A:
+            c = offsets["A"] + 26 + c - 0x61
+        elif "N" in offsets and 0x30 <= c and c <= 0x39:
+            c = offsets["N"] + c - 0x30
+        elif "G" in offsets and 0x391 <= c and c <= 0x3A9:
+            c = offsets["G"] + c - 0x391
+        elif "G" in offsets and 0x3B1 <= c and c <= 0x3C9:
+            c = offsets["G"] + 26 + c - 0x3B1
+        return aVariant["remap"].get(c, c)
+
+    def getFonts(self, aCodePoint, aVariantName, aStretchy):
+        # Return (code point, files) where code point is the one looked up
+        # after the remapping of the variant and files the set of the files
+        # loaded for the character, empty if the family has no font for its
+        # subset, or None if no subset of FONTSPLITTING claims it.
+        key = (aCodePoint, aVariantName, aStretchy)
+        if key in self.mCache:
+            return self.mCache[key]
+
+        rv = None
+        if aStretchy:
+            files = self.getDelimiterFonts(aCodePoint)
+            if files is not None:
+                rv = (aCodePoint, files)
+        if rv is None:
+            variant = self.mVariants.get(aVariantName,
+                                         self.mVariants["normal"])
+            fonts = variant["fonts"]
+            if fonts is None:
+                fonts = self.mVariants["normal"]["fonts"]
+            codePoint = self.remap(aCodePoint, variant)
+            name = self.mIndex.getSubset(codePoint)
+            if name is None:
+                rv = (codePoint, None)
+            else:
+                base = name.upper()
+                candidates = [f for f in fonts if f in self.mFonts and
+                              (f in [base, base + "BOLD", base + "ITALIC",
+                                     base + "BOLDITALIC"] or
+                               (f.startswith("SIZE") and
+                                aVariantName == "-largeOp"))]
+                candidates += [f for f in [base + variant["style"], base]
+                               if f in self.mFonts]
+                files = set()
+                if len(candidates) > 0:
+                    files.add(self.mFonts[candidates[0]])
+                rv = (codePoint, files)
+
+        self.mCache[key] = rv
+        return rv
+
+# State of the worker processes, set before the pool is created
+tables = None
+layout = None
+
+def analyzeDocument(aJob):
+    # Return (bytes, files, characters, codePoints, missing, unclaimed) for
+    # the document, where characters is the set of (file, code point), or
+    # None if it could not be read.
+    fileName, kind, chunkSize, dollars = aJob
+    scanner = documentScanner(kind, tables, dollars)
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    size = 0
+    try:
+        if fileName.endswith(".gz"):
+            f = gzip.open(fileName, "rb")
+        else:
+            f = open(fileName, "rb")
+        try:
+            while True:
+                data = f.read(chunkSize)
+                if len(data) == 0:
+                    break
+                size += len(data)
+                scanner.feed(decoder.decode(data))
+            scanner.feed(decoder.decode(b"", True), True)
+        finally:
+            f.close()
+    except (IOError, OSError):
+        return None
+
+    files = set()
+    characters = set()
+    codePoints = set()
+    missing = set()
+    unclaimed = set()
+    for codePoint, variant, stretchy in scanner.mCharacters:
+        codePoint, fonts = layout.getFonts(codePoint, variant, stretchy)
+        if fonts is None:
+            unclaimed.add(codePoint)
+            continue
+        codePoints.add(codePoint)
+        if len(fonts) == 0:
+            missing.add(codePoint)
+        for font in fonts:
+            files.add(font)
+            characters.add((font, codePoint))
+    return (size, files, characters, codePoints, missing, unclaimed)
+
+def getDocuments(aDirectory, aChunkSize, aDollars):
+    # Generate the jobs of the documents of the corpus, walking it lazily.
+    for directory, subdirectories, fileNames in os.walk(aDirectory):
+        subdirectories.sort()
+        for fileName in sorted(fileNames):
+            name = fileName
+            if name.endswith(".gz"):
+                name = name[:-3]
+            kind = EXTENSIONS.get(os.path.splitext(name)[1].lower())
+            if kind is not None:
+                yield (os.path.join(directory, fileName), kind, aChunkSize,
+                       aDollars)
+
+def addCount(aCounts, aKey):
+    aCounts[aKey] = aCounts.get(aKey, 0) + 1
+
+class corpusStatistics:
+    # Number of documents using each file and character. The memory used only
+    # depends on the number of distinct files and characters.
+    def __init__(self):
+        self.mDocuments = 0
+        self.mMathDocuments = 0
+        self.mErrors = 0
+        self.mBytes = 0
+        self.mFileCount = 0
+        self.mFiles = {}
+        self.mCharacters = {}
+        self.mCodePoints = {}
+        self.mMissing = {}
+        self.mUnclaimed = {}
+
+    def add(self, aResult):
+        if aResult is None:
+            self.mErrors += 1
+            return
+        size, files, characters, codePoints, missing, unclaimed = aResult
+        self.mDocuments += 1
+        self.mBytes += size
+        if len(codePoints) + len(unclaimed) > 0:
+            self.mMathDocuments += 1
+        self.mFileCount += len(files)
+        for name in files:
+            addCount(self.mFiles, name)
+        for character in characters:
+            addCount(self.mCharacters, character)
+        for codePoint in codePoints:
+            addCount(self.mCodePoints, codePoint)
+        for codePoint in missing:
+            addCount(self.mMissing, codePoint)
+        for codePoint in unclaimed:
+            addCount(self.mUnclaimed, codePoint)
+
+    def getRate(self, aCount):
+        if self.mDocuments == 0:
+            return 0.0
+        return 100.0 * aCount / self.mDocuments
+
+    def printCharacters(self, aTitle, aCounts, aTop):
+        print(aTitle)
+        codePoints = sorted(aCounts, key=lambda c: (-aCounts[c], c))
+        for codePoint in codePoints[:aTop]:
+            print("  U+%04X %10d %6.2f%%" % (codePoint, aCounts[codePoint],
+                                             self.getRate(aCounts[codePoint])))
+        if len(codePoints) > aTop:
+            print("  ... and %d more" % (len(codePoints) - aTop))
+        print()
+
+    def printReport(self, aFonts, aRare, aTop):
+        print("%d documents (%d with math, %d unreadable), %d bytes" %
+              (self.mDocuments, self.mMathDocuments, self.mErrors,
+               self.mBytes))
+        if self.mDocuments == 0:
+            return
+        print("Average files per page: %.2f" %
+              (self.mFileCount / float(self.mDocuments)))
+        if self.mMathDocuments > 0:
+            print("Average files per page with math: %.2f" %
+                  (self.mFileCount / float(self.mMathDocuments)))
+        print()
+
+        print("Hit rate of the files:")
+        names = sorted(set(aFonts.values()) | set([EXTRAFILE]),
+                       key=lambda n: (-self.mFiles.get(n, 0), n))
+        for name in names:
+            count = self.mFiles.get(name, 0)
+            print("  %-32s %10d %6.2f%%" % (name, count, self.getRate(count)))
+        print()
+
+        nonUnicode = set([aFonts[v] for v in aFonts
+                          if v.startswith("NONUNICODE")])
+        rare = [n for n in names if n != EXTRAFILE and
+                0 < self.getRate(self.mFiles.get(n, 0)) < aRare]
+        for name in sorted(nonUnicode) + rare:
+            counts = dict([(c, self.mCharacters[(f, c)])
+                           for f, c in self.mCharacters if f == name])
+            if len(counts) == 0:
+                continue
+            if name in nonUnicode:
+                title = "Characters in %s:" % name
+            else:
+                title = "Characters in %s (rarely used):" % name
+            self.printCharacters(title, counts, aTop)
+        if len(self.mMissing) > 0:
+            self.printCharacters("Characters whose subset has no font in \
+the family:", self.mMissing, aTop)
+        if len(self.mUnclaimed) > 0:
+            self.printCharacters("Characters of no subset of FONTSPLITTING:",
+                                 self.mUnclaimed, aTop)
+
+    def writeHistogram(self, aFileName):
+        # Write the histogram read by planSplitting.py.
+        histogram = {"pages": self.mDocuments,
+                     "codePoints": dict([("0x%04X" % c, self.mCodePoints[c])
+                                         for c in self.mCodePoints])}
+        f = open(aFileName, "w")
+        json.dump(histogram, f, indent=1, sort_keys=True)
+        f.write("\n")
+        f.close()
+
+# Parse the command line arguments
+root = os.path.dirname(os.path.abspath(__file__))
+parser = argparse.ArgumentParser()
+parser.add_argument('fontfamily', type=str)
+parser.add_argument('corpus', type=str,
+                    help='directory of the TeX, MathML and HTML documents')
+parser.add_argument('--mode', type=str, default="HTML-CSS",
+                    choices=["HTML-CSS", "SVG"],
+                    help='output mode whose fontdata.js is used')
+parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count(),
+                    help='number of documents analyzed in parallel')
+parser.add_argument('--chunkSize', type=int, default=1 << 20,
+                    help='size of the chunks in which the documents are read')
+parser.add_argument('--dollars', action='store_true',
+                    help='also use $...$ as delimiters of TeX in HTML')
+parser.add_argument('--rare', type=float, default=1.0,
+                    help='hit rate in percent below which a file is rarely '
+                    'used')
+parser.add_argument('--top', type=int, default=20,
+                    help='number of characters listed for each file')
+parser.add_argument('--histogram', type=str, default=None,
+                    help='file where the code point histogram is written')
+parser.add_argument('--entities', type=str,
+                    default=os.path.join(root, "../../MML-entities"),
+                    help='directory of MJ-TeX-Unicode.txt and htmlmathml-f.txt')
+parser.add_argument('--operators', type=str,
+                    default=os.path.join(root, "../../operator-dictionary"),
+                    help='directory of ops-unicode.txt')
+args = parser.parse_args()
+
+if not os.path.isdir(args.corpus):
+    raise BaseException("Directory %s does not exist" % args.corpus)
+
+# The workers inherit these when the pool is created.
+tables = characterTables(args.entities, args.operators)
+layout = splitLayout(args.fontfamily, args.mode)
+
+statistics = corpusStatistics()
+documents = getDocuments(args.corpus, args.chunkSize, args.dollars)
+if args.jobs > 1:
+    # Give the documents to the pool in batches, so that the list of the
+    # pending ones stays small.
+    pool = multiprocessing.Pool(args.jobs)
+    try:
+        while True:
+            batch = list(islice(documents, 64 * args.jobs))
+            if len(batch) == 0:
+                break
+            for result in pool.imap_unordered(analyzeDocument, batch, 16):
+                statistics.add(result)
+    finally:
+        pool.close()
+        pool.join()
+else:
+    for document in documents:
+        statistics.add(analyzeDocument(document))
+
+statistics.printReport(layout.mFonts, args.rare, args.top)
+if args.histogram is not None:
+    statistics.writeHistogram(args.histogram)
+    print("Histogram of %d code points written to %s" %
+          (len(statistics.mCodePoints), args.histogram))
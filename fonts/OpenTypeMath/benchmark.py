@@ -0,0 +1,436 @@
+# -*- Mode: Python; tab-width: 2; indent-tabs-mode:nil; -*-
+# vim: set ts=2 et sw=2 tw=80:
+#
+# Copyright (c) 2013 The MathJax Consortium
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Benchmark of the font splitter on synthetic fonts.
+#
+# The real source fonts (STIX, Gyre, Latin Modern...) are not needed: this
+# script creates with FontForge a math font with --glyphs Unicode glyphs,
+# --pua non-Unicode glyphs and --stretchy stretchy operators with size
+# variants and glyph assemblies in its MATH table, and optionally the main
+# fonts of some other weights. The fonts only depend on the parameters, so
+# the results of different commits can be compared.
+#
+# It then runs splitFont.py --profile on a "Benchmark" font family using
+# these fonts (math font splitting, main font splitting, fontdata.js and
+# Main.js emission) and measures in this process fontUtil.planSubsets,
+# fontUtil.moveGlyphs and fontUtil.getGlyphMetrics on the synthetic math
+# font. For each measure, the best time of --repeat runs is kept and the
+# throughput in glyphs/s is given. The fonts always contain the TeX
+# delimiters as stretchy operators, since splitFont.py requires them, so
+# --glyphs and --stretchy must be at least 16 and 15.
+#
+# Each run appends one JSON line to the --results file, labelled with the
+# current git commit, and prints the changes since the last result with the
+# same parameters.
+#
+#   python benchmark.py --glyphs 2000 --pua 500 --stretchy 40
+
+from __future__ import print_function
+
+import sys, os, time, json
+import argparse
+import subprocess, shutil, tempfile
+import math
+import fontforge
+
+import fontUtil
+from buildProfile import getMaxRSS
+from fontSplitting import FONTSPLITTING, fontSplittingIndex
+
+# Name of the font family directory created for the benchmark
+FAMILY = "Benchmark"
+
+# Ranges of code points from which the Unicode glyphs are taken, in order
+UNICODERANGES = [
+    (0x0020, 0x007E), # Basic Latin
+    (0x00A0, 0x00FF), # Latin-1 Supplement
+    (0x0391, 0x03C9), # Greek
+    (0x2000, 0x206F), # General Punctuation
+    (0x2100, 0x214F), # Letterlike Symbols
+    (0x2190, 0x21FF), # Arrows
+    (0x2200, 0x22FF), # Mathematical Operators
+    (0x2300, 0x23FF), # Miscellaneous Technical
+    (0x25A0, 0x25FF), # Geometric Shapes
+    (0x27C0, 0x27EF), # Miscellaneous Mathematical Symbols-A
+    (0x2900, 0x2AFF), # Supplemental Arrows-B, Math Operators
+    (0x1D400, 0x1D7FF) # Mathematical Alphanumeric Symbols
+]
+
+# TeX delimiters, which splitFont.py requires to be stretchy operators
+DELIMITERS = [0x28, 0x29, 0x2F, 0x5B, 0x5C, 0x5D, 0x7B, 0x7D,
+              0x2308, 0x2309, 0x230A, 0x230B, 0x23D0, 0x27E8, 0x27E9]
+
+# Code points that the fonts always contain: the delimiters and the M used by
+# splitFont.py to compute TeX_factor
+REQUIRED = DELIMITERS + [0x4D]
+
+# Number of size variants of each stretchy operator
+VARIANTS = 4
+
+CONFIG = '''
+FONTFAMILY_PREFIX = "Benchmark MathJax"
+FONTNAME_PREFIX = "BenchmarkMathJax"
+
+MATHFONT = "Benchmark-Math.otf"
+MAINFONTS = %s
+
+FONTSPLITTING_EXTRA = {}
+FONTSPLITTING_REMOVE = None
+
+FONTDATA = {
+    "FileVersion": "2.3",
+    "Year": "2013",
+    "TeX_factor": None,
+    "baselineskip": 1.2,
+    "lineH": .8,
+    "lineD": .2,
+    "hasStyleChar": True
+    }
+
+RULECHAR = 0x00AF
+
+REMAP = {}
+REMAPACCENT = {}
+REMAPACCENTUNDER = {}
+
+VARIANT = None
+VARIANTFONTS = []
+
+TEXCALIGRAPHIC = None
+TEXCALIGRAPHICFONTS = []
+
+TEXOLDSTYLE = None
+TEXOLDSTYLEFONTS = []
+
+TEXCALIGRAPHICBOLD = None
+TEXCALIGRAPHICBOLDFONTS = []
+
+TEXOLDSTYLEBOLD = None
+TEXOLDSTYLEBOLDFONTS = []
+
+SANSSERIFGREEK = None
+SANSSERIFITALICNUMBER = None
+SANSSERIFITALICGREEK = None
+SANSSERIFBOLDITALICNUMBER = None
+
+SMALLOPFONTS = None
+
+DELIMITERS = {}
+DELIMITERS_EXTRA = []
+'''
+
+def getCodePoints(aCount):
+    # Return the REQUIRED code points, then the first ones of UNICODERANGES.
+    if aCount < len(REQUIRED):
+        raise BaseException("At least %d Unicode glyphs are needed" %
+                            len(REQUIRED))
+    codePoints = list(REQUIRED)
+    required = set(REQUIRED)
+    for start, end in UNICODERANGES:
+        for codePoint in range(start, end + 1):
+            if len(codePoints) == aCount:
+                return codePoints
+            if codePoint not in required:
+                codePoints.append(codePoint)
+    if len(codePoints) < aCount:
+        raise BaseException("At most %d Unicode glyphs are supported" %
+                            len(codePoints))
+    return codePoints
+
+def getStretchyCodePoints(aCodePoints, aCount):
+    # Return the delimiters, then the arrows, then the other glyphs.
+    if aCount < len(DELIMITERS):
+        raise BaseException("At least %d stretchy operators are needed" %
+                            len(DELIMITERS))
+    codePoints = list(DELIMITERS)
+    codePoints += [c for c in aCodePoints
+                   if 0x2190 <= c and c <= 0x21FF and c not in codePoints]
+    codePoints += [c for c in aCodePoints
+                   if c > 0x20 and c not in codePoints]
+    return codePoints[:aCount]
+
+def drawGlyph(aGlyph, aWidth, aHeight, aPoints):
+    # Draw a polygon with aPoints points inscribed in the glyph box.
+    pen = aGlyph.glyphPen()
+    for i in range(0, aPoints):
+        a = 2 * math.pi * i / aPoints
+        p = (int(aWidth * (1 + math.cos(a)) / 2),
+             int(aHeight * (1 + math.sin(a)) / 2) - aHeight // 4)
+        if i == 0:
+            pen.moveTo(p)
+        else:
+            pen.lineTo(p)
+    pen.closePath()
+    pen = None
+    aGlyph.width = aWidth
+
+def makeFont(aFileName, aWeight, aCodePoints, aPUA, aStretchy, aPoints):
+    font = fontforge.font()
+    font.encoding = "UnicodeFull"
+    font.fontname = "Benchmark-%s" % aWeight
+    font.familyname = "Benchmark"
+    font.fullname = "Benchmark %s" % aWeight
+    font.weight = aWeight
+    font.em = 1000
+    font.ascent = 800
+    font.descent = 200
+
+    for i, codePoint in enumerate(aCodePoints):
+        glyph = font.createChar(codePoint, "uni%04X" % codePoint)
+        drawGlyph(glyph, 400 + 10 * (i % 40), 700, aPoints)
+
+    for i in range(0, aPUA):
+        glyph = font.createChar(-1, "pua%d" % i)
+        drawGlyph(glyph, 500, 700, aPoints)
+
+    if len(aStretchy) > 0:
+        font.math.AxisHeight = 250
+        font.math.MinConnectorOverlap = 20
+    for codePoint in aStretchy:
+        base = "uni%04X" % codePoint
+        horizontal = 0x2190 <= codePoint and codePoint <= 0x21FF
+        variants = [base]
+        for i in range(1, VARIANTS + 1):
+            name = "%s.s%d" % (base, i)
+            glyph = font.createChar(-1, name)
+            if horizontal:
+                drawGlyph(glyph, 500 * (i + 1), 500, aPoints)
+            else:
+                drawGlyph(glyph, 500, 700 * (i + 1), aPoints)
+            variants.append(name)
+        parts = []
+        for part, extender in [("bt", False), ("ex", True), ("tp", False)]:
+            name = "%s.%s" % (base, part)
+            glyph = font.createChar(-1, name)
+            drawGlyph(glyph, 500, 500, aPoints)
+            parts.append((name, extender, 100, 100, 500))
+        if horizontal:
+            font[base].horizontalVariants = " ".join(variants)
+            font[base].horizontalComponents = tuple(parts)
+        else:
+            font[base].verticalVariants = " ".join(variants)
+            font[base].verticalComponents = tuple(parts)
+
+    font.generate(aFileName)
+    font.close()
+
+def makeFamily(aFontDir, aArgs):
+    # Create the source fonts in aFontDir and the Benchmark font family.
+    codePoints = getCodePoints(aArgs.glyphs)
+    stretchy = getStretchyCodePoints(codePoints, aArgs.stretchy)
+    print("Creating the synthetic fonts...")
+    makeFont("%s/Benchmark-Math.otf" % aFontDir, "Regular",
+             codePoints, aArgs.pua, stretchy, aArgs.points)
+    weights = getWeights(aArgs)
+    for weight in weights:
+        if weight != "Regular":
+            makeFont("%s/Benchmark-%s.otf" % (aFontDir, weight), weight,
+                     codePoints, aArgs.pua, [], aArgs.points)
+
+    if len(weights) > 1:
+        mainFonts = {}
+        for weight in weights:
+            if weight == "Regular":
+                mainFonts[weight] = "Benchmark-Math.otf"
+            else:
+                mainFonts[weight] = "Benchmark-%s.otf" % weight
+    else:
+        mainFonts = None
+
+    shutil.rmtree(FAMILY, True)
+    for mode in ["HTML-CSS", "SVG"]:
+        os.makedirs("%s/%s" % (FAMILY, mode))
+        open("%s/%s/fontdata-adjust.js" % (FAMILY, mode), "w").close()
+    f = open("%s/config.py" % FAMILY, "w")
+    f.write(CONFIG % repr(mainFonts))
+    f.close()
+
+def getWeights(aArgs):
+    weights = aArgs.weights.split(",")
+    if "Regular" not in weights:
+        raise BaseException("--weights must contain Regular")
+    return weights
+
+def getCommit():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short",
+                                          "HEAD"])
+        return commit.decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def runSplitFont(aFontDir, aArgs):
+    # Run splitFont.py on the Benchmark family and return its profile.
+    for directory in ["otf", "ttf", "svg"]:
+        # Remove the fonts of the previous run, which would not be generated
+        # again otherwise.
+        shutil.rmtree("%s/%s" % (FAMILY, directory), True)
+    profileFile = "%s/profile.json" % aFontDir
+    command = [sys.executable, "splitFont.py", FAMILY, aFontDir,
+               "--jobs", str(aArgs.jobs), "--profile", profileFile]
+    output = None
+    if not aArgs.verbose:
+        output = open(os.devnull, "w")
+    status = subprocess.call(command, stdout=output)
+    if output is not None:
+        output.close()
+    if status != 0:
+        raise BaseException("splitFont.py failed with status %d" % status)
+    f = open(profileFile)
+    profile = json.load(f)
+    f.close()
+    return profile
+
+def timeFunction(aFunction, *args):
+    start = time.time()
+    aFunction(*args)
+    return time.time() - start
+
+def runFontUtil(aFontDir):
+    # Measure the glyph metrics emission and the splitting of the math font
+    # as done by splitFont.py: the subsets planned in a single pass, then the
+    # glyphs of each subset moved to a new font. Return the times.
+    font = fontforge.open("%s/Benchmark-Math.otf" % aFontDir)
+    font.encoding = "UnicodeFull"
+    times = {"getGlyphMetrics": timeFunction(fontUtil.getGlyphMetrics, font),
+             "moveGlyphs": 0.0}
+    # The Benchmark family has no FONTSPLITTING_EXTRA.
+    index = fontSplittingIndex({})
+    start = time.time()
+    plan, removed = fontUtil.planSubsets(font, index)
+    times["planSubsets"] = time.time() - start
+    for subset in FONTSPLITTING:
+        target = fontforge.font()
+        target.encoding = "UnicodeFull"
+        times["moveGlyphs"] += timeFunction(fontUtil.moveGlyphs,
+                                            font, target, plan[subset[0]])
+        target.close()
+    font.close()
+    return times
+
+def getThroughput(aGlyphs, aTime):
+    if aTime <= 0:
+        return None
+    return aGlyphs / aTime
+
+def compare(aResult, aPrevious):
+    print("%-40s %12s %12s %8s" % ("measure", "time (s)", "previous", "change"))
+    for name in sorted(aResult["times"]):
+        t = aResult["times"][name]
+        line = "%-40s %12.3f" % (name, t)
+        if aPrevious is not None and name in aPrevious["times"]:
+            p = aPrevious["times"][name]
+            line += " %12.3f" % p
+            if p > 0:
+                line += " %+7.1f%%" % (100 * (t - p) / p)
+        print(line)
+    print("%-40s %12d" % ("max RSS (KB)", aResult["maxRSS"]))
+    if aPrevious is not None:
+        print("(previous: %s, %s)" % (aPrevious["commit"], aPrevious["date"]))
+
+# Parse the command line arguments
+parser = argparse.ArgumentParser()
+parser.add_argument('--glyphs', type=int, default=1000,
+                    help='number of Unicode glyphs of the fonts')
+parser.add_argument('--pua', type=int, default=200,
+                    help='number of non-Unicode glyphs of the fonts')
+parser.add_argument('--stretchy', type=int, default=30,
+                    help='number of stretchy operators of the math font')
+parser.add_argument('--points', type=int, default=32,
+                    help='number of points of the outline of each glyph')
+parser.add_argument('--weights', type=str, default="Regular",
+                    help='comma-separated weights of the main fonts, among '
+                    'Regular, Bold, Italic and BoldItalic')
+parser.add_argument('--jobs', type=int, default=1,
+                    help='value of the --jobs option of splitFont.py')
+parser.add_argument('--repeat', type=int, default=3,
+                    help='number of runs of each measure')
+parser.add_argument('--results', type=str, default="benchmark.jsonl",
+                    help='file to which the results are appended')
+parser.add_argument('--keep', action='store_true',
+                    help='keep the Benchmark family and the synthetic fonts')
+parser.add_argument('--verbose', action='store_true',
+                    help='show the output of splitFont.py')
+args = parser.parse_args()
+
+# splitFont.py expects the font families in the current directory.
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+fontDir = tempfile.mkdtemp(prefix="benchmark-")
+try:
+    makeFamily(fontDir, args)
+    # Number of glyphs of the math font and of all the source fonts
+    glyphs = args.glyphs + args.pua + args.stretchy * (VARIANTS + 3)
+    allGlyphs = glyphs + (len(getWeights(args)) - 1) * (args.glyphs + args.pua)
+
+    times = {}
+    maxRSS = 0
+    for i in range(0, args.repeat):
+        print("Run %d/%d..." % (i + 1, args.repeat))
+        profile = runSplitFont(fontDir, args)
+        measures = {}
+        for path in profile["phases"]:
+            measures[path] = profile["phases"][path]["wall"]
+        measures.update(runFontUtil(fontDir))
+        for name in measures:
+            times[name] = min(times.get(name, measures[name]), measures[name])
+        maxRSS = max(maxRSS, profile["maxRSS"])
+    maxRSS = max(maxRSS, getMaxRSS())
+
+    result = {
+        "commit": getCommit(),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "fontforge": fontforge.version(),
+        "parameters": {"glyphs": args.glyphs, "pua": args.pua,
+                       "stretchy": args.stretchy, "points": args.points,
+                       "weights": args.weights, "jobs": args.jobs},
+        "times": times,
+        "throughput": {
+            "splitFont": getThroughput(allGlyphs, times.get("splitFont", 0)),
+            "getGlyphMetrics": getThroughput(glyphs, times["getGlyphMetrics"]),
+            "planSubsets": getThroughput(glyphs, times["planSubsets"]),
+            "moveGlyphs": getThroughput(glyphs, times["moveGlyphs"])
+        },
+        "maxRSS": maxRSS
+    }
+
+    # Find the last result with the same parameters.
+    previous = None
+    if os.path.exists(args.results):
+        f = open(args.results)
+        for line in f:
+            r = json.loads(line)
+            if (r["parameters"] == result["parameters"] and
+                r["commit"] != result["commit"]):
+                previous = r
+        f.close()
+
+    f = open(args.results, "a")
+    f.write(json.dumps(result, sort_keys=True) + "\n")
+    f.close()
+
+    compare(result, previous)
+    for name in sorted(result["throughput"]):
+        if result["throughput"][name] is not None:
+            print("%-40s %12.0f glyphs/s" % (name, result["throughput"][name]))
+finally:
+    if args.keep:
+        print("Synthetic fonts kept in %s" % fontDir)
+    else:
+        shutil.rmtree(fontDir, True)
+        shutil.rmtree(FAMILY, True)
@@ -0,0 +1,269 @@
+# -*- Mode: Python; tab-width: 2; indent-tabs-mode:nil; -*-
+# vim: set ts=2 et sw=2 tw=80:
+#
+# Copyright (c) 2013 The MathJax Consortium
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Cache of the files generated by splitFont.py.
+#
+# Each entry is a directory named after the hash of all the inputs of a
+# generated font: the source font files, the values of config.py used for
+# that font, the FONTSPLITTING subsets it depends on and the code of the
+# splitter. It contains the otf/ttf/svg files of the font, its digest, the glyph
+# metrics recorded by saveFont and the Main.js files built from them.
+#
+# Entries are created in a temporary directory and renamed, so several builds
+# can share the same cache. The modification time of an entry is updated
+# each time it is used and the least recently used entries are removed when
+# the cache exceeds its maximum size.
+
+from __future__ import print_function
+
+import os, shutil
+import hashlib
+import fontforge
+import fontUtil
+from sourceFontCache import getFileHash
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# Files whose content determines the output of the splitter. Only the code of
+# fontSplitting.py is hashed (see getSplittingCodeHash): the FONTSPLITTING
+# subsets a font depends on are part of its key, so editing the table only
+# invalidates the fonts of the changed subsets.
+SPLITTINGFILE = "fontSplitting.py"
+CODEFILES = ["buildCache.py", "fontUtil.py", "splitFont.py",
+             "sourceFontCache.py",
+             "X-Regular.otf", "X-Bold.otf", "X-Italic.otf", "X-BoldItalic.otf"]
+
+# Name of the files of a font in a cache entry
+FONTFILES = [("otf", "otf"), ("ttf", "ttf"), ("svg", "svg")]
+
+def getSplittingCodeHash(aFileName):
+    # Hash of fontSplitting.py without the FONTSPLITTING table. The whole file
+    # is hashed if the table can not be found.
+    f = open(aFileName, "rb")
+    source = f.read()
+    f.close()
+    start = source.find(b"\nFONTSPLITTING = [\n")
+    end = source.find(b"\n    ]\n", start)
+    if start >= 0 and end >= 0:
+        source = source[:start] + source[end + len(b"\n    ]\n"):]
+    return hashlib.sha1(source).hexdigest()
+
+def canonicalValue(aValue):
+    # Return a representation of aValue that does not depend on the order of
+    # the items of the dictionaries and sets it contains.
+    if type(aValue) == dict:
+        return "{%s}" % ", ".join(sorted(["%s: %s" % (canonicalValue(k),
+                                                      canonicalValue(v))
+                                          for k, v in aValue.items()]))
+    if type(aValue) in (set, frozenset):
+        return "set(%s)" % ", ".join(sorted([canonicalValue(v)
+                                             for v in aValue]))
+    if type(aValue) in (list, tuple):
+        return "[%s]" % ", ".join([canonicalValue(v) for v in aValue])
+    return repr(aValue)
+
+class fontBuildCache:
+    # If aDirectory is None, the cache is disabled: nothing is ever found in
+    # it and nothing is stored.
+    def __init__(self, aDirectory, aFamily, aMaxSize = 2048):
+        self.mDirectory = aDirectory
+        self.mFamily = aFamily
+        self.mMaxSize = aMaxSize * (1 << 20)
+
+        # Cache entries of the fonts of this build, indexed by font name
+        self.mKeys = {}
+
+        # Fonts to store once they have been generated
+        self.mPending = []
+
+        self.mFileHashes = {}
+        if self.mDirectory is None:
+            return
+
+        if not os.path.exists(self.mDirectory):
+            os.makedirs(self.mDirectory)
+
+        h = hashlib.sha1()
+        h.update(fontforge.version().encode("utf-8"))
+        codeDirectory = os.path.dirname(os.path.abspath(__file__))
+        h.update(getSplittingCodeHash("%s/%s" % (codeDirectory,
+                                                 SPLITTINGFILE)).\
+                 encode("utf-8"))
+        for fileName in CODEFILES:
+            h.update(getFileHash("%s/%s" % (codeDirectory, fileName)).\
+                     encode("utf-8"))
+        self.mCodeHash = h.hexdigest()
+
+    def isEnabled(self):
+        return self.mDirectory is not None
+
+    def getFileHash(self, aFileName):
+        # Hash of a source file, computed once per run.
+        if aFileName not in self.mFileHashes:
+            self.mFileHashes[aFileName] = getFileHash(aFileName)
+        return self.mFileHashes[aFileName]
+
+    def getKey(self, aParts):
+        # Return the key of the entry of a font generated from aParts.
+        if self.mDirectory is None:
+            return None
+        h = hashlib.sha1()
+        h.update(self.mCodeHash.encode("utf-8"))
+        h.update(canonicalValue(aParts).encode("utf-8"))
+        return h.hexdigest()
+
+    def getEntry(self, aKey):
+        return "%s/%s" % (self.mDirectory, aKey)
+
+    def contains(self, aKey):
+        return (self.mDirectory is not None and
+                os.path.isdir(self.getEntry(aKey)))
+
+    def restore(self, aKey, aFontName, aManifest):
+        # Copy the files of the font aFontName from the cache entry aKey and
+        # add its metrics to aManifest. Return False if there is no entry.
+        if not self.contains(aKey):
+            return False
+        entry = self.getEntry(aKey)
+        os.utime(entry, None)
+        self.mKeys[aFontName] = aKey
+
+        if not os.path.exists("%s/metrics" % entry):
+            # saveFont did not generate this font since it was empty.
+            return True
+
+        print("Restoring %s from the cache..." % aFontName)
+        for directory, extension in FONTFILES:
+            fileName = "%s/font.%s" % (entry, extension)
+            if os.path.exists(fileName):
+                shutil.copyfile(fileName, "%s/%s/%s.%s" %
+                                (self.mFamily, directory, aFontName, extension))
+        fileName = "%s/font.digest" % entry
+        if os.path.exists(fileName):
+            f = open(fileName)
+            fontUtil.writeDigest(fontUtil.getDigestKey(self.mFamily, aFontName),
+                                 f.read().strip())
+            f.close()
+
+        f = open("%s/metrics" % entry, "rb")
+        metrics = pickle.load(f)
+        f.close()
+        aManifest.add(aFontName, metrics,
+                      "%s/svg/%s.svg" % (self.mFamily, aFontName))
+        return True
+
+    def add(self, aKey, aFontName):
+        # Store the font aFontName in the entry aKey at the next call to store.
+        if self.mDirectory is None:
+            return
+        self.mKeys[aFontName] = aKey
+        self.mPending.append((aKey, aFontName))
+
+    def store(self, aManifest):
+        # Store the fonts passed to add. They must have been generated.
+        for key, fontName in self.mPending:
+            if self.contains(key):
+                continue
+
+            temporary = "%s/tmp-%d-%s" % (self.mDirectory, os.getpid(), key)
+            os.makedirs(temporary)
+            if fontName in aManifest:
+                for directory, extension in FONTFILES:
+                    fileName = "%s/%s/%s.%s" % (self.mFamily, directory,
+                                                fontName, extension)
+                    if os.path.exists(fileName):
+                        shutil.copyfile(fileName, "%s/font.%s" %
+                                        (temporary, extension))
+                digest = fontUtil.readDigest(
+                    fontUtil.getDigestKey(self.mFamily, fontName))
+                if digest is not None:
+                    f = open("%s/font.digest" % temporary, "w")
+                    f.write("%s\n" % digest)
+                    f.close()
+                f = open("%s/metrics" % temporary, "wb")
+                pickle.dump(aManifest.loadMetrics(fontName), f,
+                            pickle.HIGHEST_PROTOCOL)
+                f.close()
+
+            try:
+                os.rename(temporary, self.getEntry(key))
+            except OSError:
+                # Another build stored the same entry in the meantime.
+                shutil.rmtree(temporary)
+        self.mPending = []
+
+    def restoreFile(self, aFontName, aName, aFileName):
+        # Copy the file aName of the entry of the font aFontName to aFileName.
+        # Return False if the cache does not have it.
+        if aFontName not in self.mKeys:
+            return False
+        fileName = "%s/%s" % (self.getEntry(self.mKeys[aFontName]), aName)
+        if not os.path.exists(fileName):
+            return False
+        shutil.copyfile(fileName, aFileName)
+        return True
+
+    def storeFile(self, aFontName, aName, aFileName):
+        # Store the file aFileName as aName in the entry of the font aFontName.
+        if aFontName not in self.mKeys:
+            return
+        entry = self.getEntry(self.mKeys[aFontName])
+        if not os.path.isdir(entry):
+            return
+        temporary = "%s/tmp-%d-%s" % (entry, os.getpid(), aName)
+        shutil.copyfile(aFileName, temporary)
+        os.rename(temporary, "%s/%s" % (entry, aName))
+
+    def evict(self, aGlyphCache = None):
+        # Remove the least recently used entries until the size of the cache
+        # is below its maximum size. The files of the sourceFontCache in the
+        # directory aGlyphCache count toward that size and are removed in the
+        # same order.
+        if self.mDirectory is None:
+            return
+        entries = []
+        total = 0
+        if aGlyphCache is not None and os.path.isdir(aGlyphCache):
+            for name in os.listdir(aGlyphCache):
+                if not name.endswith(".glyphs"):
+                    continue
+                fileName = "%s/%s" % (aGlyphCache, name)
+                size = os.path.getsize(fileName)
+                entries.append((os.path.getmtime(fileName), size, fileName))
+                total += size
+        for name in os.listdir(self.mDirectory):
+            entry = "%s/%s" % (self.mDirectory, name)
+            if len(name) != 40 or not os.path.isdir(entry):
+                # Not an entry: temporary directories, glyph cache...
+                continue
+            size = 0
+            for fileName in os.listdir(entry):
+                size += os.path.getsize("%s/%s" % (entry, fileName))
+            entries.append((os.path.getmtime(entry), size, entry))
+            total += size
+        entries.sort()
+        for mtime, size, entry in entries:
+            if total <= self.mMaxSize:
+                break
+            if os.path.isdir(entry):
+                shutil.rmtree(entry, True)
+            else:
+                os.remove(entry)
+            total -= size
@@ -0,0 +1,205 @@
+# -*- Mode: Python; tab-width: 2; indent-tabs-mode:nil; -*-
+# vim: set ts=2 et sw=2 tw=80:
+#
+# Copyright (c) 2013 The MathJax Consortium
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Timing history of the font build.
+#
+# For each font family, this script runs the Makefile targets of the split,
+# eot and woff stages and measures the time of each stage and the size of its
+# output. The stages are always run cold, so that the measures can be
+# compared: their output and the digests and hashes of the incremental build
+# are removed first and the build cache (FONTCACHE) is disabled. One JSON line
+# per family and stage is appended to the --history file, which is ignored by
+# git.
+#
+# Each measure is compared with the median of the --baseline previous ones
+# of the same family and stage. If the time or the size grew by more than
+# --threshold or --sizeThreshold percent, the regressions are listed and the
+# script exits with status 1:
+#
+#   STIX-Web split time +38% (412.1s, baseline 298.6s)
+#   Gyre-Termes woff bytes +12% (1843200, baseline 1645714)
+#
+# "make history" runs it on all the font families.
+
+from __future__ import print_function
+
+import sys, os, time, json, glob
+import argparse
+import subprocess, shutil
+
+FAMILIES = ["STIX-Web", "Asana-Math", "Gyre-Pagella", "Gyre-Termes",
+            "Latin-Modern", "Neo-Euler"]
+
+# Stages of the build: name, Makefile target, files removed before the stage
+# is run (as "make clean" does), output directories
+STAGES = [
+    ("split", "%s/HTML-CSS/fontdata.js",
+     ["otf", "ttf", "svg", "otf.digests",
+      "HTML-CSS/fontdata.js", "HTML-CSS/fontdata-extra.js", "HTML-CSS/*/",
+      "SVG/fontdata.js", "SVG/fontdata-extra.js", "SVG/*/"],
+     ["otf", "ttf", "svg", "HTML-CSS", "SVG"]),
+    ("eot", "%s/eot", ["eot", "eot.hashes"], ["eot"]),
+    ("woff", "%s/woff", ["woff", "woff.hashes"], ["woff"])
+]
+
+def getSize(aPath):
+    if not os.path.exists(aPath):
+        return 0
+    if not os.path.isdir(aPath):
+        return os.path.getsize(aPath)
+    size = 0
+    for directory, subdirectories, fileNames in os.walk(aPath):
+        for fileName in fileNames:
+            size += os.path.getsize(os.path.join(directory, fileName))
+    return size
+
+def getCommit():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short",
+                                          "HEAD"])
+        return commit.decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def runStage(aFamily, aStage, aMake):
+    # Run the Makefile target of the stage from scratch and return its time
+    # and the size of its output.
+    name, target, outputs, directories = aStage
+    target = target % aFamily
+    for output in outputs:
+        for path in glob.glob("%s/%s" % (aFamily, output)):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+    print("Running make %s..." % target)
+    start = time.time()
+    status = subprocess.call(aMake + ["FONTCACHE=", target])
+    elapsed = time.time() - start
+    if status != 0:
+        raise BaseException("make %s failed with status %d" % (target, status))
+
+    size = 0
+    for directory in directories:
+        size += getSize("%s/%s" % (aFamily, directory))
+    return elapsed, size
+
+def median(aValues):
+    values = sorted(aValues)
+    n = len(values)
+    if n % 2 == 1:
+        return values[n // 2]
+    return (values[n // 2 - 1] + values[n // 2]) / 2.0
+
+def getBaseline(aHistory, aFamily, aStage, aCount):
+    # Median time and size of the last aCount records of the family and stage
+    records = [r for r in aHistory
+               if r["family"] == aFamily and r["stage"] == aStage]
+    records = records[-aCount:]
+    if len(records) == 0:
+        return None
+    return (median([r["time"] for r in records]),
+            median([r["bytes"] for r in records]))
+
+def getIncrease(aValue, aBaseline):
+    if aBaseline <= 0:
+        return 0.0
+    return 100.0 * (aValue - aBaseline) / aBaseline
+
+def readHistory(aFileName):
+    history = []
+    if os.path.exists(aFileName):
+        f = open(aFileName)
+        for line in f:
+            if line.strip() != "":
+                history.append(json.loads(line))
+        f.close()
+    return history
+
+# Parse the command line arguments
+parser = argparse.ArgumentParser()
+parser.add_argument('families', type=str, nargs='*',
+                    help='font families to build (default: all)')
+parser.add_argument('--stages', type=str, default="split,eot,woff",
+                    help='comma-separated stages to run')
+parser.add_argument('--history', type=str, default="buildHistory.jsonl",
+                    help='file to which the timings are appended')
+parser.add_argument('--baseline', type=int, default=5,
+                    help='number of previous records used as the baseline')
+parser.add_argument('--threshold', type=float, default=20,
+                    help='maximum increase of the time of a stage, in percent')
+parser.add_argument('--sizeThreshold', type=float, default=5,
+                    help='maximum increase of the output size of a stage, in '
+                    'percent')
+parser.add_argument('--make', type=str, default="make",
+                    help='make command')
+args = parser.parse_args()
+
+families = args.families
+if len(families) == 0:
+    families = FAMILIES
+stages = args.stages.split(",")
+for stage in stages:
+    if stage not in [s[0] for s in STAGES]:
+        raise BaseException("Unknown stage %s" % stage)
+
+# The Makefile targets are relative to this directory.
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+history = readHistory(args.history)
+commit = getCommit()
+regressions = []
+
+for family in families:
+    for stage in STAGES:
+        if stage[0] not in stages:
+            continue
+        elapsed, size = runStage(family, stage, args.make.split())
+        record = {"date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                  "commit": commit, "family": family, "stage": stage[0],
+                  "time": elapsed, "bytes": size}
+
+        baseline = getBaseline(history, family, stage[0], args.baseline)
+        line = "%-14s %-6s %10.1fs %12d bytes" % (family, stage[0],
+                                                  elapsed, size)
+        if baseline is not None:
+            timeIncrease = getIncrease(elapsed, baseline[0])
+            sizeIncrease = getIncrease(size, baseline[1])
+            line += "   %+6.1f%% time %+6.1f%% bytes" % (timeIncrease,
+                                                         sizeIncrease)
+            if timeIncrease > args.threshold:
+                regressions.append("%s %s time %+.0f%% (%.1fs, baseline \
+%.1fs)" % (family, stage[0], timeIncrease, elapsed, baseline[0]))
+            if sizeIncrease > args.sizeThreshold:
+                regressions.append("%s %s bytes %+.0f%% (%d, baseline %d)" %
+                                   (family, stage[0], sizeIncrease,
+                                    size, baseline[1]))
+        print(line)
+
+        history.append(record)
+        f = open(args.history, "a")
+        f.write(json.dumps(record, sort_keys=True) + "\n")
+        f.close()
+
+if len(regressions) > 0:
+    print()
+    print("Regressions compared to the median of the last %d builds:" %
+          args.baseline)
+    for regression in regressions:
+        print("  %s" % regression)
+    sys.exit(1)
@@ -0,0 +1,139 @@
+# -*- Mode: Python; tab-width: 2; indent-tabs-mode:nil; -*-
+# vim: set ts=2 et sw=2 tw=80:
+#
+# Copyright (c) 2013 The MathJax Consortium
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Per-phase profile of the font build, enabled by splitFont.py --profile.
+#
+# The phases are nested: profiler.start(name) opens a phase inside the
+# current one and profiler.stop() closes it. For each path of phase names,
+# the report gives the number of calls, the wall-clock time, the CPU time of
+# the process and of its reaped children (the fonts generated in parallel)
+# and the peak RSS at the end of the phase. Counters are accumulated with
+# profiler.count(name, value).
+#
+# The report is written as JSON. The optional stack file uses the "folded"
+# format of flamegraph.pl: one line per path, with the phase names separated
+# by semicolons, followed by the self wall-clock time in milliseconds.
+
+from __future__ import print_function
+
+import os, time, json
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def getMaxRSS():
+    # Peak resident set size of the process and of its children, in KB
+    if resource is None:
+        return 0
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+class buildProfiler:
+    def __init__(self):
+        self.mEnabled = False
+        self.mStack = []
+        self.mPhases = {}
+        self.mCounters = {}
+
+    def enable(self):
+        self.mEnabled = True
+
+    def reset(self):
+        # Forget the data inherited from the parent process after a fork.
+        self.mStack = []
+        self.mPhases = {}
+        self.mCounters = {}
+
+    def start(self, aName):
+        if not self.mEnabled:
+            return
+        t = os.times()
+        # name, wall, CPU, children CPU, wall time of the sub-phases
+        self.mStack.append([aName, time.time(), t[0] + t[1], t[2] + t[3], 0.0])
+
+    def stop(self):
+        if not self.mEnabled:
+            return
+        name, wall, cpu, childrenCPU, subPhases = self.mStack.pop()
+        t = os.times()
+        wall = time.time() - wall
+        cpu = t[0] + t[1] - cpu
+        childrenCPU = t[2] + t[3] - childrenCPU
+        if len(self.mStack) > 0:
+            self.mStack[-1][4] += wall
+
+        path = ";".join([p[0] for p in self.mStack] + [name])
+        if path not in self.mPhases:
+            self.mPhases[path] = {"calls": 0, "wall": 0.0, "self": 0.0,
+                                  "cpu": 0.0, "childrenCPU": 0.0,
+                                  "maxRSS": 0}
+        phase = self.mPhases[path]
+        phase["calls"] += 1
+        phase["wall"] += wall
+        phase["self"] += wall - subPhases
+        phase["cpu"] += cpu
+        phase["childrenCPU"] += childrenCPU
+        phase["maxRSS"] = max(phase["maxRSS"], getMaxRSS())
+
+    def count(self, aName, aValue = 1):
+        if not self.mEnabled:
+            return
+        self.mCounters[aName] = self.mCounters.get(aName, 0) + aValue
+
+    def getData(self):
+        return {"phases": self.mPhases, "counters": self.mCounters}
+
+    def merge(self, aData):
+        # Add the data of the profiler of another process. Its phases are
+        # nested in the current phase.
+        prefix = ";".join([p[0] for p in self.mStack])
+        for path in aData["phases"]:
+            phase = aData["phases"][path]
+            if prefix != "":
+                path = "%s;%s" % (prefix, path)
+            if path not in self.mPhases:
+                self.mPhases[path] = dict(phase)
+                continue
+            for key in phase:
+                if key == "maxRSS":
+                    self.mPhases[path][key] = max(self.mPhases[path][key],
+                                                  phase[key])
+                else:
+                    self.mPhases[path][key] += phase[key]
+        for name in aData["counters"]:
+            self.count(name, aData["counters"][name])
+
+    def write(self, aFileName, aStackFileName = None):
+        data = self.getData()
+        data["maxRSS"] = getMaxRSS()
+        f = open(aFileName, "w")
+        json.dump(data, f, indent=1, sort_keys=True)
+        f.write("\n")
+        f.close()
+
+        if aStackFileName is not None:
+            f = open(aStackFileName, "w")
+            for path in sorted(self.mPhases):
+                print("%s %d" % (path.replace(" ", "_"),
+                                 round(1000 * self.mPhases[path]["self"])),
+                      file=f)
+            f.close()
+
+# Profiler shared by splitFont.py and fontUtil.py
+profiler = buildProfiler()
@@ -0,0 +1,301 @@
+# -*- Mode: Python; tab-width: 2; indent-tabs-mode:nil; -*-
+# vim: set ts=2 et sw=2 tw=80:
+#
+# Copyright (c) 2013 The MathJax Consortium
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Convert the fonts of some font families to the EOT, WOFF or WOFF2 format:
+#
+#   python convertFont.py FontFamily... eot   (from FontFamily/ttf/*.ttf)
+#   python convertFont.py FontFamily... woff  (from FontFamily/otf/*.otf)
+#   python convertFont.py FontFamily... woff2 (from FontFamily/ttf/*.ttf)
+#
+# The EOT files are written like ttf2eot does (version 0x00020001, with the
+# names of the font and its uncompressed data) and the WOFF 1.0 files like
+# sfnt2woff does (each table compressed with zlib when that makes it
+# smaller). The WOFF2 files are written by fontTools, which must be installed
+# with the brotli module; they are made from the TrueType fonts so that the
+# glyf/loca transform applies. A comparison of the sizes of the WOFF2 and
+# WOFF files is printed after the conversion. The fonts of all the families
+# are converted in parallel by --jobs processes.
+#
+# The hash of the source of each output file is kept in FontFamily/eot.hashes,
+# woff.hashes or woff2.hashes (outside of the directories copied to MathJax):
+# outputs whose source did not change are not written again, and those whose
+# source was removed are deleted.
+
+from __future__ import print_function
+
+import sys, os, struct, zlib, json
+import argparse
+import multiprocessing
+from sourceFontCache import getFileHash
+try:
+    # fontTools and brotli are only needed for the WOFF2 conversion. fontTools
+    # can be imported without brotli, but then fails to compress the fonts.
+    from fontTools.ttLib import woff2
+    import brotli
+except ImportError:
+    woff2 = None
+
+# Source directory and extension of each output type
+SOURCES = {"eot": "ttf", "woff": "otf", "woff2": "ttf"}
+
+def align4(aLength):
+    return (aLength + 3) & ~3
+
+def readTables(aData):
+    # Return the sfnt version and the list of (tag, checksum, data) of the
+    # tables of an OpenType/TrueType font.
+    version, numTables = struct.unpack_from(">IH", aData, 0)
+    tables = []
+    for i in range(0, numTables):
+        tag, checksum, offset, length = \
+            struct.unpack_from(">4sIII", aData, 12 + 16 * i)
+        tables.append((tag, checksum, aData[offset:offset + length]))
+    return version, tables
+
+def getTable(aTables, aTag):
+    for tag, checksum, data in aTables:
+        if tag == aTag:
+            return data
+    raise BaseException("No %s table" % aTag.decode("ascii"))
+
+def getName(aNameTable, aNameID):
+    # Return the UTF-16LE bytes of the Windows Unicode name aNameID,
+    # preferring the English one, or empty bytes if there is none.
+    count, stringOffset = struct.unpack_from(">HH", aNameTable, 2)
+    found = None
+    for i in range(0, count):
+        platformID, encodingID, languageID, nameID, length, offset = \
+            struct.unpack_from(">HHHHHH", aNameTable, 6 + 12 * i)
+        if platformID != 3 or encodingID != 1 or nameID != aNameID:
+            continue
+        if found is None or languageID == 0x409:
+            start = stringOffset + offset
+            found = aNameTable[start:start + length]
+        if languageID == 0x409:
+            break
+    if found is None:
+        return b""
+    # The name table is big endian: swap the bytes of each character.
+    swapped = bytearray(found)
+    swapped[0::2], swapped[1::2] = found[1::2], found[0::2]
+    return bytes(swapped)
+
+def makeEOT(aData):
+    version, tables = readTables(aData)
+    OS2 = getTable(tables, b"OS/2")
+    head = getTable(tables, b"head")
+    name = getTable(tables, b"name")
+
+    fsType = struct.unpack_from(">H", OS2, 8)[0]
+    panose = OS2[32:42]
+    unicodeRange = struct.unpack_from(">IIII", OS2, 42)
+    fsSelection = struct.unpack_from(">H", OS2, 62)[0]
+    weight = struct.unpack_from(">H", OS2, 4)[0]
+    if struct.unpack_from(">H", OS2, 0)[0] >= 1:
+        codePageRange = struct.unpack_from(">II", OS2, 78)
+    else:
+        codePageRange = (0, 0)
+    checkSumAdjustment = struct.unpack_from(">I", head, 8)[0]
+
+    # Family name, style name, version name and full name
+    names = b""
+    for nameID in [1, 2, 5, 4]:
+        string = getName(name, nameID)
+        names += struct.pack("<HH", 0, len(string)) + string
+    names += struct.pack("<HH", 0, 0) # Padding5, empty root string
+
+    header = (struct.pack("<II", 0, len(aData)) +
+              struct.pack("<II", 0x00020001, 0) +
+              panose +
+              struct.pack("<BBIHH", 1, fsSelection & 1, weight, fsType,
+                          0x504C) +
+              struct.pack("<IIII", *unicodeRange) +
+              struct.pack("<II", *codePageRange) +
+              struct.pack("<I", checkSumAdjustment) +
+              struct.pack("<IIII", 0, 0, 0, 0) +
+              names)
+    size = len(header) + len(aData)
+    return struct.pack("<I", size) + header[4:] + aData
+
+def makeWOFF(aData):
+    version, tables = readTables(aData)
+    tables.sort()
+
+    directory = []
+    blocks = []
+    offset = 44 + 20 * len(tables)
+    totalSfntSize = 12 + 16 * len(tables)
+    for tag, checksum, data in tables:
+        compressed = zlib.compress(data)
+        if len(compressed) >= len(data):
+            compressed = data
+        directory.append(struct.pack(">4sIIII", tag, offset, len(compressed),
+                                     len(data), checksum))
+        padding = align4(len(compressed)) - len(compressed)
+        blocks.append(compressed + b"\0" * padding)
+        offset += len(compressed) + padding
+        totalSfntSize += align4(len(data))
+
+    header = struct.pack(">4sIIHHIHHIIIII", b"wOFF", version, offset,
+                         len(tables), 0, totalSfntSize, 0, 0,
+                         0, 0, 0, 0, 0)
+    return header + b"".join(directory) + b"".join(blocks)
+
+def convertFile(aJob):
+    # Convert the font aJob = (type, source, output). multiprocessing only
+    # forwards Exception instances to the parent process, so convert the
+    # BaseException raised above.
+    outputType, source, output = aJob
+    try:
+        if outputType == "woff2":
+            woff2.compress(source, "%s.tmp" % output)
+        else:
+            f = open(source, "rb")
+            data = f.read()
+            f.close()
+            if outputType == "eot":
+                data = makeEOT(data)
+            else:
+                data = makeWOFF(data)
+            f = open("%s.tmp" % output, "wb")
+            f.write(data)
+            f.close()
+        os.rename("%s.tmp" % output, output)
+    except Exception:
+        raise
+    except BaseException as e:
+        raise Exception("%s: %s" % (source, e))
+
+def readHashes(aFileName):
+    if not os.path.exists(aFileName):
+        return {}
+    f = open(aFileName)
+    hashes = json.load(f)
+    f.close()
+    return hashes
+
+def getFamilyJobs(aFamily, aType):
+    # Return the conversion jobs of the font family and the hashes of their
+    # sources, removing the outputs whose source no longer exists.
+    if not os.path.isdir(aFamily):
+        raise BaseException("Directory %s does not exist" % aFamily)
+
+    sourceType = SOURCES[aType]
+    sourceDirectory = "%s/%s" % (aFamily, sourceType)
+    outputDirectory = "%s/%s" % (aFamily, aType)
+    if not os.path.exists(outputDirectory):
+        os.makedirs(outputDirectory)
+    oldHashes = readHashes("%s/%s.hashes" % (aFamily, aType))
+
+    hashes = {}
+    jobs = []
+    for fileName in sorted(os.listdir(sourceDirectory)):
+        name, extension = os.path.splitext(fileName)
+        if extension != ".%s" % sourceType:
+            continue
+        output = "%s.%s" % (name, aType)
+        hashes[output] = getFileHash("%s/%s" % (sourceDirectory, fileName))
+        if (oldHashes.get(output) == hashes[output] and
+            os.path.exists("%s/%s" % (outputDirectory, output))):
+            continue
+        print("Generating %s/%s..." % (aFamily, output))
+        jobs.append((aType, "%s/%s" % (sourceDirectory, fileName),
+                     "%s/%s" % (outputDirectory, output)))
+
+    # Remove the outputs of the fonts that no longer exist
+    for fileName in os.listdir(outputDirectory):
+        if fileName not in hashes:
+            os.remove("%s/%s" % (outputDirectory, fileName))
+
+    return jobs, hashes
+
+def getDirectorySize(aDirectory, aExtension):
+    # Return the sizes of the files of aDirectory with the extension
+    # aExtension, indexed by their names without extension.
+    sizes = {}
+    if os.path.isdir(aDirectory):
+        for fileName in os.listdir(aDirectory):
+            name, extension = os.path.splitext(fileName)
+            if extension == ".%s" % aExtension:
+                sizes[name] = os.path.getsize("%s/%s" % (aDirectory, fileName))
+    return sizes
+
+def printSizeReport(aFamilies):
+    # Compare the sizes of the WOFF2 and WOFF files of each family.
+    print("%-14s %12s %12s %8s" % ("family", "woff", "woff2", "change"))
+    totals = [0, 0]
+    for family in aFamilies:
+        woff = getDirectorySize("%s/woff" % family, "woff")
+        woff2 = getDirectorySize("%s/woff2" % family, "woff2")
+        names = [name for name in woff2 if name in woff]
+        if len(names) == 0:
+            print("%-14s (no WOFF files to compare with)" % family)
+            continue
+        sizes = (sum([woff[name] for name in names]),
+                 sum([woff2[name] for name in names]))
+        print("%-14s %12d %12d %+7.1f%%" % (family, sizes[0], sizes[1],
+                                            100.0 * (sizes[1] - sizes[0]) /
+                                            sizes[0]))
+        totals[0] += sizes[0]
+        totals[1] += sizes[1]
+    if totals[0] > 0:
+        print("%-14s %12d %12d %+7.1f%%" % ("total", totals[0], totals[1],
+                                            100.0 * (totals[1] - totals[0]) /
+                                            totals[0]))
+
+# Parse the command line arguments
+parser = argparse.ArgumentParser()
+parser.add_argument('fontfamily', type=str, nargs='+')
+parser.add_argument('type', type=str, choices=sorted(SOURCES))
+parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count(),
+                    help='number of fonts converted in parallel')
+args = parser.parse_args()
+
+if args.type == "woff2" and woff2 is None:
+    raise BaseException("The woff2 conversion requires fontTools and brotli \
+(pip install fonttools brotli)")
+
+# Collect the jobs of all the families, so that they share the same pool.
+jobs = []
+hashes = {}
+for family in args.fontfamily:
+    familyJobs, hashes[family] = getFamilyJobs(family, args.type)
+    jobs += familyJobs
+
+if len(jobs) > 0:
+    if args.jobs > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(args.jobs, len(jobs)))
+        try:
+            pool.map(convertFile, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for job in jobs:
+            convertFile(job)
+
+for family in args.fontfamily:
+    f = open("%s/%s.hashes" % (family, args.type), "w")
+    json.dump(hashes[family], f, indent=1, sort_keys=True)
+    f.write("\n")
+    f.close()
+print("%d of %d fonts converted to %s" %
+      (len(jobs), sum([len(hashes[f]) for f in hashes]), args.type))
+
+if args.type == "woff2":
+    printSizeReport(args.fontfamily)
@@ -18,10 +18,16 @@
 
 # This table must be sorted.
 #
-# fontUtil::computeNormalSizeSplitting assumes the table to be sorted. If it
-# does not found a character, it will assume it is "NONUNICODE".
+# fontSplittingIndex assumes the table to be sorted (see verifyFontSplitting).
+# If it does not found a character, fontUtil::computeNormalSizeSplitting will
+# assume it is "NONUNICODE".
 #
 
+from __future__ import print_function
+
+import sys
+from bisect import bisect_right
+
 COPYRIGHT = "Copyright (c) 2013 The MathJax Consortium"
 
 FONTSPLITTING = [
@@ -380,3 +386,213 @@ FONTSPLITTING = [
     ["Variants"], # Used for oldstyle numbers, caligraphic and glyph variants
     ["NonUnicode"] # Font for remaining non-Unicode glyphs
     ]
+
+def verifyFontSplitting(aFontSplitting = FONTSPLITTING):
+    # Check that the entries of each subset are sorted and do not overlap.
+    for subset in aFontSplitting:
+        name = subset[0]
+        codePoint = None
+        for i in range(1, len(subset)):
+            r = subset[i]
+            if type(r) == int:
+                if (codePoint is not None and codePoint >= r):
+                    raise BaseException("Bad entry in FONTSPLITTING>%s: \
+0x%X" % (name, r))
+                else:
+                    codePoint = r
+            else:
+                if (r[1] <= r[0] or
+                    (codePoint is not None and codePoint >= r[0])):
+                    raise BaseException("Bad entry in FONTSPLITTING>%s: \
+(0x%X,0x%X)" % (name, r[0], r[1]))
+                else:
+                    codePoint = r[1]
+
+class familyConfig:
+    # Values of the config.py of a font family, for the tools that read the
+    # configuration of several families.
+    def __init__(self, aFamily):
+        values = {}
+        f = open("%s/config.py" % aFamily)
+        exec(f.read(), values)
+        f.close()
+        self.__dict__.update(values)
+        if self.MAINFONTS is None:
+            self.MAINFONTS = {"Regular": self.MATHFONT}
+
+# Subsets of FONTSPLITTING made of Unicode blocks, which rebalanceSplitting.py
+# and planSplitting.py may cut at other boundaries. The other subsets group
+# characters by style or by font (Fraktur, Script, Size1...).
+BLOCKSUBSETS = ["Latin", "Alphabets", "Marks", "Arrows", "Operators",
+                "Symbols", "Shapes", "Misc"]
+
+def getSplittingSubsets(aFontSplittingExtra, aFontSplitting = FONTSPLITTING):
+    # Return the list of (name, entries) of FONTSPLITTING and
+    # FONTSPLITTING_EXTRA, in the order in which the subsets claim glyphs.
+    rv = []
+    for subset in aFontSplitting:
+        name = subset[0]
+        rv.append((name, subset[1:]))
+        if aFontSplittingExtra is not None and name in aFontSplittingExtra:
+            rv.append((name, aFontSplittingExtra[name]))
+    return rv
+
+def getSplittingEntries(aIntervals):
+    # Merge a list of (start, end) code point intervals into sorted
+    # FONTSPLITTING entries.
+    merged = []
+    for start, end in sorted(aIntervals):
+        if len(merged) > 0 and merged[-1][1] + 1 >= start:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [start if start == end else (start, end) for start, end in merged]
+
+def formatSplittingEntry(aEntry):
+    if type(aEntry) == int:
+        return "0x%04X" % aEntry
+    if type(aEntry[0]) == int:
+        return "(0x%04X, 0x%04X)" % aEntry
+    return '("%s", 0x%04X)' % aEntry
+
+def formatFontSplitting(aFontSplitting, aComments = {}):
+    # Return the Python source of a FONTSPLITTING table, with an optional
+    # comment for each subset.
+    lines = ["FONTSPLITTING = ["]
+    for i in range(0, len(aFontSplitting)):
+        subset = aFontSplitting[i]
+        end = "," if i < len(aFontSplitting) - 1 else ""
+        comment = ""
+        if subset[0] in aComments:
+            comment = " # %s" % aComments[subset[0]]
+        if len(subset) == 1:
+            lines.append('    ["%s"]%s%s' % (subset[0], end, comment))
+            continue
+        lines.append('    ["%s",%s' % (subset[0], comment))
+        for k in range(1, len(subset)):
+            lines.append("     %s%s" % (formatSplittingEntry(subset[k]),
+                                        "," if k < len(subset) - 1 else ""))
+        lines.append("     ]%s" % end)
+    lines.append("    ]")
+    return "\n".join(lines) + "\n"
+
+def formatFontSplittingExtra(aFontSplittingExtra):
+    # Return the Python source of a FONTSPLITTING_EXTRA dictionary.
+    if aFontSplittingExtra is None:
+        return "FONTSPLITTING_EXTRA = None\n"
+    lines = ["FONTSPLITTING_EXTRA = {"]
+    names = sorted(aFontSplittingExtra)
+    for i in range(0, len(names)):
+        entries = aFontSplittingExtra[names[i]]
+        lines.append('    "%s": [' % names[i])
+        for k in range(0, len(entries)):
+            lines.append("        %s%s" % (formatSplittingEntry(entries[k]),
+                                           "," if k < len(entries) - 1 else ""))
+        lines.append("    ]%s" % ("," if i < len(names) - 1 else ""))
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+class fontSplittingIndex:
+    # Compiled form of FONTSPLITTING and of the FONTSPLITTING_EXTRA of a font
+    # family, to find the subset of a code point in O(log n).
+    #
+    # The subsets claim code points in the order of getSplittingSubsets, so
+    # the index is made of sorted, disjoint intervals, each of them keeping
+    # the (rank, entry) of the first subset entry that claims it.
+    def __init__(self, aFontSplittingExtra, aFontSplitting = FONTSPLITTING):
+        verifyFontSplitting(aFontSplitting)
+
+        self.mSubsets = getSplittingSubsets(aFontSplittingExtra,
+                                            aFontSplitting)
+        self.mFontSplittingExtra = aFontSplittingExtra
+        self.mFontSplitting = aFontSplitting
+        self.mTableIndex = None
+        self.mStarts = []
+        self.mEnds = []
+        self.mClaims = []
+
+        # (glyphname, newcodepoint) entries are claimed by name.
+        self.mNameClaims = {}
+
+        for rank in range(0, len(self.mSubsets)):
+            name, entries = self.mSubsets[rank]
+            for i in range(0, len(entries)):
+                r = entries[i]
+                if type(r) == int:
+                    self.addRange(r, r, (rank, i))
+                elif type(r[0]) == int:
+                    if r[1] < r[0]:
+                        print("Warning: ignoring empty range (0x%X,0x%X) in \
+FONTSPLITTING_EXTRA>%s" % (r[0], r[1], name), file=sys.stderr)
+                        continue
+                    self.addRange(r[0], r[1], (rank, i))
+                elif r[0] not in self.mNameClaims:
+                    self.mNameClaims[r[0]] = (rank, i, r[1])
+
+    def addRange(self, aStart, aEnd, aClaim):
+        # Add the parts of [aStart, aEnd] that are not claimed yet.
+        i = bisect_right(self.mStarts, aStart) - 1
+        if i >= 0 and self.mEnds[i] >= aStart:
+            aStart = self.mEnds[i] + 1
+        i += 1
+        while aStart <= aEnd:
+            if i < len(self.mStarts) and self.mStarts[i] <= aEnd:
+                if aStart < self.mStarts[i]:
+                    self.mStarts.insert(i, aStart)
+                    self.mEnds.insert(i, self.mStarts[i+1] - 1)
+                    self.mClaims.insert(i, aClaim)
+                    i += 1
+                aStart = self.mEnds[i] + 1
+                i += 1
+            else:
+                self.mStarts.insert(i, aStart)
+                self.mEnds.insert(i, aEnd)
+                self.mClaims.insert(i, aClaim)
+                break
+
+    def getSubsetNames(self):
+        rv = []
+        for name, entries in self.mSubsets:
+            if name not in rv:
+                rv.append(name)
+        return rv
+
+    def getSubsetName(self, aRank):
+        return self.mSubsets[aRank][0]
+
+    def getClaim(self, aCodePoint):
+        # Return the (rank, entry) claiming the code point or None.
+        i = bisect_right(self.mStarts, aCodePoint) - 1
+        if i >= 0 and aCodePoint <= self.mEnds[i]:
+            return self.mClaims[i]
+        return None
+
+    def getNameClaim(self, aGlyphName):
+        # Return the (rank, entry, newcodepoint) claiming the glyph or None.
+        return self.mNameClaims.get(aGlyphName)
+
+    def getSubset(self, aCodePoint):
+        # Return the name of the subset of the code point or None.
+        claim = self.getClaim(aCodePoint)
+        if claim is None:
+            return None
+        return self.mSubsets[claim[0]][0]
+
+    def getNormalSizeSubset(self, aCodePoint):
+        # Return the name of the subset used for the normal size of a stretchy
+        # operator in the DELIMITERS of fontdata.js, or None. Only the code
+        # points of the Plane 0 PUA are looked up in FONTSPLITTING_EXTRA,
+        # in the order of the dictionary, and the other ones in FONTSPLITTING.
+        if (self.mFontSplittingExtra is not None and
+            0xE000 <= aCodePoint and aCodePoint <= 0xF8FF):
+            for name in self.mFontSplittingExtra:
+                for r in self.mFontSplittingExtra[name]:
+                    if type(r) == int:
+                        if r == aCodePoint:
+                            return name
+                    elif type(r[0]) == int:
+                        if r[0] <= aCodePoint and aCodePoint <= r[1]:
+                            return name
+        if self.mTableIndex is None:
+            self.mTableIndex = fontSplittingIndex(None, self.mFontSplitting)
+        return self.mTableIndex.getSubset(aCodePoint)
@@ -18,35 +18,78 @@
 
 from __future__ import print_function
 
-import sys
+import sys, os, re
+import hashlib, json
 from shutil import copyfile
 import fontforge
-from fontSplitting import FONTSPLITTING, COPYRIGHT
+from lxml import etree
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+from fontSplitting import COPYRIGHT, fontSplittingIndex
+from buildProfile import profiler
 from copy import deepcopy
+from collections import OrderedDict
 from math import ceil
 
+# Fonts opened or built once per run and shared by all the calls to newFont:
+# the X-<weight>.otf PUA sources indexed by weight and the file names of the
+# skeleton fonts indexed by (source font, weight).
+PUAFonts = {}
+skeletonFonts = {}
+
+# Sizes of the temporary font files that exist, indexed by file name, and the
+# peak of their total size, reported by splitFont.py --lowMemory.
+temporaryFiles = {}
+peakTemporaryDiskUse = [0]
+
+def copyTemporaryFile(aFileFrom, aFileName):
+    copyfile(aFileFrom, aFileName)
+    addTemporaryFile(aFileName)
+
+def addTemporaryFile(aFileName):
+    temporaryFiles[aFileName] = os.path.getsize(aFileName)
+    peakTemporaryDiskUse[0] = max(peakTemporaryDiskUse[0],
+                                  sum(temporaryFiles.values()))
+
+def removeTemporaryFile(aFileName):
+    os.remove(aFileName)
+    if aFileName in temporaryFiles:
+        del temporaryFiles[aFileName]
+
+def getPeakTemporaryDiskUse():
+    return peakTemporaryDiskUse[0]
+
 def copyPUAGlyphs(aFont, aWeight):
-    PUAfont = fontforge.open("X-%s.otf" % aWeight)
+    if aWeight not in PUAFonts:
+        PUAFonts[aWeight] = fontforge.open("X-%s.otf" % aWeight)
+    PUAfont = PUAFonts[aWeight]
     PUAfont.selection.select(("ranges", None), 0xEFFD, 0xEFFF)
     PUAfont.copy()
     aFont.selection.select(("ranges", None), 0xEFFD, 0xEFFF)
     aFont.paste()
-    PUAfont.close()
 
-def newFont(aFamily, aFontFrom, aConfig, aName, aWeight):
-    print("New font %s-%s..." % (aName, aWeight))
-
-    # Create a copy of the original font, to preserve all the metadata.
-    fileName = "%s/otf/%s.%s.tmp" % (aFamily, aName, aWeight)
-    copyfile(aFontFrom, fileName)
+def getSkeletonFont(aFamily, aFontFrom, aWeight):
+    # Return the file name of a "skeleton" of the font aFontFrom: a font
+    # with all the metadata of the original font but only the space glyphs
+    # and the PUA glyphs. It is built once per (font, weight) and saved in
+    # the SFD format, which is cheap to copy and reopen.
+    key = (aFontFrom, aWeight)
+    if key in skeletonFonts:
+        return skeletonFonts[key]
 
-    # Now open the new font and rename it.
-    font = fontforge.open(fileName)
+    print("New skeleton font %s-%s..." % (os.path.basename(aFontFrom),
+                                          aWeight))
 
-    font.familyname = "%s %s" % (aConfig.FONTFAMILY_PREFIX, aName)
-    font.fontname = "%s_%s-%s" % (aConfig.FONTNAME_PREFIX, aName, aWeight)
+    # Create a copy of the original font, to preserve all the metadata.
+    # FontForge reads the whole font at once, so the copy can be removed as
+    # soon as it is opened.
+    baseName = "%s/otf/%s.%s" % (aFamily, os.path.basename(aFontFrom), aWeight)
+    copyTemporaryFile(aFontFrom, "%s.tmp" % baseName)
+    font = fontforge.open("%s.tmp" % baseName)
+    removeTemporaryFile("%s.tmp" % baseName)
 
-    font.fullname = font.fontname
     font.encoding = "UnicodeFull"
 
     # Update the copyright notice.
@@ -61,9 +104,48 @@ def newFont(aFamily, aFontFrom, aConfig, aName, aWeight):
     # Copy the three PUA glyphs used to detect Web Fonts availability
     copyPUAGlyphs(font, aWeight)
 
+    fileName = "%s.skeleton.tmp" % baseName
+    font.save(fileName)
+    font.close()
+    addTemporaryFile(fileName)
+
+    skeletonFonts[key] = fileName
+    return fileName
+
+def clearFontCache():
+    # Close the fonts shared by the calls to newFont.
+    for weight in PUAFonts:
+        PUAFonts[weight].close()
+    PUAFonts.clear()
+    for key in skeletonFonts:
+        removeTemporaryFile(skeletonFonts[key])
+    skeletonFonts.clear()
+
+def getFontName(aConfig, aName, aWeight):
+    return "%s_%s-%s" % (aConfig.FONTNAME_PREFIX, aName, aWeight)
+
+def newFont(aFamily, aFontFrom, aConfig, aName, aWeight):
+    print("New font %s-%s..." % (aName, aWeight))
+
+    # Create a copy of the skeleton font. FontForge does not open the same
+    # file twice, so each new font needs its own file. FontForge reads the
+    # whole SFD file at once, so the copy is removed as soon as it is opened.
+    fileName = "%s/otf/%s.%s.tmp" % (aFamily, aName, aWeight)
+    copyTemporaryFile(getSkeletonFont(aFamily, aFontFrom, aWeight), fileName)
+
+    # Now open the new font and rename it.
+    font = fontforge.open(fileName)
+    removeTemporaryFile(fileName)
+
+    font.familyname = "%s %s" % (aConfig.FONTFAMILY_PREFIX, aName)
+    font.fontname = getFontName(aConfig, aName, aWeight)
+
+    font.fullname = font.fontname
+    font.encoding = "UnicodeFull"
+
     return font
 
-def saveFont(aFamily, aFont):
+def saveFont(aFamily, aFont, aManifest = None):
     # Check that the font has more than 6 glyphs before saving it.
     # - the 2 space glyphs (0x20, 0xA0)
     # - the 3 PUA glyphs (0xEFFD, 0xEFFE, 0xEFFF)
@@ -84,9 +166,201 @@ def saveFont(aFamily, aFont):
     # Hence we need to remove that table.
     aFont.math.clear()
 
-    aFont.generate("%s/otf/%s.otf" % (aFamily, aFont.fontname))
-    aFont.generate("%s/ttf/%s.ttf" % (aFamily, aFont.fontname))
-    aFont.generate("%s/svg/%s.svg" % (aFamily, aFont.fontname))
+    fileNames = ["%s/otf/%s.otf" % (aFamily, aFont.fontname),
+                 "%s/ttf/%s.ttf" % (aFamily, aFont.fontname),
+                 "%s/svg/%s.svg" % (aFamily, aFont.fontname)]
+    digestKey = getDigestKey(aFamily, aFont.fontname)
+    digest = getFontDigest(aFamily, aFont)
+
+    if isUpToDate(fileNames, digestKey, digest):
+        print("%s is unchanged since the previous build" % aFont.fontname)
+        profiler.count("fonts unchanged")
+    else:
+        fontGenerator.generate(aFont, fileNames, digestKey, digest)
+        profiler.count("fonts generated")
+
+    if aManifest is not None:
+        # Record the metrics while the font is in memory. The paths are read
+        # from the SVG font once it has been generated.
+        aManifest.add(aFont.fontname, getGlyphMetrics(aFont), fileNames[2])
+
+def getFontDigest(aFamily, aFont):
+    # Return a digest of all the data of aFont that end up in the generated
+    # files, i.e. of the font saved in the SFD format. The times of creation
+    # and modification are ignored, but the FontForge version is not.
+    fileName = "%s/otf/%s.sfd.tmp" % (aFamily, aFont.fontname)
+    aFont.save(fileName)
+    addTemporaryFile(fileName)
+    h = hashlib.sha1()
+    h.update(("%s\n" % fontforge.version()).encode("utf-8"))
+    f = open(fileName, "rb")
+    for line in f:
+        if (line.startswith(b"CreationTime:") or
+            line.startswith(b"ModificationTime:")):
+            continue
+        h.update(line)
+    f.close()
+    removeTemporaryFile(fileName)
+    return h.hexdigest()
+
+# Digests of the generated fonts, indexed by the name of the digest file and
+# then by the name of the font.
+fontDigests = {}
+
+def getDigestKey(aFamily, aFontName):
+    # The digests are kept in FontFamily/otf.digests, outside of the
+    # directories copied to MathJax.
+    return ("%s/otf.digests" % aFamily, aFontName)
+
+def readDigest(aDigestKey):
+    digestFile, fontName = aDigestKey
+    return readDigests(digestFile).get(fontName)
+
+def readDigests(aDigestFile):
+    if aDigestFile not in fontDigests:
+        digests = {}
+        if os.path.exists(aDigestFile):
+            f = open(aDigestFile)
+            digests = json.load(f)
+            f.close()
+        fontDigests[aDigestFile] = digests
+    return fontDigests[aDigestFile]
+
+def writeDigest(aDigestKey, aDigest):
+    # Set (or remove, if aDigest is None) the digest of a font and write the
+    # digest file of its family.
+    digestFile, fontName = aDigestKey
+    digests = readDigests(digestFile)
+    if aDigest is None:
+        digests.pop(fontName, None)
+    else:
+        digests[fontName] = aDigest
+    f = open(digestFile, "w")
+    json.dump(digests, f, indent=1, sort_keys=True)
+    f.close()
+
+def isUpToDate(aFileNames, aDigestKey, aDigest):
+    # Check whether the files were generated from a font with the same digest.
+    for fileName in aFileNames:
+        if not os.path.exists(fileName):
+            return False
+    return readDigest(aDigestKey) == aDigest
+
+class generationPool:
+    # Generate the font files in child processes, at most mJobs at a time.
+    # The children are forked once the font is complete, so each of them
+    # works on its own copy of the font and the caller can modify or close
+    # it as soon as generate() returns. The digests are only written when
+    # the corresponding font files have all been generated.
+    def __init__(self):
+        self.mJobs = 1
+        # Children indexed by pid, in the order in which they were started
+        self.mChildren = OrderedDict()
+        self.mDigests = {}
+        self.mErrors = []
+
+    def generate(self, aFont, aFileNames, aDigestKey, aDigest):
+        # Remove the previous digest, so that an interrupted build is never
+        # considered up to date.
+        writeDigest(aDigestKey, None)
+        self.mDigests[aDigestKey] = [aDigest, len(aFileNames)]
+
+        if self.mJobs <= 1:
+            profiler.start("generate")
+            for fileName in aFileNames:
+                aFont.generate(fileName)
+                self.countBytes(fileName)
+            profiler.stop()
+            self.mDigests[aDigestKey][1] = 0
+            self.writeDigests()
+            return
+
+        for fileName in aFileNames:
+            while len(self.mChildren) >= self.mJobs:
+                self.waitChild()
+
+            # Do not let the child flush the output buffered by the parent.
+            sys.stdout.flush()
+            sys.stderr.flush()
+            readEnd, writeEnd = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(readEnd)
+                status = 0
+                try:
+                    aFont.generate(fileName)
+                except BaseException as e:
+                    os.write(writeEnd, ("%s: %s" % (fileName, e)).\
+                             encode("utf-8"))
+                    status = 1
+                os._exit(status)
+            os.close(writeEnd)
+            self.mChildren[pid] = (fileName, readEnd, aDigestKey)
+
+    def waitChild(self):
+        # Only wait for our own children: the caller may have forked other
+        # processes that it reaps itself. Poll the children without blocking
+        # and block on the oldest one when none of them has finished.
+        pid = 0
+        for child in list(self.mChildren.keys()):
+            pid, status = os.waitpid(child, os.WNOHANG)
+            if pid != 0:
+                break
+        if pid == 0:
+            pid = list(self.mChildren.keys())[0]
+            pid, status = os.waitpid(pid, 0)
+        fileName, readEnd, digestKey = self.mChildren.pop(pid)
+        message = b""
+        while True:
+            data = os.read(readEnd, 4096)
+            if not data:
+                break
+            message += data
+        os.close(readEnd)
+        if status != 0:
+            if len(message) == 0:
+                message = ("%s: exit status %d" % (fileName, status)).\
+                    encode("utf-8")
+            self.mErrors.append(message.decode("utf-8"))
+            self.mDigests.pop(digestKey, None)
+        else:
+            self.countBytes(fileName)
+            if digestKey in self.mDigests:
+                self.mDigests[digestKey][1] -= 1
+
+    def countBytes(self, aFileName):
+        # Add the size of a generated file to the counter of its format.
+        extension = os.path.splitext(aFileName)[1][1:]
+        profiler.count("bytes written (%s)" % extension,
+                       os.path.getsize(aFileName))
+
+    def writeDigests(self):
+        for digestKey in list(self.mDigests.keys()):
+            digest, remaining = self.mDigests[digestKey]
+            if remaining == 0:
+                writeDigest(digestKey, digest)
+                del self.mDigests[digestKey]
+
+    def wait(self):
+        while len(self.mChildren) > 0:
+            self.waitChild()
+        self.writeDigests()
+        if len(self.mErrors) > 0:
+            errors = self.mErrors
+            self.mErrors = []
+            raise BaseException("Unable to generate the fonts:\n%s" %
+                                "\n".join(errors))
+
+# Pool shared by all the calls to saveFont
+fontGenerator = generationPool()
+
+def setGenerationJobs(aJobs):
+    # Set the number of font files generated in parallel by saveFont.
+    fontGenerator.mJobs = aJobs
+
+def waitForGeneration():
+    # Wait until all the font files passed to saveFont have been generated.
+    fontGenerator.wait()
 
 def hasNonEmptyGlyph(aFont, aGlyphName):
     # Check that the font has the glyph and that this glyph is not empty.
@@ -96,57 +370,414 @@ def hasNonEmptyGlyph(aFont, aGlyphName):
 
     return True
 
-def moveGlyph(aFontFrom, aFontTo, aOldPosition, aNewPosition = None):
-    # Ignore glyphs that have already been deleted before
-    # (Otherwise, FontForge will copy them as "blank" glyphs)
-    if not hasNonEmptyGlyph(aFontFrom, aOldPosition):
-        return
-
-    # Move the glyph from the font aFontFrom at position aOldPosition
-    # to the font aFontTo at position aNewPosition. 
-    if aNewPosition is None:
-        aNewPosition = aOldPosition
-    aFontFrom.selection.select(aOldPosition)
-    aFontFrom.cut()
-    aFontTo.selection.select(aNewPosition)
-    aFontTo.paste()
-
-def moveRange(aFontFrom, aFontTo, aRangeStart, aRangeEnd):
-    # Move the glyphs in the range [aRangeStart, aRangeEnd]
-    # from the font aFontFrom to the font aFontTo.
-    for codePoint in range(aRangeStart, aRangeEnd+1):
-        moveGlyph(aFontFrom, aFontTo, codePoint)
-
-def moveSubset(aFontFrom, aFontTo, aSubset):
-    for r in aSubset:
-        if type(r) == int:
-            # Single code point: move one glyph.
-            moveGlyph(aFontFrom, aFontTo, r)
-        elif type(r) == tuple:
-            if type(r[0]) == int:
-                # (start, end): move the range of glyphs.
-                moveRange(aFontFrom, aFontTo, r[0], r[1])
-            elif type(r[0]) == str:
-                # (glyphname, newcodepoint): move a non-Unicode glyph
-                moveGlyph(aFontFrom, aFontTo, r[0], r[1])
-
-def removeSubset(aFont, aSubset):
-    aFont.selection.none()
+def getGlyphMoves(aFontFrom, aGlyphs):
+    # Return the (encoding, oldposition, newposition) of the glyphs of the
+    # list of (oldposition, newposition) that moveGlyphs actually moves,
+    # sorted by encoding in aFontFrom.
+    moves = []
+    moved = set()
+    for oldPosition, newPosition in aGlyphs:
+        # Ignore glyphs that have already been deleted before
+        # (Otherwise, FontForge will copy them as "blank" glyphs)
+        if not hasNonEmptyGlyph(aFontFrom, oldPosition):
+            continue
+        glyph = aFontFrom[oldPosition]
+        if glyph.glyphname in moved:
+            continue
+        moved.add(glyph.glyphname)
+        if type(oldPosition) == int:
+            encoding = oldPosition
+        else:
+            encoding = glyph.encoding
+        moves.append((encoding, oldPosition, newPosition))
+    moves.sort()
+    return moves
+
+def moveGlyphs(aFontFrom, aFontTo, aGlyphs):
+    # Move the glyphs of the list of (oldposition, newposition) from the font
+    # aFontFrom to the font aFontTo, using one selection and a single
+    # cut/paste round-trip for each batch of glyphs.
+    #
+    # FontForge copies the selected glyphs in the encoding order of aFontFrom
+    # and pastes them in the encoding order of aFontTo, so a batch is a run of
+    # glyphs whose new positions increase with their old positions.
+    moves = getGlyphMoves(aFontFrom, aGlyphs)
+    profiler.count("glyphs moved", len(moves))
+
+    batches = []
+    for move in moves:
+        if len(batches) == 0 or batches[-1][-1][2] >= move[2]:
+            batches.append([])
+        batches[-1].append(move)
+
+    for batch in batches:
+        aFontFrom.selection.none()
+        aFontFrom.selection.select(("more", None), *[m[1] for m in batch])
+        aFontFrom.cut()
+        aFontTo.selection.none()
+        aFontTo.selection.select(("more", None), *[m[2] for m in batch])
+        aFontTo.paste()
+
+def clearGlyphs(aFont, aGlyphs):
+    # Remove from aFont the glyphs that moveGlyphs would move, when the font
+    # they would be moved to is restored from the build cache.
+    moves = getGlyphMoves(aFont, aGlyphs)
+    if len(moves) > 0:
+        aFont.selection.none()
+        aFont.selection.select(("more", None), *[m[1] for m in moves])
+        aFont.clear()
+
+def isInSubset(aSubset, aCodePoint):
+    # Check whether the code point is listed in the subset, either as a single
+    # code point or as part of a (start, end) range.
     for r in aSubset:
         if type(r) == int:
-            # Single code point: select one glyph.
-            aFont.selection.select(("more",None),r)
-        elif type(r) == tuple:
-            # (start, end): move the range of glyphs.
-            aFont.selection.select(("ranges","more"), r[0], r[1])
-    aFont.clear()
+            if r == aCodePoint:
+                return True
+        elif type(r) == tuple and type(r[0]) == int:
+            if r[0] <= aCodePoint and aCodePoint <= r[1]:
+                return True
+    return False
+
+def planSubsets(aFont, aIndex, aRemove = None):
+    # Assign each glyph of aFont to the first subset of the fontSplittingIndex
+    # aIndex that claims its name, its code point or one of its alternate code
+    # points, walking the glyphs of the font only once. Glyphs assigned to a
+    # code point listed in aRemove are dropped instead.
+    #
+    # Return a pair (plan, removed) where plan maps each subset name to the
+    # list of (glyphname, newcodepoint) to move, in the order of the subset
+    # entries, and removed is the list of the names of the dropped glyphs.
+    claims = {}
+    for name in aIndex.getSubsetNames():
+        claims[name] = []
+    removed = []
+
+    # The glyphs are also encoded at their alternate code points, unless
+    # another glyph has that code point.
+    glyphs = []
+    encoded = set()
+    for glyph in aFont.glyphs():
+        if glyph.unicode != -1:
+            encoded.add(glyph.unicode)
+        if glyph.isWorthOutputting():
+            glyphs.append((glyph.glyphname, glyph.unicode, glyph.altuni))
+
+    for glyphname, codePoint, altuni in glyphs:
+        claim = aIndex.getNameClaim(glyphname)
+
+        # Like the code point by code point moves, claim the glyph at the
+        # first of its code points in the order of the subsets, of their
+        # entries and of the ranges.
+        codePoints = []
+        if codePoint != -1:
+            codePoints.append(codePoint)
+        if altuni is not None:
+            codePoints += [alt[0] for alt in altuni
+                           if alt[1] == -1 and alt[0] not in encoded]
+        for v in codePoints:
+            c = aIndex.getClaim(v)
+            if c is not None and (claim is None or c + (v,) < claim[0:3]):
+                claim = c + (v,)
+
+        if claim is None:
+            continue
 
-def getTestString(aFont, aMaxLength):
+        if aRemove is not None and isInSubset(aRemove, claim[2]):
+            removed.append(glyphname)
+        else:
+            claims[aIndex.getSubsetName(claim[0])].append(claim +
+                                                         (glyphname,))
+
+    plan = {}
+    for name in claims:
+        claims[name].sort()
+        plan[name] = [(c[3], c[2]) for c in claims[name]]
+
+    return (plan, removed)
+
+# Plane 0 Private Use Area
+PUASTART = 0xE000
+PUAEND = 0xF8FF
+
+class puaAllocator:
+    # Allocator of the code points of the Plane 0 PUA of a font. The occupied
+    # code points are kept in a bitmap and the free ones are assigned in
+    # increasing order from a cursor that only moves forward, so the
+    # assignments are deterministic and finding the next free code point is
+    # O(1) amortized.
+    def __init__(self, aOccupied = ()):
+        self.mBitmap = bytearray(PUAEND - PUASTART + 1)
+        self.mCursor = 0
+        self.mUsed = 0
+        for codePoint in aOccupied:
+            self.occupy(codePoint)
+
+    def occupy(self, aCodePoint):
+        if aCodePoint < PUASTART or aCodePoint > PUAEND:
+            return
+        if not self.mBitmap[aCodePoint - PUASTART]:
+            self.mBitmap[aCodePoint - PUASTART] = 1
+            self.mUsed += 1
+
+    def isFree(self, aCodePoint):
+        return not self.mBitmap[aCodePoint - PUASTART]
+
+    def allocate(self):
+        # Return the first free code point after the last allocated one.
+        while (self.mCursor < len(self.mBitmap) and
+               self.mBitmap[self.mCursor]):
+            self.mCursor += 1
+        if self.mCursor >= len(self.mBitmap):
+            raise BaseException("Too many characters in the Plane 0 PUA. Not supported by the font splitter.")
+        self.mBitmap[self.mCursor] = 1
+        self.mUsed += 1
+        self.mCursor += 1
+        return PUASTART + self.mCursor - 1
+
+    def getUsage(self):
+        # Return the number of occupied code points and the size of the PUA.
+        return (self.mUsed, len(self.mBitmap))
+
+    def report(self, aName):
+        used, size = self.getUsage()
+        print("%s: %d of the %d code points of the Plane 0 PUA used (%d%%)" %
+              (aName, used, size, 100 * used // size))
+
+def planNonUnicode(aFont, aMovedNonUnicodeGlyphs, aCleared = ()):
+    # Assign a code point of the Plane 0 PUA of the NonUnicode font to the
+    # non-Unicode glyphs of aFont (or those of the other planes of the PUA)
+    # that were not already copied into the SizeN fonts. The glyphs named in
+    # aCleared are considered empty.
+    #
+    # Return (nonUnicode, allocator) where nonUnicode is the list of
+    # (glyphname, PUA code point) of the glyphs to move and allocator the
+    # puaAllocator of the NonUnicode font.
+    #
+    # newFont puts the style glyphs 0xEFFD-0xEFFF in the NonUnicode font, so
+    # they are never allocated.
+    occupied = list(range(0xEFFD, 0xF000))
+    candidates = []
+    for g in aFont.glyphs():
+
+        v = g.unicode
+
+        if PUASTART <= v and v <= PUAEND:
+            # The Plane 0 PUA glyphs stay where they are.
+            if (g.glyphname not in aCleared and g.isWorthOutputting()):
+                occupied.append(v)
+            continue
+
+        if g.altuni is not None:
+            for a in g.altuni:
+                if (a[1] == -1 and PUASTART <= a[0] and a[0] <= PUAEND and
+                    g.glyphname not in aCleared and g.isWorthOutputting()):
+                    occupied.append(a[0])
+
+        if (g.glyphname == ".notdef" or
+            not(v == -1 or
+                (0xF0000 <= v and v <= 0xFFFFD) or
+                (0x100000 <= v and v <= 0x10FFFD))):
+            # Ignore .notdef and Unicode glyphs
+            continue
+
+        if g.glyphname in aMovedNonUnicodeGlyphs:
+            # This was already copied into SizeN.
+            continue
+
+        candidates.append(g)
+
+    allocator = puaAllocator(occupied)
+    nonUnicode = []
+    for g in candidates:
+        # Empty glyphs still consume a code point, as they always did.
+        codePoint = allocator.allocate()
+        if g.glyphname not in aCleared and g.isWorthOutputting():
+            nonUnicode.append((g.glyphname, codePoint))
+
+    return (nonUnicode, allocator)
+
+def planMainFont(aFont, aIndex, aRemove, aMovedNonUnicodeGlyphs):
+    # Compute how splitFont.py splits the main font aFont, without modifying
+    # it. Return (plan, removed, nonUnicode) where plan and removed are those
+    # of planSubsets and nonUnicode is that of planNonUnicode.
+    plan, removed = planSubsets(aFont, aIndex, aRemove)
+
+    # The glyphs cut or cleared before the NonUnicode font is built. FontForge
+    # still iterates them, but they are empty.
+    cleared = set(removed)
+    for name in plan:
+        for glyphname, codePoint in plan[name]:
+            cleared.add(glyphname)
+
+    nonUnicode, allocator = planNonUnicode(aFont, aMovedNonUnicodeGlyphs,
+                                           cleared)
+    return (plan, removed, nonUnicode)
+
+# Rough size of a point in the charstrings of the generated fonts (an
+# operator and two coordinates), used to estimate the size of the outlines.
+OUTLINE_BYTES_PER_POINT = 4
+
+def getPointCount(aGlyph):
+    # Number of points of a FontForge glyph or of a cached sourceGlyph
+    if hasattr(aGlyph, "getPointCount"):
+        return aGlyph.getPointCount()
+    n = 0
+    for contour in aGlyph.foreground:
+        n += len(contour)
+    return n
+
+def estimateOutlineSize(aFont, aGlyphNames):
+    # Estimate the size in bytes of the outlines of the glyphs of aFont.
+    size = 0
+    for glyphname in aGlyphNames:
+        size += OUTLINE_BYTES_PER_POINT * getPointCount(aFont[glyphname])
+    return size
+
+def readSVGGlyphPaths(aFileName):
+    # Read the SVG font generated by FontForge in a single streaming pass and
+    # return a dict mapping each glyph name to the path description of the
+    # glyph, without the initial "M" and the final "Z". Each element is freed
+    # as soon as it has been read, so that the whole DOM is never in memory.
+    #
+    # No need for namespaces={'s': 'http://www.w3.org/2000/svg'},
+    # as Font Forge does not attach any xmlns namespace to the <svg> root
+    paths = {}
+    for event, element in etree.iterparse(aFileName, events=("end",),
+                                          tag="glyph"):
+        name = element.get("glyph-name")
+        if name not in paths:
+            path = element.get("d")
+            if path is None:
+                path = ""
+            else:
+                path = re.match(r"^M(.*)Z", path, flags=re.IGNORECASE).group(1)
+            paths[name] = path
+
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+    return paths
+
+def addSVGGlyphPaths(aMetrics, aFileName):
+    # Set the SVG path of each glyphMetrics of the list from the SVG font.
+    paths = readSVGGlyphPaths(aFileName)
+    for glyph in aMetrics:
+        if glyph.mName not in paths:
+            print(glyph.mName)
+            raise BaseException("Unable to find the glyph")
+        glyph.mPath = paths[glyph.mName]
+
+class glyphMetrics(object):
+    # Metrics of a glyph, as written in the Main.js files:
+    # height, depth, width, left and right bearings.
+    __slots__ = ("mName", "mUnicode", "mHeight", "mDepth",
+                 "mWidth", "mLeft", "mRight", "mPath")
+
+    def __init__(self, aGlyph):
+        self.mName = aGlyph.glyphname
+        self.mUnicode = aGlyph.unicode
+        b = aGlyph.boundingBox() # (xmin, ymin, xmax, ymax)
+        self.mHeight = b[3]
+        self.mDepth = -b[1]
+        self.mWidth = aGlyph.width
+        self.mLeft = aGlyph.left_side_bearing
+        self.mRight = aGlyph.width - aGlyph.right_side_bearing
+        self.mPath = None
+
+    # pickle does not support __slots__ without these.
+    def __getstate__(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    def __setstate__(self, aState):
+        for i in range(0, len(self.__slots__)):
+            setattr(self, self.__slots__[i], aState[i])
+
+def getGlyphMetrics(aFont):
+    # Return the list of glyphMetrics of the glyphs of the font that are
+    # written in the Main.js files.
+    rv = []
+    for glyph in aFont.glyphs():
+
+        if glyph.glyphname in [".notdef", ".null", "nonmarkingreturn"]:
+            continue
+
+        if not glyph.isWorthOutputting():
+            # Not written in the generated fonts
+            continue
+
+        v = glyph.unicode
+
+        if (v == -1 or (0xEFFD <= v and v <= 0xEFFF)):
+            # Ignore non-Unicode and PUA glyphs
+            continue
+
+        rv.append(glyphMetrics(glyph))
+
+    return rv
+
+class fontManifest:
+    # Metrics of the generated fonts, indexed by font name. saveFont records
+    # them when it generates the fonts, so that the fontdata.js and Main.js
+    # files can be written without opening the generated fonts again.
+    #
+    # The paths of the glyphs are only read from the SVG fonts when the
+    # metrics are requested, since the SVG fonts may still be generated in
+    # the background when the fonts are saved. If aSpillDirectory is not
+    # None, the metrics are pickled in that directory instead of being kept
+    # in memory.
+    def __init__(self, aSpillDirectory = None):
+        self.mSpillDirectory = aSpillDirectory
+        self.mFonts = {}
+
+    def __contains__(self, aFontName):
+        return aFontName in self.mFonts
+
+    def add(self, aFontName, aMetrics, aSVGFileName):
+        if self.mSpillDirectory is None:
+            self.mFonts[aFontName] = (aMetrics, aSVGFileName)
+            return
+        fileName = "%s/%s.metrics" % (self.mSpillDirectory, aFontName)
+        f = open(fileName, "wb")
+        pickle.dump(aMetrics, f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+        addTemporaryFile(fileName)
+        self.mFonts[aFontName] = (fileName, aSVGFileName)
+
+    def addFromFiles(self, aFamily, aFontName):
+        # Read the metrics of a font generated by a previous run.
+        font = fontforge.open("%s/otf/%s.otf" % (aFamily, aFontName))
+        metrics = getGlyphMetrics(font)
+        font.close()
+        self.add(aFontName, metrics, "%s/svg/%s.svg" % (aFamily, aFontName))
+
+    def update(self, aFonts):
+        # Merge the mFonts of the manifest of another process.
+        self.mFonts.update(aFonts)
+
+    def getFontNames(self):
+        return sorted(self.mFonts.keys())
+
+    def loadMetrics(self, aFontName):
+        # Return the metrics of the font, without the paths of the glyphs.
+        metrics = self.mFonts[aFontName][0]
+        if self.mSpillDirectory is not None:
+            f = open(metrics, "rb")
+            metrics = pickle.load(f)
+            f.close()
+        return metrics
+
+    def getMetrics(self, aFontName):
+        metrics = self.loadMetrics(aFontName)
+        addSVGGlyphPaths(metrics, self.mFonts[aFontName][1])
+        return metrics
+
+def makeTestString(aCodePoints, aMaxLength):
     s = ""
     # Pick at most 10 glyphs from the font to build a test string
     i = aMaxLength
-    for glyph in aFont.glyphs():
-        v = glyph.unicode
+    for v in aCodePoints:
 
         if (0xEFFD <= v and v <= 0xEFFF):
             # Ignore PUA glyphs
@@ -173,6 +804,73 @@ def getTestString(aFont, aMaxLength):
 
     return s
 
+def getTestString(aFont, aMaxLength):
+    return makeTestString([glyph.unicode for glyph in aFont.glyphs()],
+                          aMaxLength)
+
+class fontPool:
+    # Handles of the source fonts, shared by the splitter and the main font
+    # loop of splitFont.py. A font is opened on its first use and stays open
+    # until it is taken or the pool is closed. If aMaxOpenFonts > 0, the
+    # least recently used fonts that are not pinned are closed before a new
+    # one is opened, so that at most aMaxOpenFonts fonts are open at the same
+    # time (pinned fonts excepted).
+    def __init__(self, aMaxOpenFonts = 0):
+        self.mMaxOpenFonts = aMaxOpenFonts
+        self.mFonts = {}
+        self.mPins = {}
+        self.mLastUse = {}
+        self.mClock = 0
+
+    def get(self, aFileName):
+        # Return the handle of the font aFileName. It may be closed by later
+        # calls to get, unless it is pinned.
+        self.mClock += 1
+        if aFileName not in self.mFonts:
+            self.reserve()
+            self.mFonts[aFileName] = fontforge.open(aFileName)
+            self.mPins[aFileName] = 0
+        self.mLastUse[aFileName] = self.mClock
+        return self.mFonts[aFileName]
+
+    def reserve(self):
+        # Close fonts until a new one can be opened.
+        if self.mMaxOpenFonts <= 0:
+            return
+        while len(self.mFonts) >= self.mMaxOpenFonts:
+            unpinned = [(self.mLastUse[f], f) for f in self.mFonts
+                        if self.mPins[f] == 0]
+            if len(unpinned) == 0:
+                return
+            self.discard(min(unpinned)[1])
+
+    def pin(self, aFileName):
+        font = self.get(aFileName)
+        self.mPins[aFileName] += 1
+        return font
+
+    def release(self, aFileName):
+        self.mPins[aFileName] -= 1
+
+    def take(self, aFileName):
+        # Return the handle of the font aFileName and remove it from the pool,
+        # reusing the open handle if there is one. The caller may modify the
+        # font and must close it.
+        font = self.get(aFileName)
+        del self.mFonts[aFileName]
+        del self.mPins[aFileName]
+        del self.mLastUse[aFileName]
+        return font
+
+    def discard(self, aFileName):
+        # Close the font aFileName if it is open.
+        if aFileName in self.mFonts:
+            self.take(aFileName).close()
+
+    def close(self):
+        for fileName in list(self.mFonts.keys()):
+            self.discard(fileName)
+
 class stretchyOp:
     def __init__(self, aIsHorizontal):
         self.mIsHorizontal = aIsHorizontal
@@ -180,23 +878,71 @@ class stretchyOp:
         self.mComponents = None
         self.mAlias = None
 
+class stretchyGlyph:
+    # Entry of the index of the glyphs of the math font that have size
+    # variants or components in the MATH table. The variant lists are split
+    # once, when the index is built.
+    def __init__(self, aGlyph):
+        self.glyphname = aGlyph.glyphname
+        self.unicode = aGlyph.unicode
+        self.mHorizontalVariants = None
+        if aGlyph.horizontalVariants is not None:
+            self.mHorizontalVariants = aGlyph.horizontalVariants.split()
+        self.mVerticalVariants = None
+        if aGlyph.verticalVariants is not None:
+            self.mVerticalVariants = aGlyph.verticalVariants.split()
+        self.mHorizontalComponents = aGlyph.horizontalComponents
+        self.mVerticalComponents = aGlyph.verticalComponents
+
+    def hasVariants(self):
+        return (self.mHorizontalVariants is not None or
+                self.mVerticalVariants is not None)
+
+    def hasComponents(self):
+        return (self.mHorizontalComponents is not None or
+                self.mVerticalComponents is not None)
+
 class mathFontSplitter:
-    def __init__(self, aFontFamily, aFontDir, aConfig):
+    def __init__(self, aFontFamily, aFontDir, aConfig, aSplittingIndex = None,
+                 aSourceFonts = None, aFontPool = None, aDryRun = False):
         self.mFontFamily = aFontFamily
 
+        # In a dry run, the split is only computed: the Size* fonts are not
+        # created and the source fonts are read from aSourceFonts if possible.
+        self.mDryRun = aDryRun
+        self.mSourceFonts = aSourceFonts
+
         self.mDelimiters = aConfig.DELIMITERS
         self.mDelimitersExtra = aConfig.DELIMITERS_EXTRA
         self.mFontSplittingExtra = aConfig.FONTSPLITTING_EXTRA
 
-        # Open the fonts
-        self.mMathFont = fontforge.open("%s/%s" % (aFontDir, aConfig.MATHFONT))
-        self.mMainFonts = {}
+        # Index of FONTSPLITTING and FONTSPLITTING_EXTRA
+        if aSplittingIndex is None:
+            aSplittingIndex = fontSplittingIndex(self.mFontSplittingExtra)
+        self.mSplittingIndex = aSplittingIndex
+
+        # Inputs of the Size* fonts, used as the key of the build cache
+        self.mCacheInputs = [aConfig.FONTNAME_PREFIX,
+                             aConfig.FONTFAMILY_PREFIX,
+                             aConfig.DELIMITERS,
+                             aConfig.FONTSPLITTING_EXTRA]
+
+        # The fonts are opened from the pool when they are first used. The
+        # math font is pinned while the splitter works on it.
+        if aFontPool is None:
+            aFontPool = fontPool()
+        self.mFontPool = aFontPool
+        self.mMathFontFile = "%s/%s" % (aFontDir, aConfig.MATHFONT)
+        self.mMathFont = None
+        self.mMainFontFiles = {}
         for key in aConfig.MAINFONTS:
-            self.mMainFonts[key] = \
-                fontforge.open("%s/%s" % (aFontDir, aConfig.MAINFONTS[key]))
+            self.mMainFontFiles[key] = "%s/%s" % (aFontDir,
+                                                  aConfig.MAINFONTS[key])
 
-        # Pointer to the PUA to store the horizontal/vertical components
-        self.mPUAPointer=0xE000
+        # PUA of the largest size font, where the horizontal/vertical
+        # components are stored. newFont puts the style glyphs 0xEFFD-0xEFFF
+        # in every font.
+        self.mPUA=puaAllocator(range(0xEFFD, 0xF000))
         self.mPUAContent=dict()
 
         self.mMovedNonUnicodeGlyphs=dict()
@@ -207,16 +953,32 @@ class mathFontSplitter:
         # List of normal size glyphs
         self.mNormalSize=[]
 
-        # Determine the maximum size
-        self.mMaxSize = 0
-        for glyph in self.mMathFont.glyphs():
+        profiler.start("MATH table scan")
+
+        # Index the Unicode glyphs with stretchy data in a single pass over
+        # the math font, read from the glyph cache if one is available.
+        if aSourceFonts is not None:
+            mathFont = aSourceFonts.getFont(self.mMathFontFile)
+        else:
+            mathFont = self.mFontPool.get(self.mMathFontFile)
+        self.mStretchyGlyphs = []
+        for glyph in mathFont.glyphs():
             if (glyph.unicode == -1):
                 continue
+            if (glyph.horizontalVariants is None and
+                glyph.verticalVariants is None and
+                glyph.horizontalComponents is None and
+                glyph.verticalComponents is None):
+                continue
+            self.mStretchyGlyphs.append(stretchyGlyph(glyph))
 
-            if (glyph.horizontalVariants is not None):
-                variants = glyph.horizontalVariants.split()
-            elif (glyph.verticalVariants is not None):
-                variants = glyph.verticalVariants.split()
+        # Determine the maximum size
+        self.mMaxSize = 0
+        for glyph in self.mStretchyGlyphs:
+            if (glyph.mHorizontalVariants is not None):
+                variants = glyph.mHorizontalVariants
+            elif (glyph.mVerticalVariants is not None):
+                variants = glyph.mVerticalVariants
             else:
                 continue
 
@@ -225,30 +987,45 @@ class mathFontSplitter:
                 n -= 1 # ignore the normal size variant
             self.mMaxSize = max(self.mMaxSize, n)
 
+        profiler.stop()
+
+        # (glyph name, code point) of the glyphs copied into each size
+        self.mSizeGlyphs = []
+        for i in range(0, self.mMaxSize):
+            self.mSizeGlyphs.append([])
+
         # Create a new font for each size
         self.mMathSize=[]
         for i in range(0, self.mMaxSize):
+            if self.mDryRun:
+                break
             self.mMathSize.append(newFont(self.mFontFamily,
                                           "%s/%s" % (aFontDir,
                                                      aConfig.MATHFONT),
                                           aConfig,
                                           "Size%d" % (i+1), "Regular"))
         
-    def split(self):
-        # Browse the list of all glyphs to find those with stretchy data
-        for glyph in self.mMathFont.glyphs():
+    def isReadingSourceFonts(self):
+        return self.mDryRun and self.mSourceFonts is not None
 
-            if (glyph.unicode == -1):
-                continue
+    def getMainFont(self, aStyle):
+        if self.isReadingSourceFonts():
+            return self.mSourceFonts.getFont(self.mMainFontFiles[aStyle])
+        return self.mFontPool.get(self.mMainFontFiles[aStyle])
 
-            hasVariants = (glyph.horizontalVariants is not None or
-                           glyph.verticalVariants is not None)
-            hasComponents = (glyph.horizontalComponents is not None or
-                             glyph.verticalComponents is not None)
+    def split(self, aManifest = None, aCache = None):
+        if self.isReadingSourceFonts():
+            self.mMathFont = self.mSourceFonts.getFont(self.mMathFontFile)
+        else:
+            self.mMathFont = self.mFontPool.pin(self.mMathFontFile)
 
-            if (not hasVariants and not hasComponents):
-                # skip non-stretchy glyphs
-                continue
+        profiler.start("size variants")
+
+        # Browse the list of the glyphs with stretchy data
+        for glyph in self.mStretchyGlyphs:
+
+            hasVariants = glyph.hasVariants()
+            hasComponents = glyph.hasComponents()
 
             if (glyph.unicode in self.mDelimiters):
                 item = self.mDelimiters[glyph.unicode]
@@ -259,10 +1036,10 @@ stretchy operators from the Open Type MATH table but is redefined in DELIMITERS.
                     # skip this operator since it is redefined in config.py
                     continue
 
-            if ((glyph.horizontalVariants is not None and
-                 glyph.verticalVariants is not None) or
-                (glyph.horizontalComponents is not None and
-                 glyph.verticalComponents is not None)):
+            if ((glyph.mHorizontalVariants is not None and
+                 glyph.mVerticalVariants is not None) or
+                (glyph.mHorizontalComponents is not None and
+                 glyph.mVerticalComponents is not None)):
                 raise BaseException("Unable to determine direction")
         
             print("%s" % glyph.glyphname)
@@ -270,8 +1047,8 @@ stretchy operators from the Open Type MATH table but is redefined in DELIMITERS.
             # We always use the normal font for the size=0 variant
             self.mNormalSize.append(glyph.unicode)
 
-            isHorizontal = (glyph.horizontalVariants is not None or
-                            glyph.horizontalComponents is not None)
+            isHorizontal = (glyph.mHorizontalVariants is not None or
+                            glyph.mHorizontalComponents is not None)
 
             operator = stretchyOp(isHorizontal)
 
@@ -280,13 +1057,13 @@ stretchy operators from the Open Type MATH table but is redefined in DELIMITERS.
                     # Copy horizontal size variants
                     operator.mSizeVariants = \
                         self.copySizeVariants(glyph,
-                                              glyph.horizontalVariants.split(),
+                                              list(glyph.mHorizontalVariants),
                                               isHorizontal)
                 else:
                     # Copy vertical size variants
                     operator.mSizeVariants = \
                         self.copySizeVariants(glyph,
-                                              glyph.verticalVariants.split(),
+                                              list(glyph.mVerticalVariants),
                                               isHorizontal)
             else:
                 # Just pass an empty table, the normal size character will
@@ -298,12 +1075,12 @@ stretchy operators from the Open Type MATH table but is redefined in DELIMITERS.
                 if isHorizontal:
                     # Copy horizontal components
                     operator.mComponents = \
-                        self.copyComponents(glyph.horizontalComponents,
+                        self.copyComponents(glyph.mHorizontalComponents,
                                             isHorizontal)
                 else:
                     # Copy vertical components
                     operator.mComponents = \
-                        self.copyComponents(glyph.verticalComponents,
+                        self.copyComponents(glyph.mVerticalComponents,
                                             isHorizontal)
 
             self.mStretchyOperators[glyph.unicode] = operator
@@ -311,9 +1088,34 @@ stretchy operators from the Open Type MATH table but is redefined in DELIMITERS.
         # Add custom operators
         self.addStretchyOperators(self.mDelimiters)
 
+        self.mPUA.report("Size%d" % self.mMaxSize)
+        profiler.stop()
+
         # Finally, save the new fonts
         for font in self.mMathSize:
-            saveFont(self.mFontFamily, font)
+            if aCache is not None and aCache.isEnabled():
+                key = aCache.getKey(self.getCacheInputs(aCache, font))
+                if not aCache.restore(key, font.fontname, aManifest):
+                    saveFont(self.mFontFamily, font, aManifest)
+                    aCache.add(key, font.fontname)
+            else:
+                saveFont(self.mFontFamily, font, aManifest)
+            font.close()
+        self.mMathSize = []
+
+        # The source fonts are no longer needed by the splitter.
+        if not self.isReadingSourceFonts():
+            self.mFontPool.release(self.mMathFontFile)
+        self.mMathFont = None
+
+    def getCacheInputs(self, aCache, aFont):
+        # Return the inputs of the Size* font aFont: the source fonts from
+        # which the variants and components are copied and the configuration
+        # of the stretchy operators.
+        inputs = [aFont.fontname, aCache.getFileHash(self.mMathFontFile)]
+        for key in sorted(self.mMainFontFiles):
+            inputs.append(aCache.getFileHash(self.mMainFontFiles[key]))
+        return inputs + self.mCacheInputs
 
     def addStretchyOperators(self, aStretchyOperators):
         # Add some stretchy operators that are not in the Open Type Math table
@@ -428,29 +1230,7 @@ operators. Please add a construction for it in DELIMITERS." %
             variants2.reverse()
             self.mStretchyOperators[codePoint].mSizeVariants = variants2
 
-    def verifyFONTSPLITTING(self):
-        for subset in FONTSPLITTING:
-            name = subset[0]
-            codePoint = None
-            for i in range(1, len(subset)):
-                r = subset[i]
-                if type(r) == int:
-                    if (codePoint is not None and codePoint >= r):
-                        raise BaseException("Bad entry in FONTSPLITTING>%s: \
-0x%X" % (name, r))
-                    else:
-                        codePoint = r
-                else:
-                    if (r[1] <= r[0] or
-                        (codePoint is not None and codePoint >= r[0])):
-                        raise BaseException("Bad entry in FONTSPLITTING>%s: \
-(0x%X,0x%X)" % (name, r[0], r[1]))
-                    else:
-                        codePoint = r[1]
-
     def computeNormalSizeSplitting(self):
-        self.verifyFONTSPLITTING()
-
         # Determine the name of the font to use for the fontSize variant
         size0 = dict()
         for codePoint in self.mNormalSize:
@@ -458,50 +1238,11 @@ operators. Please add a construction for it in DELIMITERS." %
                 # Ignore duplicate
                 continue
 
-            found = False
-
-            if 0xE000 <= codePoint and codePoint <= 0xF8FF:
-                # Try to find the glyph in mFontSplittingExtra
-                for name in self.mFontSplittingExtra:
-                    for r in self.mFontSplittingExtra[name]:
-                        if type(r) == int:
-                            if r == codePoint:
-                                found = True
-                                break
-                        elif type(r) == tuple and type(r[0]) == int:
-                            if (r[0] <= codePoint and codePoint <= r[1]):
-                                found = True
-                                break
-                        # We ignore (glyphname, newcodepoint)
-
-                    if found:
-                        size0[codePoint] = name.upper()
-                        break
-
-            if not(found):
-                for subset in FONTSPLITTING:
-                    name = subset[0]
-                    for i in range(1, len(subset)):
-                        r = subset[i]
-                        if type(r) == int:
-                            if r == codePoint:
-                                found = True
-                                break
-                            elif codePoint < r:
-                                break
-                        else:
-                            if (r[0] <= codePoint and codePoint <= r[1]):
-                                found = True
-                                break
-                            elif codePoint < r[0]:
-                                break
-        
-                    if found:
-                        size0[codePoint] = name.upper()
-                        break
-
-            if not(found):
+            name = self.mSplittingIndex.getNormalSizeSubset(codePoint)
+            if name is None:
                 size0[codePoint] = "NONUNICODE"
+            else:
+                size0[codePoint] = name.upper()
 
         self.mNormalSize = size0
 
@@ -642,15 +1383,9 @@ operators. Please add a construction for it in DELIMITERS." %
 
         if aGlyphName not in self.mPUAContent:
             # New piece: copy it into the PUA and save the code point.
-            if self.mPUAPointer > 0xF8FF:
-                raise BaseException("Too many characters in the Plane 0 PUA. Not supported by the font splitter.")
-            codePoint = self.mPUAPointer
-            self.mMathFont.selection.select(aGlyphName)
-            self.mMathFont.copy()
-            self.mMathSize[self.mMaxSize-1].selection.select(codePoint)
-            self.mMathSize[self.mMaxSize-1].paste()
+            codePoint = self.mPUA.allocate()
+            self.copyToSizeFont(aGlyphName, self.mMaxSize, codePoint)
             self.mPUAContent[aGlyphName] = codePoint
-            self.mPUAPointer += 1 # move to the next code point
             self.mMovedNonUnicodeGlyphs[aGlyphName] = True
         else:
             # This piece was already copied into the PUA:
@@ -659,6 +1394,17 @@ operators. Please add a construction for it in DELIMITERS." %
 
         return codePoint
 
+    def copyToSizeFont(self, aGlyphName, aSize, aCodePoint):
+        # Copy a glyph of the math font into the font of the given size.
+        self.mSizeGlyphs[aSize-1].append((aGlyphName, aCodePoint))
+        profiler.count("size variant glyphs copied")
+        if self.mDryRun:
+            return
+        self.mMathFont.selection.select(aGlyphName)
+        self.mMathFont.copy()
+        self.mMathSize[aSize-1].selection.select(aCodePoint)
+        self.mMathSize[aSize-1].paste()
+
     def copySizeVariant(self, aIsHorizontal, aSize,
                         aCodePoint, aGlyphName, aStyle=None):
         codePoint = aCodePoint
@@ -679,17 +1425,14 @@ operators. Please add a construction for it in DELIMITERS." %
         else:
             if  self.isPrivateCharacter(aGlyphName):
                 self.mMovedNonUnicodeGlyphs[aGlyphName] = True
-            self.mMathFont.selection.select(aGlyphName)
-            self.mMathFont.copy()
-            self.mMathSize[aSize-1].selection.select(aCodePoint)
-            self.mMathSize[aSize-1].paste()
+            self.copyToSizeFont(aGlyphName, aSize, aCodePoint)
             style = None
             size = aSize
 
         if style is None:
             boundingBox = self.mMathFont[aGlyphName].boundingBox()
         else:
-            boundingBox = self.mMainFonts[style][aGlyphName].boundingBox()
+            boundingBox = self.getMainFont(style)[aGlyphName].boundingBox()
                
         if aIsHorizontal:
             s = float(boundingBox[2] - boundingBox[0])
@@ -702,7 +1445,7 @@ operators. Please add a construction for it in DELIMITERS." %
         if style is None:
             return (size, codePoint, s/self.mMathFont.em, 1.0)
         else:
-            codePoint = self.mMainFonts[style][aGlyphName].unicode
+            codePoint = self.getMainFont(style)[aGlyphName].unicode
             if codePoint == -1:
                 raise BaseException("Not supported")
             self.mNormalSize.append(codePoint)
@@ -742,7 +1485,7 @@ operators. Please add a construction for it in DELIMITERS." %
                 style = "Regular"
 
         if style is not None:
-            codePoint = self.mMainFonts[style][aGlyphName].unicode
+            codePoint = self.getMainFont(style)[aGlyphName].unicode
             if codePoint == -1:
                 raise BaseException("Not supported")
             self.mNormalSize.append(codePoint)
@@ -0,0 +1,145 @@
+# -*- Mode: Python; tab-width: 2; indent-tabs-mode:nil; -*-
+# vim: set ts=2 et sw=2 tw=80:
+#
+# Copyright (c) 2013 The MathJax Consortium
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Tracer of the calls to the fontforge module.
+#
+# install() replaces the fontforge module by a proxy, so it must be called
+# before fontUtil and the other modules import fontforge. splitFont.py does
+# that when the FONTFORGE_TRACE environment variable is set:
+#
+#   FONTFORGE_TRACE=trace.txt python splitFont.py STIX-Web $FONTDIR
+#
+# Every object returned by fontforge (fonts, glyphs, selections, layers...)
+# is wrapped in a proxy that counts the calls of its methods and their time,
+# per API (e.g. "font.generate", "selection.select") and per call site. The
+# hot-spot table is written at exit in the file given by FONTFORGE_TRACE, or
+# on stderr if it is "-". Only the calls of the process that installed the
+# tracer are reported, so use splitFont.py --jobs 1 to trace the main fonts.
+
+from __future__ import print_function
+
+import sys, os, time, atexit
+import types
+
+# (API, call site) -> [number of calls, total time]
+calls = {}
+
+def getCallSite(aDepth):
+    frame = sys._getframe(aDepth + 1)
+    return "%s:%d" % (os.path.basename(frame.f_code.co_filename),
+                      frame.f_lineno)
+
+def isFontForgeObject(aValue):
+    return getattr(type(aValue), "__module__", None) == "fontforge"
+
+def wrap(aValue):
+    # Wrap the fontforge objects and the iterators over them.
+    if isinstance(aValue, types.GeneratorType) or isFontForgeObject(aValue):
+        return tracedObject(aValue, type(aValue).__name__)
+    return aValue
+
+def tracedCall(aFunction, aName):
+    def call(*args, **kwargs):
+        site = getCallSite(1)
+        start = time.time()
+        try:
+            return wrap(aFunction(*args, **kwargs))
+        finally:
+            key = (aName, site)
+            if key not in calls:
+                calls[key] = [0, 0.0]
+            calls[key][0] += 1
+            calls[key][1] += time.time() - start
+    return call
+
+class tracedObject(object):
+    def __init__(self, aTarget, aTypeName):
+        object.__setattr__(self, "mTarget", aTarget)
+        object.__setattr__(self, "mTypeName", aTypeName)
+
+    def __getattr__(self, aName):
+        value = getattr(self.mTarget, aName)
+        if callable(value) and not isFontForgeObject(value):
+            return tracedCall(value, "%s.%s" % (self.mTypeName, aName))
+        return wrap(value)
+
+    def __setattr__(self, aName, aValue):
+        setattr(self.mTarget, aName, aValue)
+
+    def __iter__(self):
+        for item in self.mTarget:
+            yield wrap(item)
+
+    def __len__(self):
+        return len(self.mTarget)
+
+    def __contains__(self, aKey):
+        return aKey in self.mTarget
+
+    def __getitem__(self, aKey):
+        return wrap(self.mTarget[aKey])
+
+    def __setitem__(self, aKey, aValue):
+        self.mTarget[aKey] = aValue
+
+    def __repr__(self):
+        return repr(self.mTarget)
+
+def printTable(aStream):
+    # Print the calls sorted by total time, then the totals per API.
+    print("%8s %10s %10s  %-32s %s" %
+          ("calls", "total (s)", "mean (ms)", "API", "call site"), file=aStream)
+    for key in sorted(calls, key=lambda k: -calls[k][1]):
+        n, t = calls[key]
+        print("%8d %10.3f %10.3f  %-32s %s" % (n, t, 1000 * t / n,
+                                               key[0], key[1]), file=aStream)
+
+    totals = {}
+    for key in calls:
+        if key[0] not in totals:
+            totals[key[0]] = [0, 0.0]
+        totals[key[0]][0] += calls[key][0]
+        totals[key[0]][1] += calls[key][1]
+    print(file=aStream)
+    print("%8s %10s %10s  %s" %
+          ("calls", "total (s)", "mean (ms)", "API"), file=aStream)
+    for name in sorted(totals, key=lambda k: -totals[k][1]):
+        n, t = totals[name]
+        print("%8d %10.3f %10.3f  %s" % (n, t, 1000 * t / n, name),
+              file=aStream)
+
+def install(aFileName):
+    # Replace the fontforge module by a traced proxy and write the table of
+    # the calls in aFileName at exit.
+    import fontforge
+    if isinstance(fontforge, tracedObject):
+        return
+    sys.modules["fontforge"] = tracedObject(fontforge, "fontforge")
+    pid = os.getpid()
+
+    def dump():
+        if os.getpid() != pid:
+            return
+        if aFileName == "-":
+            printTable(sys.stderr)
+        else:
+            f = open(aFileName, "w")
+            printTable(f)
+            f.close()
+
+    atexit.register(dump)
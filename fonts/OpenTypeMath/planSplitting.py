@@ -0,0 +1,396 @@
+# -*- Mode: Python; tab-width: 2; indent-tabs-mode:nil; -*-
+# vim: set ts=2 et sw=2 tw=80:
+#
+# Copyright (c) 2013 The MathJax Consortium
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Propose a layout of the block subsets of FONTSPLITTING driven by the
+# characters that pages actually use.
+#
+#   python planSplitting.py $FONTDIR STIX-Web usage.json \
+#       --output FONTSPLITTING.py
+#
+# usage.json is a histogram of the code points rendered by a set of pages:
+#
+#   {"pages": 12000, "codePoints": {"0x2211": 3150, "U+222B": 2877, ...}}
+#
+# where each count is the number of pages using the code point (the keys may
+# be hexadecimal, U+XXXX or decimal).
+#
+# The glyphs of the --weight font of the family that the block subsets
+# (--subsets, as in rebalanceSplitting.py) claim are sorted by decreasing
+# usage and cut into runs, each of them becoming a new subset (Usage1,
+# Usage2...). Assuming that the code points are used independently, a page
+# needs a font with the probability 1 - prod(1 - p) over its glyphs, so the
+# cuts minimize the expected
+#
+#   sum P(font) * (size of the font + --requestCost)
+#
+# where the size of a font is --overhead plus OUTLINE_BYTES_PER_POINT bytes
+# per point of its outlines, and no font exceeds --max bytes.
+#
+# The code points of the block subsets that have no glyph in the font are
+# added to the least used subset, so that the other families keep all their
+# glyphs. The entries of the family's FONTSPLITTING_EXTRA for the block
+# subsets go to the new subsets with the same rule, and the names used in the
+# FONTSPLITTING_EXTRA of the other families are kept as subsets without
+# entries of their own.
+#
+# The new FONTSPLITTING and FONTSPLITTING_EXTRA are printed in the syntax of
+# fontSplitting.py and config.py, followed by the expected number of fonts and
+# bytes fetched per page with the current layout and the proposed one. The
+# glyphs left in the main font are the same in both layouts and not counted.
+
+from __future__ import print_function
+
+import sys, os, json
+import argparse
+
+import fontUtil
+from fontSplitting import FONTSPLITTING, verifyFontSplitting, \
+    fontSplittingIndex, getSplittingEntries, formatFontSplitting, \
+    formatFontSplittingExtra, familyConfig, BLOCKSUBSETS
+from sourceFontCache import sourceFontCache
+
+def parseCodePoint(aKey):
+    if aKey.upper().startswith("U+"):
+        return int(aKey[2:], 16)
+    if aKey.lower().startswith("0x"):
+        return int(aKey, 16)
+    return int(aKey)
+
+def readHistogram(aFileName):
+    # Return the probability that a page uses each code point.
+    f = open(aFileName)
+    histogram = json.load(f)
+    f.close()
+    pages = histogram["pages"]
+    if pages <= 0:
+        raise BaseException("No pages in %s" % aFileName)
+    usage = {}
+    for key in histogram["codePoints"]:
+        usage[parseCodePoint(key)] = \
+            min(1.0, histogram["codePoints"][key] / float(pages))
+    return usage
+
+def isExtraRank(aIndex, aRank):
+    # Whether the entries of the rank are those of FONTSPLITTING_EXTRA (see
+    # getSplittingSubsets).
+    return aRank > 0 and aIndex.mSubsets[aRank - 1][0] == \
+        aIndex.mSubsets[aRank][0]
+
+class plannedGlyph:
+    # A glyph of the font: its code point (or -1), its name, its number of
+    # points and the probability that a page uses it.
+    def __init__(self, aCodePoint, aName, aPoints, aUsage):
+        self.mCodePoint = aCodePoint
+        self.mName = aName
+        self.mPoints = aPoints
+        self.mUsage = aUsage
+
+    def getSubset(self, aIndex):
+        # Return the (rank, entry) claiming the glyph, where the entry
+        # is the code point or the (glyphname, newcodepoint) claim, or None.
+        if self.mCodePoint != -1:
+            claim = aIndex.getClaim(self.mCodePoint)
+            if claim is None:
+                return None
+            return claim[0], self.mCodePoint
+        claim = aIndex.getNameClaim(self.mName)
+        if claim is None:
+            return None
+        return claim[0], (self.mName, claim[2])
+
+def getGlyphs(aFont, aIndex, aUsage, aRemove):
+    glyphs = []
+    for glyph in aFont.glyphs():
+        codePoint = glyph.unicode
+        if aRemove is not None and codePoint != -1 and \
+                fontUtil.isInSubset(aRemove, codePoint):
+            continue
+        usage = 0.0
+        if codePoint != -1:
+            usage = aUsage.get(codePoint, 0.0)
+        else:
+            claim = aIndex.getNameClaim(glyph.glyphname)
+            if claim is None:
+                continue
+            usage = aUsage.get(claim[2], 0.0)
+        glyphs.append(plannedGlyph(codePoint, glyph.glyphname,
+                                   fontUtil.getPointCount(glyph), usage))
+    return glyphs
+
+def getFontSize(aPoints, aOverhead):
+    return aOverhead + fontUtil.OUTLINE_BYTES_PER_POINT * aPoints
+
+def getLayoutCost(aGlyphs, aIndex, aOverhead):
+    # Return the probability that a page needs each font and its estimated
+    # size, indexed by the subset name.
+    unused = {}
+    points = {}
+    for glyph in aGlyphs:
+        claim = glyph.getSubset(aIndex)
+        if claim is None:
+            continue
+        name = aIndex.getSubsetName(claim[0])
+        unused[name] = unused.get(name, 1.0) * (1.0 - glyph.mUsage)
+        points[name] = points.get(name, 0) + glyph.mPoints
+    return dict([(name, (1.0 - unused[name],
+                         getFontSize(points[name], aOverhead)))
+                 for name in points])
+
+def getExpectedCost(aCosts):
+    # Expected number of fonts and of bytes fetched per page
+    return (sum([aCosts[n][0] for n in aCosts]),
+            sum([aCosts[n][0] * aCosts[n][1] for n in aCosts]))
+
+def partition(aGlyphs, aOverhead, aRequestCost, aMax):
+    # Cut the list of glyphs into runs minimizing the sum of
+    # P(run) * (size + aRequestCost), with sizes at most aMax (a run of one
+    # glyph is always allowed). A small cost per font prefers fewer fonts
+    # among the runs that are never used.
+    n = len(aGlyphs)
+    best = [0.0] + [None] * n
+    cut = [0] * (n + 1)
+    for j in range(1, n + 1):
+        unused = 1.0
+        points = 0
+        for i in range(j - 1, -1, -1):
+            unused *= 1.0 - aGlyphs[i].mUsage
+            points += aGlyphs[i].mPoints
+            size = getFontSize(points, aOverhead)
+            if size > aMax and i < j - 1:
+                break
+            cost = best[i] + (1.0 - unused) * (size + aRequestCost) + 1e-6
+            if best[j] is None or cost < best[j]:
+                best[j] = cost
+                cut[j] = i
+    groups = []
+    j = n
+    while j > 0:
+        groups.insert(0, aGlyphs[cut[j]:j])
+        j = cut[j]
+    return groups
+
+def getRemainingIntervals(aIntervals, aUsed):
+    # Return the parts of the intervals without the code points of aUsed.
+    rv = []
+    used = sorted(aUsed)
+    for start, end in aIntervals:
+        for codePoint in used:
+            if codePoint < start or codePoint > end:
+                continue
+            if start < codePoint:
+                rv.append((start, codePoint - 1))
+            start = codePoint + 1
+        if start <= end:
+            rv.append((start, end))
+    return rv
+
+def getPlannedEntries(aEntries):
+    # Return the FONTSPLITTING entries of a list of code points, intervals
+    # and (glyphname, newcodepoint) claims.
+    intervals = []
+    claims = []
+    for entry in aEntries:
+        if type(entry) == int:
+            intervals.append((entry, entry))
+        elif type(entry[0]) == int:
+            intervals.append(entry)
+        else:
+            claims.append(entry)
+    return getSplittingEntries(intervals) + sorted(claims)
+
+def printCosts(aTitle, aCosts):
+    print(aTitle)
+    for name in sorted(aCosts, key=lambda n: -aCosts[n][0]):
+        print("  %-16s P=%.4f %10d bytes" % (name, aCosts[name][0],
+                                              aCosts[name][1]))
+    files, size = getExpectedCost(aCosts)
+    print("  expected per page: %.3f fonts, %d bytes" % (files, size))
+    print()
+
+# Parse the command line arguments
+parser = argparse.ArgumentParser()
+parser.add_argument('fontdir', type=str)
+parser.add_argument('fontfamily', type=str)
+parser.add_argument('histogram', type=str,
+                    help='JSON histogram of the code points used by pages')
+parser.add_argument('--weight', type=str, default="Regular",
+                    help='weight of the family whose glyphs are planned')
+parser.add_argument('--subsets', type=str, default=",".join(BLOCKSUBSETS),
+                    help='comma-separated subsets of FONTSPLITTING to plan')
+parser.add_argument('--max', type=int, default=65536,
+                    help='maximum size of a font file, in bytes')
+parser.add_argument('--overhead', type=int, default=1500,
+                    help='size of the tables of an empty font, in bytes')
+parser.add_argument('--requestCost', type=int, default=5000,
+                    help='cost of a request, in bytes')
+parser.add_argument('--glyphCache', type=str, default=None,
+                    help='directory of the cache of the glyph data of the '
+                    'source fonts')
+parser.add_argument('--output', type=str, default=None,
+                    help='file where the proposed tables are written '
+                    '(default: stdout)')
+args = parser.parse_args()
+
+verifyFontSplitting()
+planned = args.subsets.split(",")
+positions = [p for p in range(0, len(FONTSPLITTING))
+             if FONTSPLITTING[p][0] in planned]
+if len(positions) != len(planned):
+    raise BaseException("Unknown subset in --subsets")
+
+config = familyConfig(args.fontfamily)
+extra = config.FONTSPLITTING_EXTRA
+if args.weight not in config.MAINFONTS:
+    raise BaseException("No %s weight in %s" % (args.weight, args.fontfamily))
+usage = readHistogram(args.histogram)
+index = fontSplittingIndex(extra)
+
+fileName = "%s/%s" % (args.fontdir, config.MAINFONTS[args.weight])
+sourceFonts = None
+if args.glyphCache is not None:
+    sourceFonts = sourceFontCache(args.glyphCache)
+    font = sourceFonts.getFont(fileName)
+else:
+    pool = fontUtil.fontPool(1)
+    font = pool.get(fileName)
+remove = None
+if (config.FONTSPLITTING_REMOVE is not None and
+    args.weight in config.FONTSPLITTING_REMOVE):
+    remove = config.FONTSPLITTING_REMOVE[args.weight]
+glyphs = getGlyphs(font, index, usage, remove)
+if sourceFonts is not None:
+    sourceFonts.close()
+else:
+    pool.close()
+
+# Intervals of the planned subsets that may receive glyphs: those of
+# FONTSPLITTING for all the families and those of the FONTSPLITTING_EXTRA of
+# this family.
+baseIntervals = []
+globalIndex = fontSplittingIndex(None)
+for k in range(0, len(globalIndex.mStarts)):
+    if globalIndex.getSubsetName(globalIndex.mClaims[k][0]) in planned:
+        baseIntervals.append((globalIndex.mStarts[k], globalIndex.mEnds[k]))
+extraIntervals = []
+for k in range(0, len(index.mStarts)):
+    rank = index.mClaims[k][0]
+    if index.getSubsetName(rank) in planned and isExtraRank(index, rank):
+        extraIntervals.append((index.mStarts[k], index.mEnds[k]))
+
+# Glyphs claimed by the planned subsets, from the most used to the least used
+movable = []
+isExtra = {}
+for glyph in glyphs:
+    claim = glyph.getSubset(index)
+    if claim is None or index.getSubsetName(claim[0]) not in planned:
+        continue
+    movable.append(glyph)
+    isExtra[glyph] = isExtraRank(index, claim[0])
+movable.sort(key=lambda g: (-g.mUsage, g.mCodePoint, g.mName))
+groups = partition(movable, args.overhead, args.requestCost, args.max)
+names = ["Usage%d" % (i + 1) for i in range(0, len(groups))]
+if len(groups) == 0:
+    groups = [[]]
+    names = ["Usage1"]
+
+# Names used in the FONTSPLITTING_EXTRA of the other families
+kept = []
+for directory in sorted(os.listdir(".")):
+    if (directory == args.fontfamily or
+        not os.path.exists("%s/config.py" % directory)):
+        continue
+    otherExtra = familyConfig(directory).FONTSPLITTING_EXTRA
+    if otherExtra is None:
+        continue
+    for name in sorted(otherExtra):
+        if name in planned and name not in kept:
+            kept.append(name)
+
+# Entries of the new subsets, the remaining code points going to the least
+# used one
+baseEntries = []
+extraEntries = []
+for group in groups:
+    baseEntries.append([])
+    extraEntries.append([])
+    for glyph in group:
+        entries = extraEntries[-1] if isExtra[glyph] else baseEntries[-1]
+        entries.append(glyph.getSubset(index)[1])
+used = [glyph.mCodePoint for glyph in movable if glyph.mCodePoint != -1]
+baseEntries[-1] += getRemainingIntervals(baseIntervals, used)
+extraEntries[-1] += getRemainingIntervals(extraIntervals, used)
+
+table = []
+comments = {}
+newExtra = None
+if extra is not None:
+    newExtra = dict([(name, extra[name]) for name in extra
+                     if name not in planned])
+newCosts = {}
+for p in range(0, len(FONTSPLITTING)):
+    if p == positions[0]:
+        for i in range(0, len(groups)):
+            table.append([names[i]] + getPlannedEntries(baseEntries[i]))
+            entries = getPlannedEntries(extraEntries[i])
+            if len(entries) > 0:
+                if newExtra is None:
+                    newExtra = {}
+                newExtra[names[i]] = entries
+        for name in kept:
+            table.append([name])
+            comments[name] = "only for FONTSPLITTING_EXTRA"
+    if p not in positions:
+        table.append(list(FONTSPLITTING[p]))
+verifyFontSplitting(table)
+newIndex = fontSplittingIndex(newExtra, table)
+
+# Check that every glyph goes to the planned subset with the new tables.
+changes = 0
+for i in range(0, len(groups)):
+    for glyph in groups[i]:
+        claim = glyph.getSubset(newIndex)
+        if claim is None or newIndex.getSubsetName(claim[0]) != names[i]:
+            changes += 1
+if changes > 0:
+    print("Warning: %d glyphs would be assigned to an unexpected subset" %
+          changes, file=sys.stderr)
+
+currentCosts = getLayoutCost(glyphs, index, args.overhead)
+proposedCosts = getLayoutCost(glyphs, newIndex, args.overhead)
+for name in names:
+    if name in proposedCosts:
+        comments[name] = "P=%.4f, ~%d bytes" % proposedCosts[name]
+printCosts("Current layout of %s-%s:" % (args.fontfamily, args.weight),
+           currentCosts)
+printCosts("Proposed layout of %s-%s:" % (args.fontfamily, args.weight),
+           proposedCosts)
+if len(kept) > 0:
+    print("Subsets kept for the FONTSPLITTING_EXTRA of other families: %s" %
+          ", ".join(kept))
+    print()
+
+output = formatFontSplitting(table, comments) + "\n" + \
+    formatFontSplittingExtra(newExtra)
+if args.output is None:
+    print(output)
+else:
+    f = open(args.output, "w")
+    f.write(output)
+    f.close()
+    print("Proposed FONTSPLITTING and FONTSPLITTING_EXTRA written to %s" %
+          args.output)
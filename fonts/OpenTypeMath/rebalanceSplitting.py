@@ -0,0 +1,376 @@
+# -*- Mode: Python; tab-width: 2; indent-tabs-mode:nil; -*-
+# vim: set ts=2 et sw=2 tw=80:
+#
+# Copyright (c) 2013 The MathJax Consortium
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Propose a re-partition of the block subsets of FONTSPLITTING within a
+# per-file size budget.
+#
+#   python rebalanceSplitting.py $FONTDIR STIX-Web Gyre-Termes \
+#       --min 4096 --max 65536 --output FONTSPLITTING.py
+#
+# Only the subsets made of Unicode blocks (--subsets, by default Latin,
+# Alphabets, Marks, Arrows, Operators, Symbols, Shapes and Misc) are
+# rebalanced: the others are tied to the MathJax variants in fontdata.js.
+#
+# The size of a generated font is modelled as a fixed overhead plus a cost per
+# point of its outlines. For each family, both are fitted by least squares on
+# the actual sizes of its compressed fonts (--format woff or woff2, converted
+# beforehand) and on the number of points of the glyphs that fontSplittingIndex
+# assigns to them in the source fonts.
+#
+# Each entry of the rebalanced subsets (usually a Unicode block) is a unit
+# that is never split. The units are sorted by code point and cut into runs
+# of consecutive units, so that the estimated size of each font is within
+# [--min, --max] in every weight of every family, with as few fonts as
+# possible. Each new subset is named after the subset that contributes most
+# to it.
+#
+# The proposed table lists the code points actually claimed by each entry, so
+# the new subsets are disjoint and the assignment of the glyphs does not
+# depend on their order. It is checked with verifyFontSplitting and by
+# comparing the subset of every glyph of the families before and after. The
+# names used in the FONTSPLITTING_EXTRA of the families are kept, possibly as
+# subsets without entries of their own.
+
+from __future__ import print_function
+
+import sys, os
+import argparse
+
+import fontUtil
+from fontSplitting import FONTSPLITTING, verifyFontSplitting, \
+    fontSplittingIndex, getSplittingEntries, formatFontSplitting, \
+    familyConfig, BLOCKSUBSETS
+from sourceFontCache import sourceFontCache
+
+def getRankSubsets(aFontSplittingExtra):
+    # Return, for each rank of a fontSplittingIndex, the position in
+    # FONTSPLITTING of its subset and whether the entries are those of
+    # FONTSPLITTING_EXTRA (see getSplittingSubsets).
+    ranks = []
+    for p in range(0, len(FONTSPLITTING)):
+        ranks.append((p, False))
+        if (aFontSplittingExtra is not None and
+            FONTSPLITTING[p][0] in aFontSplittingExtra):
+            ranks.append((p, True))
+    return ranks
+
+def getUnitIntervals():
+    # Return the code point intervals claimed by each entry of FONTSPLITTING,
+    # indexed by (position of the subset, index of the entry).
+    index = fontSplittingIndex(None)
+    intervals = {}
+    for k in range(0, len(index.mStarts)):
+        rank, entry = index.mClaims[k]
+        key = (rank, entry)
+        if key not in intervals:
+            intervals[key] = []
+        intervals[key].append((index.mStarts[k], index.mEnds[k]))
+    return intervals
+
+class familyMeasure:
+    # Number of points of the glyphs of each unit and of each subset in each
+    # weight of a font family, and the measured sizes of its fonts.
+    def __init__(self, aFamily, aFontDir, aFormat, aSourceFonts, aPool):
+        self.mFamily = aFamily
+        self.mFormat = aFormat
+        self.mConfig = familyConfig(aFamily)
+        index = fontSplittingIndex(self.mConfig.FONTSPLITTING_EXTRA)
+        ranks = getRankSubsets(self.mConfig.FONTSPLITTING_EXTRA)
+
+        # weight -> unit -> points, weight -> subset name -> points
+        self.mUnitPoints = {}
+        self.mSubsetPoints = {}
+        # weight -> code point -> (subset name, unit or None for the glyphs
+        # claimed by FONTSPLITTING_EXTRA)
+        self.mSubsets = {}
+        # (weight, subset name) -> size of the compressed font
+        self.mSizes = {}
+
+        for weight in sorted(self.mConfig.MAINFONTS):
+            fileName = "%s/%s" % (aFontDir, self.mConfig.MAINFONTS[weight])
+            if aSourceFonts is not None:
+                font = aSourceFonts.getFont(fileName)
+            else:
+                font = aPool.get(fileName)
+            remove = None
+            if (self.mConfig.FONTSPLITTING_REMOVE is not None and
+                weight in self.mConfig.FONTSPLITTING_REMOVE):
+                remove = self.mConfig.FONTSPLITTING_REMOVE[weight]
+
+            units = {}
+            subsets = {}
+            claims = {}
+            for glyph in font.glyphs():
+                codePoint = glyph.unicode
+                if codePoint == -1:
+                    continue
+                if remove is not None and fontUtil.isInSubset(remove,
+                                                              codePoint):
+                    continue
+                claim = index.getClaim(codePoint)
+                if claim is None:
+                    continue
+                position, isExtra = ranks[claim[0]]
+                name = FONTSPLITTING[position][0]
+                points = fontUtil.getPointCount(glyph)
+                subsets[name] = subsets.get(name, 0) + points
+                claims[codePoint] = (name, None if isExtra else
+                                     (position, claim[1]))
+                if not isExtra:
+                    unit = (position, claim[1])
+                    units[unit] = units.get(unit, 0) + points
+            self.mUnitPoints[weight] = units
+            self.mSubsetPoints[weight] = subsets
+            self.mSubsets[weight] = claims
+
+            for name in subsets:
+                fileName = "%s/%s/%s.%s" % \
+                    (aFamily, aFormat,
+                     fontUtil.getFontName(self.mConfig, name, weight), aFormat)
+                if os.path.exists(fileName):
+                    self.mSizes[(weight, name)] = os.path.getsize(fileName)
+
+        self.fitModel()
+
+    def fitModel(self):
+        # Fit size = overhead + cost * points on the measured fonts.
+        pairs = [(self.mSubsetPoints[weight][name], self.mSizes[(weight, name)])
+                 for weight, name in self.mSizes]
+        if len(pairs) == 0:
+            raise BaseException("No %s fonts found for %s. Convert them \
+first." % (self.mFormat, self.mFamily))
+        n = len(pairs)
+        meanX = sum([x for x, y in pairs]) / float(n)
+        meanY = sum([y for x, y in pairs]) / float(n)
+        variance = sum([(x - meanX) ** 2 for x, y in pairs])
+        cost = 0.0
+        if variance > 0:
+            cost = sum([(x - meanX) * (y - meanY) for x, y in pairs]) / variance
+        overhead = meanY - cost * meanX
+        if cost <= 0 or overhead < 0:
+            # Not enough data for a regression: use the smallest font as the
+            # overhead.
+            overhead = min([y for x, y in pairs])
+            points = sum([x for x, y in pairs])
+            cost = 0.0
+            if points > 0:
+                cost = max(0.0, (sum([y for x, y in pairs]) - n * overhead) /
+                           float(points))
+        self.mOverhead = overhead
+        self.mCost = cost
+
+    def estimate(self, aPoints):
+        return self.mOverhead + self.mCost * aPoints
+
+def getGroupSize(aMeasures, aUnits):
+    # Estimated size of the largest font of the subset made of aUnits.
+    size = 0
+    for measure in aMeasures:
+        for weight in measure.mUnitPoints:
+            points = sum([measure.mUnitPoints[weight].get(u, 0)
+                          for u in aUnits])
+            size = max(size, measure.estimate(points))
+    return size
+
+def getUnitPoints(aMeasures, aUnit):
+    # Number of points of the glyphs of the unit in all the measured fonts
+    points = 0
+    for measure in aMeasures:
+        for weight in measure.mUnitPoints:
+            points += measure.mUnitPoints[weight].get(aUnit, 0)
+    return points
+
+def partition(aMeasures, aUnits, aMin, aMax):
+    # Cut the list of units into runs whose sizes are within [aMin, aMax],
+    # minimizing the number of runs and the budget overruns.
+    n = len(aUnits)
+    best = [0.0] + [None] * n
+    cut = [0] * (n + 1)
+    for j in range(1, n + 1):
+        for i in range(0, j):
+            size = getGroupSize(aMeasures, aUnits[i:j])
+            penalty = 1.0
+            if size > aMax:
+                penalty += 1000.0 * (size - aMax) / aMax
+            elif size < aMin:
+                penalty += 1000.0 * (aMin - size) / aMin
+            if best[j] is None or best[i] + penalty < best[j]:
+                best[j] = best[i] + penalty
+                cut[j] = i
+    groups = []
+    j = n
+    while j > 0:
+        groups.insert(0, aUnits[cut[j]:j])
+        j = cut[j]
+    return groups
+
+def printReport(aTitle, aRows, aMin, aMax):
+    print(aTitle)
+    outside = 0
+    for name, size in aRows:
+        flag = ""
+        if size < aMin:
+            flag = "  below --min"
+            outside += 1
+        elif size > aMax:
+            flag = "  above --max"
+            outside += 1
+        print("  %-16s %10d%s" % (name, size, flag))
+    print("  %d fonts, %d outside of the budget" % (len(aRows), outside))
+    print()
+
+# Parse the command line arguments
+parser = argparse.ArgumentParser()
+parser.add_argument('fontdir', type=str)
+parser.add_argument('fontfamily', type=str, nargs='+')
+parser.add_argument('--min', type=int, default=4096,
+                    help='minimum size of a font file, in bytes')
+parser.add_argument('--max', type=int, default=65536,
+                    help='maximum size of a font file, in bytes')
+parser.add_argument('--format', type=str, default="woff",
+                    choices=["woff", "woff2"],
+                    help='compressed format whose sizes are measured')
+parser.add_argument('--subsets', type=str, default=",".join(BLOCKSUBSETS),
+                    help='comma-separated subsets of FONTSPLITTING to '
+                    'rebalance')
+parser.add_argument('--glyphCache', type=str, default=None,
+                    help='directory of the cache of the glyph data of the '
+                    'source fonts')
+parser.add_argument('--output', type=str, default=None,
+                    help='file where the proposed FONTSPLITTING is written '
+                    '(default: stdout)')
+args = parser.parse_args()
+
+verifyFontSplitting()
+rebalanced = args.subsets.split(",")
+positions = [p for p in range(0, len(FONTSPLITTING))
+             if FONTSPLITTING[p][0] in rebalanced]
+if len(positions) != len(rebalanced):
+    raise BaseException("Unknown subset in --subsets")
+
+sourceFonts = None
+if args.glyphCache is not None:
+    sourceFonts = sourceFontCache(args.glyphCache)
+pool = fontUtil.fontPool(1)
+measures = [familyMeasure(family, args.fontdir, args.format, sourceFonts, pool)
+            for family in args.fontfamily]
+pool.close()
+if sourceFonts is not None:
+    sourceFonts.close()
+
+# Sizes before: the measured fonts of the rebalanced subsets
+rows = []
+for measure in measures:
+    for weight, name in sorted(measure.mSizes):
+        if name in rebalanced:
+            rows.append(("%s %s-%s" % (measure.mFamily, name, weight),
+                         measure.mSizes[(weight, name)]))
+printReport("Measured %s sizes:" % args.format, rows, args.min, args.max)
+
+# Units in code point order
+intervals = getUnitIntervals()
+units = [unit for unit in intervals if unit[0] in positions]
+units.sort(key=lambda u: intervals[u][0][0])
+groups = partition(measures, units, args.min, args.max)
+
+# Name each group after the subset that contributes most to it.
+names = []
+for group in groups:
+    contributions = {}
+    for unit in group:
+        name = FONTSPLITTING[unit[0]][0]
+        contributions[name] = contributions.get(name, 0) + \
+            getUnitPoints(measures, unit)
+    candidates = sorted(contributions, key=lambda n: -contributions[n])
+    name = None
+    for candidate in candidates:
+        if candidate not in names:
+            name = candidate
+            break
+    k = 2
+    while name is None:
+        if "%s%d" % (candidates[0], k) not in names:
+            name = "%s%d" % (candidates[0], k)
+        k += 1
+    names.append(name)
+
+# Keep the names used in FONTSPLITTING_EXTRA.
+kept = []
+for measure in measures:
+    extra = measure.mConfig.FONTSPLITTING_EXTRA
+    if extra is None:
+        continue
+    for name in sorted(extra):
+        if name in rebalanced and name not in names and name not in kept:
+            kept.append(name)
+
+# Build the new table, with the new subsets at the place of the first
+# rebalanced one.
+table = []
+comments = {}
+unitNames = {}
+for p in range(0, len(FONTSPLITTING)):
+    if p == positions[0]:
+        for i in range(0, len(groups)):
+            entries = []
+            for unit in groups[i]:
+                entries += intervals[unit]
+                unitNames[unit] = names[i]
+            table.append([names[i]] + getSplittingEntries(entries))
+            comments[names[i]] = "~%d bytes" % getGroupSize(measures,
+                                                            groups[i])
+        for name in kept:
+            table.append([name])
+            comments[name] = "only for FONTSPLITTING_EXTRA"
+    if p not in positions:
+        table.append(list(FONTSPLITTING[p]))
+verifyFontSplitting(table)
+
+# Check that every glyph goes to the expected subset with the new table.
+changes = 0
+for measure in measures:
+    extra = measure.mConfig.FONTSPLITTING_EXTRA
+    index = fontSplittingIndex(extra, table)
+    for weight in measure.mSubsets:
+        claims = measure.mSubsets[weight]
+        for codePoint in claims:
+            name, unit = claims[codePoint]
+            if unit in unitNames:
+                name = unitNames[unit]
+            if index.getSubset(codePoint) != name:
+                changes += 1
+if changes > 0:
+    print("Warning: %d glyphs would be assigned to an unexpected subset \
+because of FONTSPLITTING_EXTRA" % changes, file=sys.stderr)
+
+rows = [(names[i], getGroupSize(measures, groups[i]))
+        for i in range(0, len(groups))]
+printReport("Estimated largest %s size of the proposed subsets:" % args.format,
+            rows, args.min, args.max)
+if len(kept) > 0:
+    print("Subsets kept for FONTSPLITTING_EXTRA: %s" % ", ".join(kept))
+    print()
+
+output = formatFontSplitting(table, comments)
+if args.output is None:
+    print(output)
+else:
+    f = open(args.output, "w")
+    f.write(output)
+    f.close()
+    print("Proposed FONTSPLITTING written to %s" % args.output)
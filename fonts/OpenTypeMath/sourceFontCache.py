@@ -0,0 +1,272 @@
+# -*- Mode: Python; tab-width: 2; indent-tabs-mode:nil; -*-
+# vim: set ts=2 et sw=2 tw=80:
+#
+# Copyright (c) 2013 The MathJax Consortium
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Persistent cache of the per-glyph data of the source fonts.
+#
+# Reading the big source fonts (STIXMath-Regular.otf, the MAINFONTS...) with
+# FontForge takes several seconds each. This module stores the data that the
+# splitter reads from them (names, code points, metrics, bounding boxes,
+# variants and components) in a compact binary file named after the SHA-1 of
+# the source font, so that later runs and tools can memory-map it instead.
+#
+# File format (little endian):
+#
+#   header   MAGIC, VERSION, number of glyphs, em, ascent, descent
+#   records  one RECORD per glyph, in the glyph order of FontForge
+#   strings  string table: a 32-bit length followed by the UTF-8 bytes
+#
+# The string fields of a record are offsets in the string table. Empty
+# strings stand for the None values of FontForge.
+#
+# The fontSource objects returned by sourceFontCache.getFont provide the
+# read-only subset of the FontForge font and glyph API used by the splitter:
+# font.em, font.glyphs(), font[name or code point], glyph.glyphname,
+# glyph.unicode, glyph.boundingBox(), glyph.horizontalVariants...
+
+from __future__ import print_function
+
+import sys, os, mmap, struct
+import hashlib
+from ast import literal_eval
+
+MAGIC = b"MJGC"
+VERSION = 2
+HEADER = struct.Struct("<4sIIiii")
+
+# unicode, width, vwidth, xmin, ymin, xmax, ymax, left side bearing,
+# right side bearing, number of points, flags and the offsets of the glyph
+# name, alternate code points, horizontal variants, vertical variants,
+# horizontal components and vertical components in the string table.
+RECORD = struct.Struct("<iiiddddddIIIIIIII")
+
+# flags
+WORTH_OUTPUTTING = 1
+
+def getFileHash(aFileName):
+    h = hashlib.sha1()
+    f = open(aFileName, "rb")
+    while True:
+        data = f.read(1 << 20)
+        if not data:
+            break
+        h.update(data)
+    f.close()
+    return h.hexdigest()
+
+class stringTable:
+    # String table used when a cache file is written
+    def __init__(self):
+        self.mData = []
+        self.mOffsets = {}
+        self.mSize = 0
+
+    def add(self, aString):
+        if aString is None:
+            aString = ""
+        if aString in self.mOffsets:
+            return self.mOffsets[aString]
+        data = aString.encode("utf-8")
+        offset = self.mSize
+        self.mData.append(struct.pack("<I", len(data)))
+        self.mData.append(data)
+        self.mSize += 4 + len(data)
+        self.mOffsets[aString] = offset
+        return offset
+
+    def getData(self):
+        return b"".join(self.mData)
+
+def writeFont(aFont, aFileName):
+    # Write the cache file aFileName of the FontForge font aFont.
+    strings = stringTable()
+    records = []
+    count = 0
+    for glyph in aFont.glyphs():
+        b = glyph.boundingBox() # (xmin, ymin, xmax, ymax)
+        points = 0
+        for contour in glyph.foreground:
+            points += len(contour)
+        flags = 0
+        if glyph.isWorthOutputting():
+            flags |= WORTH_OUTPUTTING
+        if glyph.altuni is None:
+            altuni = None
+        else:
+            altuni = repr(tuple(glyph.altuni))
+        if glyph.horizontalComponents is None:
+            horizontalComponents = None
+        else:
+            horizontalComponents = repr(tuple(glyph.horizontalComponents))
+        if glyph.verticalComponents is None:
+            verticalComponents = None
+        else:
+            verticalComponents = repr(tuple(glyph.verticalComponents))
+        records.append(RECORD.pack(glyph.unicode, glyph.width, glyph.vwidth,
+                                   b[0], b[1], b[2], b[3],
+                                   glyph.left_side_bearing,
+                                   glyph.right_side_bearing,
+                                   points, flags,
+                                   strings.add(glyph.glyphname),
+                                   strings.add(altuni),
+                                   strings.add(glyph.horizontalVariants),
+                                   strings.add(glyph.verticalVariants),
+                                   strings.add(horizontalComponents),
+                                   strings.add(verticalComponents)))
+        count += 1
+
+    # Write a temporary file and rename it, so that concurrent builds never
+    # read a partial file.
+    temporary = "%s.%d.tmp" % (aFileName, os.getpid())
+    f = open(temporary, "wb")
+    f.write(HEADER.pack(MAGIC, VERSION, count,
+                        aFont.em, aFont.ascent, aFont.descent))
+    f.write(b"".join(records))
+    f.write(strings.getData())
+    f.close()
+    os.rename(temporary, aFileName)
+
+class sourceGlyph:
+    # Data of a glyph of a fontSource
+    def __init__(self, aFont, aIndex):
+        (self.unicode, self.width, self.vwidth,
+         xmin, ymin, xmax, ymax,
+         self.left_side_bearing, self.right_side_bearing,
+         self.mPoints, self.mFlags,
+         name, altuni,
+         horizontalVariants, verticalVariants,
+         horizontalComponents, verticalComponents) = \
+            RECORD.unpack_from(aFont.mData,
+                               HEADER.size + aIndex * RECORD.size)
+        self.mBoundingBox = (xmin, ymin, xmax, ymax)
+        self.glyphname = aFont.getString(name)
+        self.altuni = aFont.getValue(altuni)
+        self.horizontalVariants = aFont.getString(horizontalVariants) or None
+        self.verticalVariants = aFont.getString(verticalVariants) or None
+        self.horizontalComponents = aFont.getValue(horizontalComponents)
+        self.verticalComponents = aFont.getValue(verticalComponents)
+
+    def boundingBox(self):
+        return self.mBoundingBox
+
+    def isWorthOutputting(self):
+        return (self.mFlags & WORTH_OUTPUTTING) != 0
+
+    def getPointCount(self):
+        return self.mPoints
+
+class fontSource:
+    # Read-only view of a cache file. The file is memory-mapped and the
+    # glyphs are only decoded when they are accessed.
+    def __init__(self, aFileName):
+        f = open(aFileName, "rb")
+        self.mData = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+        (magic, version, self.mCount,
+         self.em, self.ascent, self.descent) = HEADER.unpack_from(self.mData, 0)
+        if magic != MAGIC or version != VERSION:
+            raise BaseException("%s is not a glyph cache file of version %d" %
+                                (aFileName, VERSION))
+        self.mStrings = HEADER.size + self.mCount * RECORD.size
+        self.mNames = None
+        self.mCodePoints = None
+
+    def close(self):
+        self.mData.close()
+
+    def getString(self, aOffset):
+        offset = self.mStrings + aOffset
+        length = struct.unpack_from("<I", self.mData, offset)[0]
+        s = self.mData[offset + 4:offset + 4 + length]
+        if sys.version_info[0] >= 3:
+            s = s.decode("utf-8")
+        return s
+
+    def getValue(self, aOffset):
+        s = self.getString(aOffset)
+        if s == "":
+            return None
+        return literal_eval(s)
+
+    def getGlyphCount(self):
+        return self.mCount
+
+    def glyphs(self):
+        for i in range(0, self.mCount):
+            yield sourceGlyph(self, i)
+
+    def buildIndex(self):
+        # Index of the glyphs by name and code point, built on first use.
+        self.mNames = {}
+        self.mCodePoints = {}
+        for i in range(0, self.mCount):
+            record = RECORD.unpack_from(self.mData,
+                                        HEADER.size + i * RECORD.size)
+            self.mNames[self.getString(record[11])] = i
+            codePoints = [record[0]]
+            altuni = self.getValue(record[12])
+            if altuni is not None:
+                # Alternate encodings, ignoring the variation sequences
+                codePoints += [a[0] for a in altuni if a[1] == -1]
+            for codePoint in codePoints:
+                if codePoint != -1 and codePoint not in self.mCodePoints:
+                    self.mCodePoints[codePoint] = i
+
+    def __contains__(self, aKey):
+        if self.mNames is None:
+            self.buildIndex()
+        if type(aKey) == int:
+            return aKey in self.mCodePoints
+        return aKey in self.mNames
+
+    def __getitem__(self, aKey):
+        if self.mNames is None:
+            self.buildIndex()
+        if type(aKey) == int:
+            return sourceGlyph(self, self.mCodePoints[aKey])
+        return sourceGlyph(self, self.mNames[aKey])
+
+class sourceFontCache:
+    # Cache of the source fonts in the directory aDirectory
+    def __init__(self, aDirectory):
+        if not os.path.exists(aDirectory):
+            os.makedirs(aDirectory)
+        self.mDirectory = aDirectory
+        self.mFonts = {}
+
+    def getFont(self, aFileName):
+        # Return the fontSource of the source font aFileName, reading the
+        # font with FontForge only if it is not in the cache yet.
+        if aFileName in self.mFonts:
+            return self.mFonts[aFileName]
+        cacheFile = "%s/%s.glyphs" % (self.mDirectory, getFileHash(aFileName))
+        if not os.path.exists(cacheFile):
+            import fontforge
+            print("Caching the glyph data of %s..." % aFileName)
+            font = fontforge.open(aFileName)
+            writeFont(font, cacheFile)
+            font.close()
+        else:
+            # Keep the most recently used files when the cache is evicted.
+            os.utime(cacheFile, None)
+        self.mFonts[aFileName] = fontSource(cacheFile)
+        return self.mFonts[aFileName]
+
+    def close(self):
+        for fileName in self.mFonts:
+            self.mFonts[fileName].close()
+        self.mFonts.clear()
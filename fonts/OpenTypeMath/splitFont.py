@@ -20,14 +20,37 @@ from __future__ import print_function
 
 import sys
 import argparse
-import subprocess, os, commands, re
+import subprocess, os, re
+import multiprocessing
+import json
+import shutil
+import atexit
 from copy import deepcopy
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
-import fontforge
-import fontUtil
-from fontSplitting import FONTSPLITTING
+if "FONTFORGE_TRACE" in os.environ:
+    # Trace the calls to fontforge. This must be done before fontUtil imports
+    # the fontforge module.
+    import fontforgeTrace
+    fontforgeTrace.install(os.environ["FONTFORGE_TRACE"])
 
-from lxml import etree
+import fontUtil
+from buildProfile import profiler, getMaxRSS
+from buildCache import fontBuildCache
+from sourceFontCache import sourceFontCache
+from fontSplitting import FONTSPLITTING, fontSplittingIndex
+
+def removeSpillDirectory(aDirectory, aPid):
+    # The worker processes are forked from the splitter, do not let them
+    # remove the directory of their parent.
+    if os.getpid() != aPid or not os.path.isdir(aDirectory):
+        return
+    for fileName in os.listdir(aDirectory):
+        fontUtil.removeTemporaryFile("%s/%s" % (aDirectory, fileName))
+    shutil.rmtree(aDirectory, True)
 
 def boolToString(b):
     if b:
@@ -47,6 +70,10 @@ def remapKeyValue(key, value):
     return s
 
 MODES = {0:"HTML-CSS", 1:"SVG"}
+
+# TeX delimiters that must have variants for \big, \Big, \bigg and \Bigg
+TEXDELIMITERS = (0x28, 0x29, 0x2F, 0x5B, 0x5C, 0x5D, 0x7B, 0x7D,
+                 0x2308, 0x2309, 0x230A, 0x230B, 0x23D0, 0x27E8, 0x27E9)
 HEADER='\
 /*************************************************************\n\
  *\n\
@@ -73,20 +100,67 @@ parser = argparse.ArgumentParser()
 parser.add_argument('fontfamily', type=str)
 parser.add_argument('fontdir', type=str)
 parser.add_argument('--skipMainFonts', action='store_true')
+parser.add_argument('--jobs', type=int, default=1,
+                    help='number of weights of the main fonts to split and of '
+                    'font files to generate in parallel')
+parser.add_argument('--spillMetrics', type=str, default=None,
+                    help='directory where the glyph metrics of the generated '
+                    'fonts are stored instead of being kept in memory')
+parser.add_argument('--cache', type=str, default=None,
+                    help='directory of the cache of the generated fonts')
+parser.add_argument('--cacheSize', type=int, default=2048,
+                    help='maximum size of the cache and of the glyph cache, in '
+                    'MB')
+parser.add_argument('--glyphCache', type=str, default=None,
+                    help='directory of the cache of the glyph data of the '
+                    'source fonts')
+parser.add_argument('--maxOpenFonts', type=int, default=0,
+                    help='maximum number of source fonts open at the same time '
+                    '(0 for no limit)')
+parser.add_argument('--lowMemory', action='store_true',
+                    help='bound the memory and temporary disk use: one source '
+                    'font open at a time besides the math font, no parallel '
+                    'generation and the glyph metrics stored on disk')
+parser.add_argument('--plan', type=str, default=None,
+                    help='only compute the split and write it as JSON in this '
+                    'file')
+parser.add_argument('--profile', type=str, default=None,
+                    help='write a JSON report of the time, memory and counters '
+                    'of each phase in this file')
+parser.add_argument('--profileStacks', type=str, default=None,
+                    help='also write the phases in the folded stack format of '
+                    'flamegraph.pl in this file')
 args = parser.parse_args()
+if args.profile is not None:
+    profiler.enable()
+    profiler.start("splitFont")
 FONTDIR = args.fontdir
 FONTFAMILY = args.fontfamily
+lowMemorySpillDirectory = None
+if args.lowMemory:
+    # The fonts generated in parallel are forked from the splitter, which
+    # would multiply its memory.
+    args.jobs = 1
+    if args.maxOpenFonts == 0:
+        args.maxOpenFonts = 1
+    if args.spillMetrics is None:
+        # Spill the metrics in the directory of the family rather than in
+        # TMPDIR, which is often in memory. The directory is removed when the
+        # script exits, even if the build fails.
+        lowMemorySpillDirectory = "%s/metrics.tmp" % FONTFAMILY
+        shutil.rmtree(lowMemorySpillDirectory, True)
+        args.spillMetrics = lowMemorySpillDirectory
+        atexit.register(removeSpillDirectory, lowMemorySpillDirectory,
+                        os.getpid())
 if (not os.path.exists("%s/config.py" % FONTFAMILY)):
     raise BaseException("%s/config.py does not exist!" % FONTFAMILY)
 
-# Create/clean up the ttf, otf and svg directories
+# Create the ttf, otf and svg directories. Their content is kept so that the
+# fonts that did not change since the previous build are not generated again.
 subprocess.call("mkdir -p %s/ttf %s/otf %s/svg"  %
                 (FONTFAMILY, FONTFAMILY, FONTFAMILY),
                 shell=True)
-if not(args.skipMainFonts):
-    subprocess.call("rm -f %s/ttf/* %s/otf/* %s/svg/*" %
-                    (FONTFAMILY, FONTFAMILY, FONTFAMILY),
-                    shell=True)
+fontUtil.setGenerationJobs(args.jobs)
 
 # Import the configuration for this font family
 sys.path.append("./%s" % FONTFAMILY)
@@ -100,93 +174,299 @@ if config.MAINFONTS is None:
 else:
     MATHONLY = False
 
+# Handles of the source fonts, shared by the splitter and the main fonts
+fontPool = fontUtil.fontPool(args.maxOpenFonts)
+
+# Glyph data of the source fonts, read without FontForge when they are cached
+if args.glyphCache is not None:
+    sourceFonts = sourceFontCache(args.glyphCache)
+else:
+    sourceFonts = None
+
 if config.FONTDATA["TeX_factor"] is None:
-    mainFont = fontforge.open("%s/%s" % (FONTDIR, config.MAINFONTS["Regular"]))
+    fileName = "%s/%s" % (FONTDIR, config.MAINFONTS["Regular"])
+    if sourceFonts is not None:
+        mainFont = sourceFonts.getFont(fileName)
+    else:
+        mainFont = fontPool.get(fileName)
     # 0x4D = M
     config.FONTDATA["TeX_factor"] = float(mainFont.em) / mainFont[0x4D].width
-    mainFont.close()
 if config.SMALLOPFONTS is None:
     config.SMALLOPFONTS = ""
 
 ################################################################################
 
-# Split the Math font
-splitter=fontUtil.mathFontSplitter(FONTFAMILY, FONTDIR, config)
-splitter.split()
-
-# Split the Main fonts
-if not(args.skipMainFonts):
+# Index of the font subsets, shared by the math and main font splitting
+splittingIndex = fontSplittingIndex(config.FONTSPLITTING_EXTRA)
 
-    for weight in config.MAINFONTS:
+# Split the Math font
+splitter=fontUtil.mathFontSplitter(FONTFAMILY, FONTDIR, config, splittingIndex,
+                                   sourceFonts, fontPool, args.plan is not None)
+if args.spillMetrics is not None:
+    subprocess.call("mkdir -p %s" % args.spillMetrics, shell=True)
+manifest = fontUtil.fontManifest(args.spillMetrics)
+cache = fontBuildCache(args.cache, FONTFAMILY, args.cacheSize)
+splitter.split(manifest, cache)
+profiler.start("wait for generation")
+fontUtil.waitForGeneration()
+profiler.stop()
+cache.store(manifest)
+
+def getSourceFont(aFileName):
+    # Font to read the glyph data from, without modifying it.
+    if sourceFonts is not None:
+        return sourceFonts.getFont(aFileName)
+    return fontPool.get(aFileName)
+
+def writePlan(aFileName):
+    # Write the split computed by the dry run of the splitter and by
+    # planMainFont as JSON. Code points are written as integers.
+    fonts = {}
+    PUA = {}
+
+    mathFont = getSourceFont(splitter.mMathFontFile)
+    for i in range(0, splitter.mMaxSize):
+        fonts[fontUtil.getFontName(config, "Size%d" % (i+1), "Regular")] = \
+            (mathFont, splitter.mSizeGlyphs[i])
+    PUA["Math"] = splitter.mPUAContent
+
+    removedGlyphs = {}
+    for weight in sorted(config.MAINFONTS):
         fontFile = "%s/%s" % (FONTDIR, config.MAINFONTS[weight])
-        oldfont=fontforge.open(fontFile)
-        oldfont.encoding = "UnicodeFull"
-
+        if (config.FONTSPLITTING_REMOVE is not None and
+            weight in config.FONTSPLITTING_REMOVE):
+            remove = config.FONTSPLITTING_REMOVE[weight]
+        else:
+            remove = None
+        font = getSourceFont(fontFile)
+        plan, removed, nonUnicode = \
+            fontUtil.planMainFont(font, splittingIndex, remove,
+                                  splitter.mMovedNonUnicodeGlyphs)
         for subset in FONTSPLITTING:
             name = subset[0]
-            font=fontUtil.newFont(FONTFAMILY, fontFile, config, name, weight)
-            fontUtil.moveSubset(oldfont, font, subset)
-
-            if config.FONTSPLITTING_EXTRA is not None and name in config.FONTSPLITTING_EXTRA:
-                # move additional glyphs
-                fontUtil.moveSubset(oldfont, font,
-                                    config.FONTSPLITTING_EXTRA[name])
-
-            if name == "Monospace" and "u1D670" in font:
-                # For the monospace font, ensure that the space has the
-                # same width as the other characters. See MathJax's issue 380.
-                font[0x20].width = font["u1D670"].width
-                font.selection.select(0x20)
-                font.copy()
-                font.selection.select(0xA0)
-                font.paste()
-
-            if config.FONTSPLITTING_REMOVE is not None and weight in config.FONTSPLITTING_REMOVE:
-                # remove some duplicate glyphs
-                fontUtil.removeSubset(font,
-                                      config.FONTSPLITTING_REMOVE[weight])
-
-            fontUtil.saveFont(FONTFAMILY, font)
-            font.close()
-
-        # Save the rest of the glyphs in a NonUnicode font
-        font=fontUtil.newFont(FONTFAMILY, fontFile, config, "NonUnicode", weight)
-        PUAPointer = 0xE000
-        for g in oldfont.glyphs():
-
-            v = g.unicode
-
-            if (g.glyphname == ".notdef" or
-                not(v == -1 or
-                    (0xF0000 <= v and v <= 0xFFFFD) or
-                    (0x100000 <= v and v <= 0x10FFFD))):
-                # Ignore Plane 0 PUA, .notdef and Unicode glyphs
-                continue
-
-            if g.glyphname in splitter.mMovedNonUnicodeGlyphs:
-                # This was already copied into SizeN.
-                continue
-
-            while (PUAPointer <= 0xF8FF and
-                   fontUtil.hasNonEmptyGlyph(oldfont, PUAPointer)):
-                # Move to the next empty glyph
-                PUAPointer += 1
-
-            if PUAPointer > 0xF8FF:
-                raise BaseException("Too many characters in the Plane 0 PUA. Not supported by the font splitter.")
-
-            fontUtil.moveGlyph(oldfont, font, g.glyphname, PUAPointer)
-            PUAPointer += 1
-
-        fontUtil.saveFont(FONTFAMILY, font)
+            fonts[fontUtil.getFontName(config, name, weight)] = \
+                (font, plan[name])
+        fonts[fontUtil.getFontName(config, "NonUnicode", weight)] = \
+            (font, nonUnicode)
+        PUA[weight] = dict(nonUnicode)
+        removedGlyphs[weight] = removed
+
+    data = {"family": FONTFAMILY, "fonts": {}, "removed": removedGlyphs,
+            "PUA": PUA, "stretchy": {}}
+    for fontName in fonts:
+        font, glyphs = fonts[fontName]
+        if len(glyphs) == 0:
+            continue
+        data["fonts"][fontName] = {
+            "glyphs": glyphs,
+            "glyphCount": len(glyphs),
+            "outlineBytes":
+                fontUtil.estimateOutlineSize(font, [g[0] for g in glyphs])
+        }
+
+    # Size variants and components of the stretchy operators
+    splitter.verifyTeXSizeVariants(config.FONTDATA["TeX_factor"],
+                                   TEXDELIMITERS)
+    for codePoint in splitter.mStretchyOperators:
+        operator = splitter.mStretchyOperators[codePoint]
+        item = {"dir": "H" if operator.mIsHorizontal else "V"}
+        if operator.mAlias is not None:
+            item["alias"] = operator.mAlias
+        if operator.mSizeVariants is not None:
+            item["variants"] = operator.mSizeVariants
+        if operator.mComponents is not None:
+            item["components"] = operator.mComponents
+        data["stretchy"]["0x%04X" % codePoint] = item
+
+    # The DELIMITERS tables as written in fontdata.js and fontdata-extra.js
+    stream = StringIO()
+    splitter.printDelimiters(stream, MODES[0], 0)
+    data["delimiters"] = stream.getvalue()
+    stream = StringIO()
+    splitter.printDelimiters(stream, MODES[0], 0, True)
+    data["delimitersExtra"] = stream.getvalue()
+
+    f = open(aFileName, "w")
+    json.dump(data, f, indent=1, sort_keys=True)
+    f.write("\n")
+    f.close()
+
+if args.plan is not None:
+    writePlan(args.plan)
+    fontPool.close()
+    if sourceFonts is not None:
+        sourceFonts.close()
+    sys.exit(0)
+
+def splitMainFont(aWeight, aManifest, aCache):
+    # Split the main font of the given weight into the FONTSPLITTING subsets.
+    # Each call opens its own fontforge handles and only writes the files of
+    # its own weight, so that several weights can be split concurrently.
+    fontFile = "%s/%s" % (FONTDIR, config.MAINFONTS[aWeight])
+    if (config.FONTSPLITTING_REMOVE is not None and
+        aWeight in config.FONTSPLITTING_REMOVE):
+        remove = config.FONTSPLITTING_REMOVE[aWeight]
+    else:
+        remove = None
+
+    # Keys of the fonts of this weight in the build cache. The glyphs of a
+    # subset only depend on the subsets that precede it in FONTSPLITTING.
+    keys = {}
+    if aCache.isEnabled():
+        inputs = [aCache.getFileHash(fontFile), aWeight,
+                  config.FONTNAME_PREFIX, config.FONTFAMILY_PREFIX,
+                  config.FONTSPLITTING_EXTRA, remove]
+        for i in range(0, len(FONTSPLITTING)):
+            name = FONTSPLITTING[i][0]
+            keys[name] = aCache.getKey(inputs + [name, FONTSPLITTING[:i+1]])
+        keys["NonUnicode"] = \
+            aCache.getKey(inputs + ["NonUnicode", FONTSPLITTING,
+                                    sorted(splitter.mMovedNonUnicodeGlyphs)])
+
+        cached = True
+        for name in keys:
+            cached = cached and aCache.contains(keys[name])
+        if cached:
+            # Nothing to generate, do not even open the font.
+            for name in keys:
+                aCache.restore(keys[name],
+                               fontUtil.getFontName(config, name, aWeight),
+                               aManifest)
+            return
+
+    # The glyphs are moved out of the font, so take it out of the pool.
+    oldfont=fontPool.take(fontFile)
+    oldfont.encoding = "UnicodeFull"
+
+    profiler.start("subsets")
+
+    # Determine the subset of each glyph in a single pass over the font.
+    plan, removed = fontUtil.planSubsets(oldfont, splittingIndex, remove)
+
+    for subset in FONTSPLITTING:
+        name = subset[0]
+        fontName = fontUtil.getFontName(config, name, aWeight)
+        if aCache.restore(keys.get(name), fontName, aManifest):
+            # Remove the glyphs of the subset as if they had been moved.
+            fontUtil.clearGlyphs(oldfont, plan[name])
+            continue
+
+        font=fontUtil.newFont(FONTFAMILY, fontFile, config, name, aWeight)
+        fontUtil.moveGlyphs(oldfont, font, plan[name])
+
+        if name == "Monospace" and "u1D670" in font:
+            # For the monospace font, ensure that the space has the
+            # same width as the other characters. See MathJax's issue 380.
+            font[0x20].width = font["u1D670"].width
+            font.selection.select(0x20)
+            font.copy()
+            font.selection.select(0xA0)
+            font.paste()
+
+        fontUtil.saveFont(FONTFAMILY, font, aManifest)
+        aCache.add(keys.get(name), fontName)
         font.close()
+
+    if len(removed) > 0:
+        # remove some duplicate glyphs
+        oldfont.selection.none()
+        for glyphname in removed:
+            oldfont.selection.select(("more", None), glyphname)
+        oldfont.clear()
+
+    profiler.stop()
+
+    # Save the rest of the glyphs in a NonUnicode font
+    fontName = fontUtil.getFontName(config, "NonUnicode", aWeight)
+    if aCache.restore(keys.get("NonUnicode"), fontName, aManifest):
         oldfont.close()
+        return
+
+    profiler.start("NonUnicode")
+
+    font=fontUtil.newFont(FONTFAMILY, fontFile, config, "NonUnicode", aWeight)
+    glyphs, PUA = fontUtil.planNonUnicode(oldfont,
+                                          splitter.mMovedNonUnicodeGlyphs)
+    PUA.report(fontName)
+    fontUtil.moveGlyphs(oldfont, font, glyphs)
+
+    fontUtil.saveFont(FONTFAMILY, font, aManifest)
+    aCache.add(keys.get("NonUnicode"), fontName)
+    font.close()
+    oldfont.close()
+    profiler.stop()
+
+def splitMainFontWorker(aWeight):
+    # Return the metrics of the fonts generated by the worker, their keys in
+    # the build cache and the profile of the worker, to be merged into those
+    # of the parent process.
+    #
+    # multiprocessing only forwards Exception instances to the parent process
+    # (anything else kills the worker and hangs the pool) so convert the
+    # BaseException raised by the splitter.
+    try:
+        fontUtil.setGenerationJobs(max(1, args.jobs // len(config.MAINFONTS)))
+        weightManifest = fontUtil.fontManifest(manifest.mSpillDirectory)
+        profiler.reset()
+        profiler.start(aWeight)
+        splitMainFont(aWeight, weightManifest, cache)
+        profiler.start("wait for generation")
+        fontUtil.waitForGeneration()
+        profiler.stop()
+        cache.store(weightManifest)
+        profiler.stop()
+        return weightManifest.mFonts, cache.mKeys, profiler.getData()
+    except Exception:
+        raise
+    except BaseException as e:
+        raise Exception("%s: %s" % (aWeight, e))
+
+# Split the Main fonts
+if not(args.skipMainFonts):
+    profiler.start("main fonts")
+
+    if args.jobs > 1 and len(config.MAINFONTS) > 1:
+        # Split each weight in its own worker process. The workers are forked
+        # after the math font has been split, so they inherit the splitter.
+        pool = multiprocessing.Pool(min(args.jobs, len(config.MAINFONTS)))
+        try:
+            for fonts, keys, profile in pool.map(splitMainFontWorker,
+                                                 sorted(config.MAINFONTS)):
+                manifest.update(fonts)
+                cache.mKeys.update(keys)
+                profiler.merge(profile)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for weight in config.MAINFONTS:
+            profiler.start(weight)
+            splitMainFont(weight, manifest, cache)
+            profiler.stop()
+        profiler.start("wait for generation")
+        fontUtil.waitForGeneration()
+        profiler.stop()
+        cache.store(manifest)
+    profiler.stop()
+
+fontUtil.clearFontCache()
+fontPool.close()
+if sourceFonts is not None:
+    sourceFonts.close()
+
+if not(args.skipMainFonts):
+    # Remove the files of the previous build that were not generated again
+    for directory in ["otf", "ttf", "svg"]:
+        for fileName in os.listdir("%s/%s" % (FONTFAMILY, directory)):
+            if os.path.splitext(fileName)[0] not in manifest:
+                os.remove("%s/%s/%s" % (FONTFAMILY, directory, fileName))
 
 # Remove temporary files
 subprocess.call("rm -f %s/otf/*.tmp" % FONTFAMILY, shell=True)
 
 ###############################################################################
 
+profiler.start("fontdata.js")
 fontData = {}
 for m in MODES:
     # Create the fontdata.js file
@@ -215,8 +495,12 @@ for m in MODES:
           file=fontData[m])
 
 # Determine the list of fonts
-fontList = commands.getoutput('ls %s/otf' % FONTFAMILY).\
-    replace(".otf","").split("\n")
+if args.skipMainFonts:
+    # Read the metrics of the main fonts generated by a previous run.
+    for fileName in os.listdir("%s/otf" % FONTFAMILY):
+        if fileName.endswith(".otf") and fileName[:-4] not in manifest:
+            manifest.addFromFiles(FONTFAMILY, fileName[:-4])
+fontList = manifest.getFontNames()
 fontVarList = []
 fontVarValue = []
 
@@ -609,9 +893,7 @@ for m in MODES:
 
 # Print DELIMITERS
 splitter.verifyTeXSizeVariants(config.FONTDATA["TeX_factor"],
-                               (0x28, 0x29, 0x2F, 0x5B, 0x5C, 0x5D, 0x7B, 0x7D,
-                                0x2308, 0x2309, 0x230A, 0x230B, 0x23D0, 0x27E8,
-                                0x27E9))
+                               TEXDELIMITERS)
 # Print the delimiters list
 for m in MODES:
     print("      DELIMITERS: {", file=fontData[m])
@@ -683,30 +965,34 @@ for m in MODES:
 
 fontData[m].close()
 
+profiler.stop()
+
 # Creating the font metrics data
+profiler.start("Main.js")
+jsFile = "Main"
+mainKey = cache.getKey([FONTFAMILY, config.FONTDATA["Year"]])
 for i in range(0,len(fontList)):
 
     fileName = fontList[i]
-    print("Generating metrics for %s..." % fileName)
     x = fileName.split("_")[1].split("-")
     fontName = x[0]
     fontStyle = x[1]
 
-    jsFile = "Main"
+    # Restore the Main.js files from the build cache if the font was there.
+    restored = True
     for m in MODES:
         directory = ("%s/%s/%s/%s/" %
                         (FONTFAMILY, MODES[m], fontName, fontStyle))
         subprocess.call("mkdir -p %s" % directory, shell=True)
+        restored = (cache.restoreFile(fileName,
+                                      "%s-%s.js" % (MODES[m], mainKey),
+                                      "%s/%s.js" % (directory, jsFile)) and
+                    restored)
+    if restored:
+        continue
 
-        fontData[m] = open("%s/%s.js" % (directory, jsFile), "w")
-
-        print(HEADER %
-              ("%s/fonts/%s/%s/%s/%s.js" % (MODES[m],
-                                      FONTFAMILY, fontName, fontStyle, jsFile),
-               "", config.FONTDATA["Year"]), file=fontData[m])
-
-    font = fontforge.open("%s/otf/%s.otf" % (FONTFAMILY, fileName))
-    SVGdoc = etree.parse("%s/svg/%s.svg" % (FONTFAMILY, fileName)).getroot()
+    print("Generating metrics for %s..." % fileName)
+    metrics = manifest.getMetrics(fileName)
 
     if fontStyle == "Bold":
         fontName2 = fontName + "-bold"
@@ -717,27 +1003,34 @@ for i in range(0,len(fontList)):
     else:
         fontName2 = fontName
 
-    # Header
+    data = {}
     for m in MODES:
-        print("MathJax.OutputJax['%s'].FONTDATA.FONTS['%s_%s'] = {" %
-              (MODES[m], config.FONTNAME_PREFIX, fontName2), file=fontData[m])
-        print("  directory: '%s/%s'," % (fontName, fontStyle),
-              file=fontData[m])
-        print("  family: '%s_%s'," % (config.FONTNAME_PREFIX, fontName),
-              file=fontData[m])
+        data[m] = []
+        data[m].append(HEADER %
+                       ("%s/fonts/%s/%s/%s/%s.js" %
+                        (MODES[m], FONTFAMILY, fontName, fontStyle, jsFile),
+                        "", config.FONTDATA["Year"]))
+        data[m].append("\n")
+
+        # Header
+        data[m].append("MathJax.OutputJax['%s'].FONTDATA.FONTS['%s_%s'] = {\n" %
+                       (MODES[m], config.FONTNAME_PREFIX, fontName2))
+        data[m].append("  directory: '%s/%s',\n" % (fontName, fontStyle))
+        data[m].append("  family: '%s_%s',\n" % (config.FONTNAME_PREFIX,
+                                                 fontName))
 
         if fontStyle == "Bold" or fontStyle == "BoldItalic":
-            print("  weight: 'bold',", file=fontData[m])
+            data[m].append("  weight: 'bold',\n")
     
         if fontStyle == "Italic" or fontStyle == "BoldItalic":
-            print("  style: 'italic',", file=fontData[m])
+            data[m].append("  style: 'italic',\n")
 
         # TODO?
-        # print("  skew: {},\n", file=fontData[m])
+        # data[m].append("  skew: {},\n")
 
     # HTML-CSS: add a test string
-    print("  testString: '%s'" % fontUtil.getTestString(font, 15),
-          file=fontData[0], end="")
+    data[0].append("  testString: '%s'" %
+                   fontUtil.makeTestString([g.mUnicode for g in metrics], 15))
 
     # SVG: add an id
     SVGid = (FONTFAMILY + fontName).replace("-","").upper();
@@ -745,71 +1038,62 @@ for i in range(0,len(fontList)):
         SVGid += "B"
     if fontStyle == "Italic" or fontStyle == "BoldItalic":
         SVGid += "I"
-    print("  id: '%s'" % SVGid,  file=fontData[1], end="")
+    data[1].append("  id: '%s'" % SVGid)
 
     # print the metrics
-    for glyph in font.glyphs():
-
-        if glyph.glyphname in [".notdef", ".null", "nonmarkingreturn"]:
-            continue
-        
-        v = glyph.unicode
-
-        if (v == -1 or (0xEFFD <= v and v <= 0xEFFF)):
-            # Ignore non-Unicode and PUA glyphs
-            continue
-
+    for glyph in metrics:
         # Glyph metrics
-        for m in MODES:
-            print(",", file=fontData[m])
-            b = glyph.boundingBox() # (xmin, ymin, xmax, ymax)
-            print("  0x%X: [%d,%d,%d,%d,%d" % (v, 
-                                               b[3],
-                                               -b[1],
-                                               glyph.width,
-                                               glyph.left_side_bearing,
-                                               glyph.width -
-                                               glyph.right_side_bearing),
-                  file=fontData[m], end="")
+        s = ",\n  0x%X: [%d,%d,%d,%d,%d" % (glyph.mUnicode,
+                                            glyph.mHeight,
+                                            glyph.mDepth,
+                                            glyph.mWidth,
+                                            glyph.mLeft,
+                                            glyph.mRight)
+        data[0].append(s)
+        data[0].append("]")
 
         # For SVG, we add the path description too.
-        # No need for namespaces={'s': 'http://www.w3.org/2000/svg'},
-        # as Font Forge does not attach any xmlns namespace to the <svg> root
-        glyphNode = SVGdoc.\
-            xpath('/svg/defs/font/glyph[@glyph-name="%s"]' % glyph.glyphname)
-        if len(glyphNode) == 0:
-            print(glyph.glyphname)
-            raise BaseException("Unable to find the glyph")
-        else:
-            glyphNode = glyphNode[0]
-        
-        if "d" in glyphNode.attrib:
-            path = glyphNode.attrib["d"]
-            path = re.match(r"^M(.*)Z", path, flags=re.IGNORECASE).group(1)
-        else:
-            path = ""
-        print(",'%s'" % path, file=fontData[1], end="")
-
-        for m in MODES:
-            print("]", file=fontData[m], end="")
+        data[1].append(s)
+        data[1].append(",'%s']" % glyph.mPath)
 
     for m in MODES:
-        print('', file=fontData[m])
-        print('};', file=fontData[m])
+        data[m].append('\n};\n')
 
     # print footer
-    print('\
+    data[0].append('\
 \n\
 MathJax.Callback.Queue(\n\
   ["initFont",MathJax.OutputJax["%s"],"%s_%s"],\n\
   ["loadComplete",MathJax.Ajax,MathJax.OutputJax["%s"].fontDir+"/%s/%s/%s.js"]\n\
-);' % (MODES[0], config.FONTNAME_PREFIX, fontName2,
-       MODES[0], fontName, fontStyle, jsFile), file=fontData[0])
+);\n' % (MODES[0], config.FONTNAME_PREFIX, fontName2,
+       MODES[0], fontName, fontStyle, jsFile))
 
-    print('\
+    data[1].append('\
 \n\
-MathJax.Ajax.loadComplete(MathJax.OutputJax.%s.fontDir+"/%s/%s/%s.js");'
-              % (MODES[1], fontName, fontStyle, jsFile), file=fontData[1])
+MathJax.Ajax.loadComplete(MathJax.OutputJax.%s.fontDir+"/%s/%s/%s.js");\n'
+                   % (MODES[1], fontName, fontStyle, jsFile))
 
-    font.close()
-    fontData[m].close()
+    # Write each file at once
+    for m in MODES:
+        directory = ("%s/%s/%s/%s/" %
+                        (FONTFAMILY, MODES[m], fontName, fontStyle))
+
+        fontData[m] = open("%s/%s.js" % (directory, jsFile), "w")
+        fontData[m].write("".join(data[m]))
+        fontData[m].close()
+        profiler.count("bytes written (Main.js)",
+                       os.path.getsize("%s/%s.js" % (directory, jsFile)))
+        cache.storeFile(fileName, "%s-%s.js" % (MODES[m], mainKey),
+                        "%s/%s.js" % (directory, jsFile))
+
+profiler.stop()
+
+cache.evict(args.glyphCache)
+
+if args.lowMemory:
+    print("Peak memory: %d MB, peak temporary disk use: %d MB" %
+          (getMaxRSS() // 1024, fontUtil.getPeakTemporaryDiskUse() >> 20))
+
+if args.profile is not None:
+    profiler.stop()
+    profiler.write(args.profile, args.profileStacks)